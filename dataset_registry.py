@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLaMA-Factory dataset_info.json 注册表
+原来每个提取脚本各自 读 -> 改 -> 整份重写 dataset_info.json，再写 latest_dataset_key.tmp：
+多个提取任务或训练启动脚本同时操作时会丢失写入，读端也可能读到写了一半的文件。这里统一为:
+  - 修改 dataset_info.json 时持有 <info>.lock 文件锁（读-改-写整体互斥）
+  - 先写同目录临时文件并 fsync，再 os.replace 原子替换，读端只会看到完整的旧版或新版
+  - 每次注册追加一行到 <info>.history.jsonl（只追加，不改写），记录 key / 文件 / 时间
+  - 最新 key 另存一个小指针文件（同样原子替换），latest_key() 只读这个文件，
+    不存在时从 history 末尾倒读一行，都不需要解析整个 dataset_info.json
+
+用法:
+  python dataset_registry.py latest  [--info dataset_info.json]     # 打印最新 key，供 bash 使用
+  python dataset_registry.py history [--info dataset_info.json]
+  python dataset_registry.py register KEY FILE [--info ...] [--formatting sharegpt]
+"""
+
+import json
+import os
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+
+DEFAULT_INFO_PATH = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/frameworks/LLaMA-Factory/data/dataset_info.json"
+SHAREGPT_COLUMNS = {"messages": "conversations", "system": "system"}
+
+
+@contextmanager
+def file_lock(lock_path):
+    """独占文件锁（Linux 用 fcntl.flock，Windows 退回 msvcrt.locking）"""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(lock_path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_text(path, text):
+    """写临时文件 + fsync + os.replace，读端不会看到半截内容"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        # 立即交给文件对象，之后任何一步出错都会关闭描述符
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            # mkstemp 建的是 0600，沿用原文件权限，避免训练进程换了用户后读不到
+            try:
+                mode = os.stat(path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            if hasattr(os, 'fchmod'):
+                os.fchmod(f.fileno(), mode)
+            else:
+                os.chmod(tmp_path, mode)  # Windows 没有 fchmod
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_last_line(path, block=4096):
+    """从文件末尾倒读最后一个非空行，不读整份文件"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b''
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            lines = data.rstrip(b'\n').split(b'\n')
+            if len(lines) > 1 or start == 0:
+                return lines[-1].decode('utf-8') if lines[-1].strip() else None
+    return None
+
+
+class DatasetRegistry:
+    """带锁、原子更新、追加历史的 dataset_info.json 注册表
+
+    latest_path: 最新 key 指针文件（默认 <info>.latest）；旧脚本读取的 latest_dataset_key.tmp
+    也可以直接作为 latest_path 传入。
+    """
+
+    def __init__(self, info_path=DEFAULT_INFO_PATH, history_path=None, latest_path=None):
+        self.info_path = str(info_path)
+        self.lock_path = self.info_path + '.lock'
+        self.history_path = str(history_path or self.info_path + '.history.jsonl')
+        self.latest_path = str(latest_path or self.info_path + '.latest')
+
+    def load(self):
+        """读取当前 dataset_info.json（文件不存在时为空）"""
+        try:
+            with open(self.info_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def register_many(self, entries, latest=None):
+        """一次加锁注册多个 key: {key: dataset_info 条目}；latest 为要设为最新的 key（默认最后一个）"""
+        if not entries:
+            return None
+        latest = latest or list(entries)[-1]
+        with file_lock(self.lock_path):
+            info = self.load()
+            info.update(entries)
+            atomic_write_text(self.info_path, json.dumps(info, ensure_ascii=False, indent=2))
+
+            now = time.strftime('%Y-%m-%d %H:%M:%S')
+            lines = ''.join(
+                json.dumps({"key": key, "file_name": entry.get("file_name"), "registered_at": now,
+                            "host": socket.gethostname(), "pid": os.getpid(), "latest": key == latest},
+                           ensure_ascii=False) + '\n'
+                # 最新的 key 写在最后，history 末行即最新（latest_key 的回退依据）
+                for key, entry in sorted(entries.items(), key=lambda item: item[0] == latest)
+            )
+            # O_APPEND 单次写入，配合锁保证历史只追加、不交错
+            fd = os.open(self.history_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, lines.encode('utf-8'))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            atomic_write_text(self.latest_path, latest)
+        return latest
+
+    def register(self, key, file_name, formatting="sharegpt", columns=None, **extra):
+        """注册单个数据集并设为最新"""
+        entry = {"file_name": file_name, "formatting": formatting,
+                 "columns": dict(columns or SHAREGPT_COLUMNS), **extra}
+        return self.register_many({key: entry}, latest=key)
+
+    def latest_key(self):
+        """最新注册的 key；只读指针文件或 history 的最后一行，不解析 dataset_info.json"""
+        try:
+            with open(self.latest_path, 'r', encoding='utf-8') as f:
+                key = f.read().strip()
+            if key:
+                return key
+        except FileNotFoundError:
+            pass
+        try:
+            line = _read_last_line(self.history_path)
+        except FileNotFoundError:
+            return None
+        return json.loads(line)["key"] if line else None
+
+    def history(self):
+        """按注册顺序产出历史记录"""
+        from jsonl_io import iter_jsonl
+
+        if not os.path.exists(self.history_path):
+            return iter(())
+        return iter_jsonl(self.history_path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='LLaMA-Factory dataset_info.json 注册表')
+    parser.add_argument('command', choices=['latest', 'history', 'register'])
+    parser.add_argument('key', nargs='?')
+    parser.add_argument('file_name', nargs='?')
+    parser.add_argument('--info', default=DEFAULT_INFO_PATH, help='dataset_info.json 路径')
+    parser.add_argument('--latest-path', default=None, help='最新 key 指针文件 (默认 <info>.latest)')
+    parser.add_argument('--formatting', default='sharegpt')
+    args = parser.parse_args()
+
+    registry = DatasetRegistry(args.info, latest_path=args.latest_path)
+    if args.command == 'latest':
+        key = registry.latest_key()
+        if key is None:
+            raise SystemExit('尚无注册记录')
+        print(key)
+    elif args.command == 'history':
+        for record in registry.history():
+            print(f"{record['registered_at']}  {record['key']:<40} {record.get('file_name')}")
+    else:
+        if not (args.key and args.file_name):
+            parser.error('register 需要 KEY 和 FILE')
+        registry.register(args.key, args.file_name, args.formatting)
+        print(f"Key registered: {args.key}")
@@ -9,8 +9,17 @@ import json
 import re
 import csv
 import os
+import time
+import heapq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from scenario_cache import ScenarioCache
+
+# 提取逻辑（正则、窗口大小、输出字段）变化时递增，旧缓存自动失效
+EXTRACTOR_VERSION = 1
+
 def extract_voice_text_pairs(json_file):
     """从单个 JSON 文件中提取语音-文本对"""
     pairs = []
@@ -151,21 +160,236 @@ def extract_with_regex(json_file):
     
     return pairs
 
+# === 单遍流式提取 ===
+# extract_with_regex 对每个 voice 都切出前后约 2.5 KB 的窗口再跑三遍正则，
+# 相同的字节被反复扫描。这里对整个文件只扫一遍：三类记号按出现位置归并成
+# 一条记号流，最近的台词 / 角色名作为状态保存在小队列里，
+# 等扫描越过某个 voice 的窗口右边界后立即产出该条记录。
+
+VOICE_RE = re.compile(r'"voice":\s*"([A-Z]{3}_b\d+_\d+[a-z]?)"')
+JA_LINE_RE = re.compile(r'「([^」]+)」')
+KANA_QUOTED_RE = re.compile(r'"([^"]*[ぁ-んァ-ン][^"]*)"')
+SPEAKER_RE = re.compile(r'\["([^"]+)",\s*"([^"]+)"')
+
+# 与 extract_with_regex 的上下文窗口保持一致
+CONTEXT_BEFORE = 2000
+CONTEXT_AFTER = 500
+
+
+def _iter_tokens(content):
+    """按出现位置惰性归并 voice / 台词 / 角色名三类记号"""
+    return heapq.merge(
+        ((m.start(), m.end(), 'voice', m.group(1)) for m in VOICE_RE.finditer(content)),
+        ((m.start(), m.end(), 'line', m.group(0)) for m in JA_LINE_RE.finditer(content)),
+        ((m.start(), m.end(), 'speaker', m.group(1)) for m in SPEAKER_RE.finditer(content)),
+    )
+
+
+def iter_voice_text_records(content):
+    """单遍扫描剧本内容，逐条产出 {'voice', 'speaker', 'text_ja'}"""
+    size = len(content)
+    lines = deque()     # (start, end, text)，只保留可能落在后续窗口内的台词
+    speakers = deque()  # (start, end, name)
+    pending = deque()   # (voice, window_start, window_end)，等待窗口右侧的记号
+
+    def resolve(voice_id, win_start, win_end):
+        while lines and lines[0][1] <= win_start:
+            lines.popleft()
+        while speakers and speakers[0][0] < win_start:
+            speakers.popleft()
+
+        text_ja = ''
+        for start, end, line in reversed(lines):
+            if end > win_end:
+                continue
+            if start >= win_start:
+                text_ja = line
+            else:
+                # 窗口左边界切进了这句台词：按窗口内的内容重新匹配，与原实现一致
+                match = JA_LINE_RE.search(content, win_start, end)
+                text_ja = match.group(0) if match else ''
+            break
+        if not text_ja:
+            # 罕见分支：窗口内没有「」台词，退回原实现的带引号假名匹配
+            quoted = KANA_QUOTED_RE.findall(content, win_start, win_end)
+            text_ja = quoted[-1] if quoted else ''
+
+        speaker = ''
+        for start, end, name in reversed(speakers):
+            if end <= win_end:
+                speaker = name
+                break
+
+        if text_ja:
+            return {'voice': voice_id, 'speaker': speaker, 'text_ja': text_ja}
+        return None
+
+    for start, end, kind, value in _iter_tokens(content):
+        while pending and pending[0][2] <= start:
+            record = resolve(*pending.popleft())
+            if record:
+                yield record
+
+        if kind == 'voice':
+            pending.append((value, max(0, start - CONTEXT_BEFORE), min(size, end + CONTEXT_AFTER)))
+        elif kind == 'line':
+            lines.append((start, end, value))
+        else:
+            speakers.append((start, end, value))
+
+    while pending:
+        record = resolve(*pending.popleft())
+        if record:
+            yield record
+
+
+def iter_voice_text_pairs(json_file):
+    """单遍流式提取语音-文本对（结果与 extract_with_regex 一致）"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    yield from iter_voice_text_records(content)
+
+
+def _list_json_files(input_dir):
+    """列出待处理的剧本 JSON（排除 .resx.json）"""
+    json_files = sorted(Path(input_dir).glob('*.json'))
+    return [f for f in json_files if not f.name.endswith('.resx.json')]
+
 
-def process_all_json_files(input_dir, output_csv):
-    """处理所有 JSON 文件并输出 CSV"""
+def benchmark_extractors(input_dir, repeat=3):
+    """对比窗口重扫与单遍流式两种提取方式的耗时，并校验输出一致"""
+    json_files = [str(f) for f in _list_json_files(input_dir)]
+    print(f"基准测试: {len(json_files)} 个 JSON 文件, 重复 {repeat} 次")
+
+    extractors = [
+        ('window-rescan', extract_with_regex),
+        ('streaming', lambda path: list(iter_voice_text_pairs(path))),
+    ]
+    timings = {}
+    for name, extractor in extractors:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            records = sum(len(extractor(path)) for path in json_files)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print(f"  {name:<14} {best:.3f}s  ({records} 条记录)")
+
+    mismatched = [
+        Path(path).name for path in json_files
+        if extract_with_regex(path) != list(iter_voice_text_pairs(path))
+    ]
+    if timings['streaming'] > 0:
+        print(f"  加速比: {timings['window-rescan'] / timings['streaming']:.2f}x")
+    if mismatched:
+        print(f"  ⚠️ 结果不一致的文件: {', '.join(mismatched)}")
+    else:
+        print("  ✓ 两种方式输出完全一致")
+
+    return timings, mismatched
+
+
+def _extract_file_timed(json_file):
+    """提取单个文件并记录耗时（也作为进程池 worker）"""
+    start = time.perf_counter()
+    pairs = list(iter_voice_text_pairs(json_file))
+    return pairs, time.perf_counter() - start, os.getpid()
+
+
+def _iter_extracted(json_files, jobs=1, cache=None):
+    """按文件列表顺序逐个产出 (文件, 记录, 耗时, pid)
+
+    命中缓存的文件直接返回缓存记录（耗时 0，pid 为 None）。
+    jobs > 1 时未命中的文件分发到进程池：大文件优先提交以均衡负载，
+    但结果仍按原顺序取回，保证合并结果与串行一致。
+    """
+    cached = {}
+    if cache is not None:
+        for json_file in json_files:
+            records = cache.get(str(json_file))
+            if records is not None:
+                cached[json_file] = records
+    todo = [f for f in json_files if f not in cached]
+    
+    executor = None
+    futures = {}
+    if jobs > 1 and todo:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        for json_file in sorted(todo, key=lambda f: f.stat().st_size, reverse=True):
+            futures[json_file] = executor.submit(_extract_file_timed, str(json_file))
+    
+    try:
+        for json_file in json_files:
+            if json_file in cached:
+                yield json_file, cached[json_file], 0.0, None
+                continue
+            if json_file in futures:
+                result = futures[json_file].result()
+            else:
+                result = _extract_file_timed(str(json_file))
+            if cache is not None:
+                cache.put(str(json_file), result[0])
+            yield (json_file, *result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _print_timing_summary(file_timings):
+    """打印每个 worker 的耗时以及最慢的剧本文件"""
+    file_timings = [t for t in file_timings if t[2] is not None]
+    if not file_timings:
+        return
+    
+    workers = {}
+    for name, elapsed, pid in file_timings:
+        files, total = workers.get(pid, (0, 0.0))
+        workers[pid] = (files + 1, total + elapsed)
+    
+    print("\n⏱️ Worker 耗时:")
+    for pid, (files, total) in sorted(workers.items(), key=lambda x: -x[1][1]):
+        print(f"  pid {pid}: {files} 个文件, {total:.2f}s")
+    
+    print("最慢的剧本文件 (前5):")
+    for name, elapsed, pid in sorted(file_timings, key=lambda x: -x[1])[:5]:
+        print(f"  {name}: {elapsed:.2f}s (pid {pid})")
+
+
+def default_cache_path(output_csv):
+    """缓存旁路文件默认放在输出 CSV 同目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(output_csv)), '.extract_cache.sqlite')
+
+
+def process_all_json_files(input_dir, output_csv, jobs=1, cache_path=None):
+    """处理所有 JSON 文件并输出 CSV
+
+    jobs > 1 时多进程并行提取；给定 cache_path 时只重新解析内容有变化的文件。
+    """
     all_pairs = []
+    file_timings = []
     
-    json_files = sorted(Path(input_dir).glob('*.json'))
-    json_files = [f for f in json_files if not f.name.endswith('.resx.json')]
+    json_files = _list_json_files(input_dir)
     
     print(f"找到 {len(json_files)} 个 JSON 文件")
     
-    for json_file in json_files:
-        print(f"处理: {json_file.name}")
-        pairs = extract_with_regex(str(json_file))
-        print(f"  提取到 {len(pairs)} 条记录")
-        all_pairs.extend(pairs)
+    cache = ScenarioCache(cache_path, 'extract_dialogue', EXTRACTOR_VERSION) if cache_path else None
+    wall_start = time.perf_counter()
+    try:
+        for json_file, pairs, elapsed, pid in _iter_extracted(json_files, jobs, cache):
+            source = '缓存' if pid is None else f'{elapsed:.2f}s'
+            print(f"处理: {json_file.name}")
+            print(f"  提取到 {len(pairs)} 条记录 ({source})")
+            all_pairs.extend(pairs)
+            file_timings.append((json_file.name, elapsed, pid))
+    finally:
+        if cache is not None:
+            cache.close()
+    
+    _print_timing_summary(file_timings)
+    print(f"提取总耗时: {time.perf_counter() - wall_start:.2f}s (jobs={jobs})")
+    if cache is not None:
+        print(cache.stats_line())
     
     # 去重
     seen = set()
@@ -192,9 +416,20 @@ def process_all_json_files(input_dir, output_csv):
 
 
 if __name__ == '__main__':
-    import sys
+    import argparse
     
-    input_dir = sys.argv[1] if len(sys.argv) > 1 else 'H:/GDUT2025_12/Voice_atri_mika/decrypted'
-    output_csv = sys.argv[2] if len(sys.argv) > 2 else 'H:/GDUT2025_12/Voice_atri_mika/dataset.csv'
+    parser = argparse.ArgumentParser(description='ATRI 剧本解析: 语音文件名 <-> 日文台词')
+    parser.add_argument('input_dir', nargs='?', default='H:/GDUT2025_12/Voice_atri_mika/decrypted')
+    parser.add_argument('output_csv', nargs='?', default='H:/GDUT2025_12/Voice_atri_mika/dataset.csv')
+    parser.add_argument('--benchmark', action='store_true', help='对比窗口重扫与单遍流式提取的耗时')
+    parser.add_argument('--repeat', type=int, default=3, help='基准测试重复次数')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行提取的进程数')
+    parser.add_argument('--cache', default=None, help='提取缓存文件路径 (默认: 输出 CSV 同目录的 .extract_cache.sqlite)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用提取缓存，全部重新解析')
+    args = parser.parse_args()
     
-    process_all_json_files(input_dir, output_csv)
+    if args.benchmark:
+        benchmark_extractors(args.input_dir, args.repeat)
+    else:
+        cache_path = None if args.no_cache else (args.cache or default_cache_path(args.output_csv))
+        process_all_json_files(args.input_dir, args.output_csv, args.jobs, cache_path)
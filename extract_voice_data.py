@@ -1,5 +1,10 @@
 import sys
 import os
+import time
+import zlib
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Add krkr-xp3 to sys.path
 sys.path.append('krkr-xp3')
@@ -13,16 +18,12 @@ except ImportError:
 xp3_path = "/mnt/x/SteamLibrary/steamapps/common/ATRI -My Dear Moments-/vol1.xp3"
 output_dir = "extracted"
 
-if not os.path.exists(xp3_path):
-    print(f"Error: XP3 file not found at {xp3_path}")
-    sys.exit(1)
-
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# Filter for voice (.opus) and script (.scn)
+WANTED_EXTENSIONS = ('.opus', '.scn')
 
-print(f"Opening {xp3_path}...")
 
-try:
+def extract_serial(xp3_path, output_dir):
+    """Walk every archive entry in index order and extract matches one by one."""
     with open(xp3_path, 'rb') as f:
         # xp3reader uses numpy if available, handles optionality internally
         with XP3Reader(f) as reader:
@@ -30,8 +31,7 @@ try:
             count = 0
             for file in reader:
                 path = file.info.file_path
-                # Filter for voice (.opus) and script (.scn)
-                if path.endswith('.opus') or path.endswith('.scn'):
+                if path.endswith(WANTED_EXTENSIONS):
                     # print(f"Extracting {path}...")
                     try:
                         # Extract handles directory creation
@@ -41,7 +41,137 @@ try:
                             print(f"Extracted {count} files...")
                     except Exception as e:
                         print(f"Failed to extract {path}: {e}")
-    print(f"Extraction complete. Total extracted: {count}")
-except Exception:
-    import traceback
-    traceback.print_exc()
+    return count
+
+
+def _output_path(output_dir, entry):
+    return os.path.join(output_dir, *entry.info.file_path.replace('\\', '/').split('/'))
+
+
+def _read_segments(f, entry):
+    """Read the raw (possibly compressed) segments of one entry."""
+    parts = []
+    for segment in entry.segm:
+        f.seek(segment.offset)
+        parts.append((segment.is_compressed, f.read(segment.compressed_size)))
+    return parts
+
+
+def _write_entry(out_path, parts):
+    """Decompress segments and write the file (runs on the thread pool)."""
+    start = time.perf_counter()
+    data = b''.join(zlib.decompress(raw) if compressed else raw for compressed, raw in parts)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + '.part'
+    with open(tmp_path, 'wb') as out:
+        out.write(data)
+    os.replace(tmp_path, out_path)
+    return len(data), time.perf_counter() - start
+
+
+def extract_streaming(xp3_path, output_dir, workers=4, max_pending=64):
+    """Filter on the file index, read wanted entries in archive-offset order,
+    and decompress/write them on a thread pool.
+
+    Entries already on disk with the expected size are skipped, so an
+    interrupted run can simply be restarted. Encrypted entries are left to
+    the serial mode.
+    """
+    with open(xp3_path, 'rb') as f:
+        with XP3Reader(f) as reader:
+            entries = reader.file_index.entries
+            wanted = [e for e in entries if e.info.file_path.endswith(WANTED_EXTENSIONS)]
+            print(f"Found {len(entries)} files, {len(wanted)} match {', '.join(WANTED_EXTENSIONS)}.")
+
+            todo = []
+            skipped = encrypted = 0
+            for entry in wanted:
+                if getattr(entry.info, 'is_encrypted', False):
+                    encrypted += 1
+                    continue
+                out_path = _output_path(output_dir, entry)
+                if os.path.exists(out_path) and os.path.getsize(out_path) == entry.info.uncompressed_size:
+                    skipped += 1
+                    continue
+                todo.append((entry, out_path))
+            todo.sort(key=lambda item: min(s.offset for s in item[0].segm))
+            print(f"To extract: {len(todo)} | already present: {skipped} | encrypted (use --mode serial): {encrypted}")
+
+            count = failed = 0
+            read_bytes = written_bytes = 0
+            read_time = write_time = 0.0
+            wall_start = time.perf_counter()
+
+            def collect(future, path):
+                nonlocal count, failed, written_bytes, write_time
+                try:
+                    size, elapsed = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to extract {path}: {e}")
+                    return
+                count += 1
+                written_bytes += size
+                write_time += elapsed
+                if count % 100 == 0:
+                    wall = time.perf_counter() - wall_start
+                    print(f"Extracted {count} files... {written_bytes / wall / 1e6:.1f} MB/s")
+
+            # Reads stay on this thread (sequential IO on one handle);
+            # a bounded queue of futures caps the memory held by raw segments.
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for entry, out_path in todo:
+                    start = time.perf_counter()
+                    parts = _read_segments(f, entry)
+                    read_time += time.perf_counter() - start
+                    read_bytes += sum(len(raw) for _, raw in parts)
+
+                    pending.append((executor.submit(_write_entry, out_path, parts), entry.info.file_path))
+                    if len(pending) >= max_pending:
+                        collect(*pending.popleft())
+                while pending:
+                    collect(*pending.popleft())
+
+            wall = time.perf_counter() - wall_start
+            print(f"Extracted {count} files ({failed} failed) in {wall:.1f}s")
+            if wall > 0:
+                print(f"  overall:             {written_bytes / wall / 1e6:.1f} MB/s")
+            if read_time > 0:
+                print(f"  archive read:        {read_bytes / read_time / 1e6:.1f} MB/s "
+                      f"({read_time / max(wall, 1e-9):.0%} of wall time)")
+            if write_time > 0:
+                print(f"  decompress + write:  {written_bytes / write_time / 1e6:.1f} MB/s per worker "
+                      f"({workers} workers)")
+            if count:
+                print("  -> IO-bound" if read_time >= 0.8 * wall else "  -> decompress/write-bound")
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract voice (.opus) and script (.scn) files from vol1.xp3")
+    parser.add_argument('--xp3', default=xp3_path, help='Path to vol1.xp3')
+    parser.add_argument('--output', default=output_dir, help='Output directory')
+    parser.add_argument('--mode', choices=['serial', 'streaming'], default='serial',
+                        help='serial: iterate every entry; streaming: index filter + offset-ordered reads + thread pool')
+    parser.add_argument('--workers', type=int, default=4, help='Decompress/write threads (streaming mode)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.xp3):
+        print(f"Error: XP3 file not found at {args.xp3}")
+        sys.exit(1)
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    print(f"Opening {args.xp3}...")
+
+    try:
+        if args.mode == 'streaming':
+            count = extract_streaming(args.xp3, args.output, args.workers)
+        else:
+            count = extract_serial(args.xp3, args.output)
+        print(f"Extraction complete. Total extracted: {count}")
+    except Exception:
+        import traceback
+        traceback.print_exc()
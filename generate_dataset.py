@@ -7,11 +7,21 @@ ATRI 语音数据集生成器
 
 import csv
 import json
+import math
 import os
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import subprocess
 import shutil
 
+from packed_corpus import DTYPES as PACK_DTYPES, write_packed_corpus
+from jsonl_io import JsonlWriter, iter_jsonl
+from near_dedup import DEFAULT_THRESHOLD as DEFAULT_NEAR_DEDUP_THRESHOLD, dedup_records, print_report
+from near_dedup import write_report as write_near_dedup_report
+
 def check_ffmpeg():
     """检查 ffmpeg 是否可用"""
     try:
@@ -33,8 +43,299 @@ def convert_opus_to_wav(input_path, output_path):
         print(f"转换失败: {e}")
         return False
 
-def generate_dataset(voices_dir, csv_path, output_dir, convert_audio=False):
-    """生成最终数据集"""
+TARGET_SR = 22050
+
+
+def decode_opus_resampled(input_path, target_sr=TARGET_SR):
+    """进程内解码 opus（libsndfile），混缩为单声道并用多相滤波重采样，返回 float32 数组"""
+    import numpy as np
+    import soundfile as sf
+    from scipy.signal import resample_poly
+    
+    audio, sr = sf.read(str(input_path), dtype='float32', always_2d=True)
+    audio = audio.mean(axis=1)
+    if sr != target_sr:
+        g = math.gcd(sr, target_sr)
+        audio = resample_poly(audio, target_sr // g, sr // g)
+    return np.clip(audio, -1.0, 1.0).astype(np.float32)
+
+
+def convert_opus_to_wav_inprocess(input_path, output_path):
+    """进程内转换 opus -> 22050Hz 单声道 16bit WAV，解码失败时回退到 ffmpeg"""
+    try:
+        import soundfile as sf
+        audio = decode_opus_resampled(input_path)
+        sf.write(str(output_path), audio, TARGET_SR, subtype='PCM_16', format='WAV')
+        return True
+    except Exception as e:
+        print(f"进程内解码失败，回退 ffmpeg: {Path(input_path).name} ({e})")
+        return convert_opus_to_wav(input_path, output_path)
+
+
+CONVERTERS = {
+    'ffmpeg': convert_opus_to_wav,
+    'soundfile': convert_opus_to_wav_inprocess,
+}
+
+
+def inprocess_backend_available():
+    """soundfile + scipy 是否可用"""
+    try:
+        import soundfile  # noqa: F401
+        import scipy.signal  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_backend(backend):
+    """返回实际可用的转换后端名称，进程内后端不可用时回退 ffmpeg"""
+    if backend == 'soundfile' and not inprocess_backend_available():
+        print("⚠️ 未安装 soundfile / scipy，回退到 ffmpeg 后端")
+        return 'ffmpeg'
+    return backend
+
+
+def load_matched(path):
+    """逐条读取匹配表：dataset_matched.jsonl，或旧版整份 JSON 的 dataset_matched.json"""
+    path = Path(path)
+    if path.suffix == '.jsonl':
+        yield from iter_jsonl(path)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from json.load(f)
+
+
+def benchmark_backends(dataset_path, limit=200):
+    """用 final_dataset 中的片段串行对比各转换后端的单文件开销"""
+    clips = []
+    for item in load_matched(dataset_path):
+        clip = Path(item['audio_path'])
+        if clip.exists():
+            clips.append(clip)
+            if len(clips) >= limit:
+                break
+    if not clips:
+        print(f"没有找到可用的音频片段: {dataset_path}")
+        return {}
+    
+    backends = [name for name in CONVERTERS
+                if (name != 'ffmpeg' or check_ffmpeg())
+                and (name != 'soundfile' or inprocess_backend_available())]
+    print(f"基准测试: {len(clips)} 个片段, 后端: {', '.join(backends)}")
+    
+    results = {}
+    for name in backends:
+        converter = CONVERTERS[name]
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            outputs = [Path(tmp) / (clip.stem + '.wav') for clip in clips]
+            ok = sum(1 for clip, out in zip(clips, outputs) if converter(clip, out))
+            elapsed = time.perf_counter() - start
+            audio_seconds = sum(_wav_duration(out) for out in outputs)
+        results[name] = {'ok': ok, 'seconds': elapsed, 'audio_seconds': audio_seconds}
+        print(f"  {name:<10} {elapsed:.2f}s | {len(clips) / elapsed:.1f} files/s | "
+              f"{audio_seconds / elapsed:.1f} audio-s/s | 成功 {ok}/{len(clips)}")
+    
+    return results
+
+
+def _wav_duration(path):
+    """读取 WAV 时长（秒），读取失败返回 0"""
+    try:
+        with wave.open(str(path), 'rb') as w:
+            return w.getnframes() / float(w.getframerate())
+    except (wave.Error, OSError, EOFError, ZeroDivisionError):
+        return 0.0
+
+
+def _is_fresh(input_path, output_path):
+    """输出存在且比源文件新，则无需重新转换"""
+    try:
+        return output_path.stat().st_mtime > input_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _convert_with_retry(input_path, output_path, converter, retries=1):
+    """转换单个文件，失败重试；先写临时文件再改名，避免残缺输出被当成已完成"""
+    tmp_path = output_path.with_name(output_path.stem + '.part' + output_path.suffix)
+    for _ in range(retries + 1):
+        if converter(input_path, tmp_path):
+            os.replace(tmp_path, output_path)
+            return True
+    if tmp_path.exists():
+        tmp_path.unlink()
+    return False
+
+
+def convert_all_to_wav(input_paths, wav_dir, workers=4, converter=convert_opus_to_wav,
+                       manifest_path=None, report_every=2.0):
+    """用有界线程池并行转换音频
+
+    - 输出比源文件新的直接跳过，重跑只处理缺失 / 过期的文件
+    - 失败重试一次，仍失败的写入 manifest
+    - 流式打印进度与吞吐 (files/s, audio-s/s)
+    """
+    wav_dir = Path(wav_dir)
+    wav_dir.mkdir(parents=True, exist_ok=True)
+    
+    jobs = []
+    skipped = 0
+    for input_path in input_paths:
+        input_path = Path(input_path)
+        output_path = wav_dir / (input_path.stem + '.wav')
+        if _is_fresh(input_path, output_path):
+            skipped += 1
+        else:
+            jobs.append((input_path, output_path))
+    
+    print(f"待转换 {len(jobs)} 个, 跳过已是最新的 {skipped} 个 (workers={workers})")
+    
+    converted = 0
+    audio_seconds = 0.0
+    failed = []
+    start = last_report = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_convert_with_retry, src, dst, converter): (src, dst)
+            for src, dst in jobs
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            src, dst = futures[future]
+            if future.result():
+                converted += 1
+                audio_seconds += _wav_duration(dst)
+            else:
+                failed.append({'source': str(src), 'output': str(dst)})
+            
+            now = time.perf_counter()
+            if now - last_report >= report_every or done == len(jobs):
+                elapsed = max(now - start, 1e-9)
+                print(f"  [{done}/{len(jobs)}] {done / elapsed:.1f} files/s | "
+                      f"{audio_seconds / elapsed:.1f} audio-s/s | 失败 {len(failed)}")
+                last_report = now
+    
+    elapsed = time.perf_counter() - start
+    manifest = {
+        'converted': converted,
+        'skipped': skipped,
+        'failed': failed,
+        'audio_seconds': round(audio_seconds, 2),
+        'elapsed_seconds': round(elapsed, 2),
+        'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    if manifest_path is not None:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    
+    return manifest
+
+
+def build_columnar_table(voices_dir, csv_path, audio_root, exclude_ids=None):
+    """列式构建 语音文件 <-> 文本 的连接表 (pyarrow)
+
+    - voice_id 统一转大写后做哈希连接，重复 id 与 dict 版本一致取最后一条
+    - speaker 列字典编码（相同角色名只存一份）
+    - audio_path 为相对 audio_root 的 POSIX 路径，而不是每行一个绝对路径
+    - exclude_ids 中的 voice_id（大写，如近似去重丢弃的条目）不输出
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+
+    voices_dir = Path(voices_dir)
+
+    texts = pacsv.read_csv(
+        csv_path,
+        convert_options=pacsv.ConvertOptions(
+            column_types={'voice': pa.string(), 'speaker': pa.string(), 'text_ja': pa.string()}
+        ),
+    )
+    texts = texts.rename_columns([name.lstrip('\ufeff') for name in texts.column_names])
+    texts = pa.table({
+        'voice_id': pc.utf8_upper(texts['voice']),
+        'speaker': texts['speaker'],
+        'text_ja': texts['text_ja'],
+        '_row': pa.array(range(texts.num_rows), pa.int64()),
+    })
+    latest = texts.group_by('voice_id').aggregate([('_row', 'max')])
+    texts = texts.take(latest['_row_max'])
+
+    voice_names = [p.name for p in voices_dir.glob('*.opus')]
+    names = pa.array(voice_names, pa.string())
+    voices = pa.table({
+        'voice_file': names,
+        'voice_id': pc.utf8_upper(pc.replace_substring_regex(names, r'\.[^.]*$', '')),
+        '_order': pa.array(range(len(voice_names)), pa.int64()),
+    })
+
+    joined = voices.join(texts, keys='voice_id', join_type='inner').sort_by('_order')
+    if exclude_ids:
+        excluded = pc.is_in(joined['voice_id'], value_set=pa.array(sorted(exclude_ids), pa.string()))
+        joined = joined.filter(pc.invert(excluded))
+
+    rel_dir = Path(os.path.relpath(voices_dir, audio_root)).as_posix()
+    audio_path = pc.binary_join_element_wise(rel_dir, joined['voice_file'], '/')
+
+    return pa.table(
+        {
+            'voice_file': joined['voice_file'],
+            'voice_id': joined['voice_id'],
+            'speaker': pc.dictionary_encode(joined['speaker']),
+            'text_ja': joined['text_ja'],
+            'audio_path': audio_path,
+        },
+        metadata={'audio_root': str(Path(audio_root).resolve())},
+    )
+
+
+def write_columnar_dataset(voices_dir, csv_path, output_path, audio_root, exclude_ids=None):
+    """写出 Arrow IPC 文件（不压缩，下游可直接 mmap）"""
+    import pyarrow as pa
+
+    table = build_columnar_table(voices_dir, csv_path, audio_root, exclude_ids)
+    with pa.OSFile(str(output_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return table
+
+
+def load_columnar_dataset(path):
+    """以内存映射方式读取 write_columnar_dataset 写出的表（零拷贝）"""
+    import pyarrow as pa
+
+    with pa.memory_map(str(path), 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def pack_dataset(matched, wav_dir, packed_dir, dtype='int16', shard_mb=256):
+    """把匹配结果打包为分片语料：优先使用已转换的 wav，否则直接解码 opus"""
+    wav_dir = Path(wav_dir)
+    
+    def sources():
+        for item in matched:
+            wav_path = wav_dir / (Path(item['audio_path']).stem + '.wav')
+            source = wav_path if wav_path.exists() else item['audio_path']
+            yield item['voice_id'], source, item['text_ja']
+    
+    return write_packed_corpus(sources(), packed_dir, decode_opus_resampled, TARGET_SR,
+                               dtype, shard_mb << 20)
+
+
+def generate_dataset(voices_dir, csv_path, output_dir, convert_audio=False,
+                     columnar=False, audio_root=None, workers=4, backend='ffmpeg',
+                     pack=False, pack_dtype='int16', shard_mb=256,
+                     near_dedup_keep=0, near_dedup_threshold=DEFAULT_NEAR_DEDUP_THRESHOLD):
+    """生成最终数据集
+
+    columnar=True 时额外输出 dataset_matched.arrow，audio_path 相对 audio_root
+    （默认为输出目录）。workers 为音频转换的并发数，backend 为转换后端
+    （ffmpeg 子进程 / soundfile 进程内解码）。pack=True 时额外输出分片打包语料。
+    near_dedup_keep > 0 时对有语音的台词按说话人做近似去重，每簇只保留 CSV 中靠前的
+    near_dedup_keep 条，簇报告写入 near_dedup_report.json。
+    """
     
     voices_dir = Path(voices_dir)
     output_dir = Path(output_dir)
@@ -48,65 +349,95 @@ def generate_dataset(voices_dir, csv_path, output_dir, convert_audio=False):
     print(f"CSV 中共有 {len(text_data)} 条文本记录")
     
     # 获取所有语音文件
-    voice_files = list(voices_dir.glob('*.opus'))
+    voice_files = sorted(voices_dir.glob('*.opus'))
     print(f"找到 {len(voice_files)} 个语音文件")
     
-    # 匹配并生成数据集
+    # 近似去重（MinHash + LSH）：只在能匹配到语音的台词中挑选保留条目，
+    # 按 CSV（剧本）顺序保留，且只在同一说话人内聚簇，不会删掉其他角色仅有的片段
+    near_duplicates = set()
+    if near_dedup_keep > 0:
+        voice_ids = {f.stem.upper() for f in voice_files}
+        candidates = [row for voice_id, row in text_data.items() if voice_id in voice_ids]
+        kept, report = dedup_records(candidates, 'text_ja', near_dedup_keep, 'voice', 'speaker',
+                                     threshold=near_dedup_threshold)
+        kept_ids = {row['voice'].upper() for row in kept}
+        near_duplicates = {row['voice'].upper() for row in candidates} - kept_ids
+        print_report(report, top=5)
+        write_near_dedup_report(report, output_dir / 'near_dedup_report.json')
+    
+    # 匹配并生成数据集：每匹配一条就写出 CSV 行和 JSONL 行（一行一条，下游可逐行读取）
     matched = []
     unmatched_voices = []
-    
-    for voice_file in voice_files:
-        voice_id = voice_file.stem.upper()
-        
-        if voice_id in text_data:
-            record = text_data[voice_id]
-            matched.append({
-                'voice_file': voice_file.name,
-                'voice_id': voice_id,
-                'speaker': record['speaker'],
-                'text_ja': record['text_ja'],
-                'audio_path': str(voice_file)
-            })
-        else:
-            unmatched_voices.append(voice_file.name)
-    
-    print(f"\n匹配成功: {len(matched)} 条")
-    print(f"未匹配 (语音有但文本无): {len(unmatched_voices)} 条")
-    
-    # 保存匹配结果
     output_csv = output_dir / 'dataset_matched.csv'
-    with open(output_csv, 'w', encoding='utf-8-sig', newline='') as f:
+    output_jsonl = output_dir / 'dataset_matched.jsonl'
+    
+    with open(output_csv, 'w', encoding='utf-8-sig', newline='') as f, JsonlWriter(output_jsonl) as jsonl:
         fieldnames = ['voice_file', 'voice_id', 'speaker', 'text_ja', 'audio_path']
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(matched)
+        
+        for voice_file in voice_files:
+            voice_id = voice_file.stem.upper()
+            
+            if voice_id in near_duplicates:
+                continue
+            if voice_id in text_data:
+                record = text_data[voice_id]
+                item = {
+                    'voice_file': voice_file.name,
+                    'voice_id': voice_id,
+                    'speaker': record['speaker'],
+                    'text_ja': record['text_ja'],
+                    'audio_path': str(voice_file)
+                }
+                writer.writerow(item)
+                jsonl.write(item)
+                matched.append(item)
+            else:
+                unmatched_voices.append(voice_file.name)
     
+    print(f"\n匹配成功: {len(matched)} 条")
+    print(f"未匹配 (语音有但文本无): {len(unmatched_voices)} 条")
+    if near_duplicates:
+        print(f"近似重复跳过: {len(near_duplicates)} 条")
     print(f"\n匹配数据集已保存到: {output_csv}")
+    print(f"JSONL 格式已保存到: {output_jsonl}")
     
-    # 保存为 JSON 格式（更方便后续处理）
-    output_json = output_dir / 'dataset_matched.json'
-    with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump(matched, f, ensure_ascii=False, indent=2)
-    
-    print(f"JSON 格式已保存到: {output_json}")
+    # 列式输出（可选依赖 pyarrow）
+    if columnar:
+        output_arrow = output_dir / 'dataset_matched.arrow'
+        try:
+            table = write_columnar_dataset(voices_dir, csv_path, output_arrow, audio_root or output_dir,
+                                           near_duplicates)
+            print(f"列式数据集已保存到: {output_arrow} ({table.num_rows} 行)")
+        except ImportError:
+            print("⚠️ 未安装 pyarrow，跳过列式输出 (pip install pyarrow)")
     
     # 如果需要转换音频
-    if convert_audio and check_ffmpeg():
+    if convert_audio:
+        backend = resolve_backend(backend)
+    if convert_audio and (backend != 'ffmpeg' or check_ffmpeg()):
         wav_dir = output_dir / 'wavs'
-        wav_dir.mkdir(exist_ok=True)
+        manifest_path = output_dir / 'conversion_manifest.json'
         
-        print(f"\n开始转换音频到 WAV 格式...")
-        converted = 0
-        for item in matched:
-            input_path = Path(item['audio_path'])
-            output_path = wav_dir / (input_path.stem + '.wav')
-            
-            if convert_opus_to_wav(input_path, output_path):
-                converted += 1
-                if converted % 100 == 0:
-                    print(f"  已转换 {converted} 个...")
+        print(f"\n开始转换音频到 WAV 格式 (后端: {backend})...")
+        manifest = convert_all_to_wav(
+            [item['audio_path'] for item in matched], wav_dir,
+            workers=workers, converter=CONVERTERS[backend], manifest_path=manifest_path,
+        )
         
-        print(f"音频转换完成: {converted} 个")
+        print(f"音频转换完成: {manifest['converted']} 个, 跳过 {manifest['skipped']} 个, "
+              f"失败 {len(manifest['failed'])} 个")
+        if manifest['failed']:
+            print(f"失败清单见: {manifest_path}")
+    
+    # 打包语料（分片 + 索引，读取端零拷贝 mmap）
+    if pack:
+        if inprocess_backend_available():
+            print(f"\n开始打包语料 ({pack_dtype}, 分片 {shard_mb}MB)...")
+            pack_dataset(matched, output_dir / 'wavs', output_dir / 'packed', pack_dtype, shard_mb)
+        else:
+            print("⚠️ 未安装 soundfile / scipy，跳过语料打包")
     
     # 统计信息
     print("\n" + "="*50)
@@ -131,13 +462,37 @@ def generate_dataset(voices_dir, csv_path, output_dir, convert_audio=False):
 
 
 if __name__ == '__main__':
-    import sys
-    
-    voices_dir = sys.argv[1] if len(sys.argv) > 1 else 'H:/GDUT2025_12/Voice_atri_mika/voices'
-    csv_path = sys.argv[2] if len(sys.argv) > 2 else 'H:/GDUT2025_12/Voice_atri_mika/dataset.csv'
-    output_dir = sys.argv[3] if len(sys.argv) > 3 else 'H:/GDUT2025_12/Voice_atri_mika/final_dataset'
+    import argparse
     
+    parser = argparse.ArgumentParser(description='ATRI 语音数据集生成器')
+    parser.add_argument('voices_dir', nargs='?', default='H:/GDUT2025_12/Voice_atri_mika/voices')
+    parser.add_argument('csv_path', nargs='?', default='H:/GDUT2025_12/Voice_atri_mika/dataset.csv')
+    parser.add_argument('output_dir', nargs='?', default='H:/GDUT2025_12/Voice_atri_mika/final_dataset')
     # 是否转换音频（默认不转换，因为 ffmpeg 可能不可用）
-    convert_audio = '--convert' in sys.argv
+    parser.add_argument('--convert', action='store_true', help='将 opus 转换为 22050Hz 单声道 WAV')
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1), help='音频转换并发数')
+    parser.add_argument('--backend', choices=sorted(CONVERTERS), default='ffmpeg',
+                        help='音频转换后端: ffmpeg 子进程 / soundfile 进程内解码')
+    parser.add_argument('--benchmark-backends', action='store_true',
+                        help='在输出目录 dataset_matched.jsonl 的片段上对比各转换后端')
+    parser.add_argument('--pack', action='store_true', help='额外输出分片打包语料 (output_dir/packed)')
+    parser.add_argument('--pack-dtype', choices=PACK_DTYPES, default='int16', help='打包语料的采样格式')
+    parser.add_argument('--shard-mb', type=int, default=256, help='打包语料单个分片大小 (MB)')
+    parser.add_argument('--columnar', action='store_true', help='额外输出 Arrow IPC 列式数据集 (需要 pyarrow)')
+    parser.add_argument('--audio-root', default=None, help='列式数据集中 audio_path 的相对根目录 (默认: 输出目录)')
+    parser.add_argument('--near-dedup', type=int, default=0, metavar='KEEP',
+                        help='近似重复台词每簇保留的条数 (0: 不去重)')
+    parser.add_argument('--near-dedup-threshold', type=float, default=DEFAULT_NEAR_DEDUP_THRESHOLD,
+                        help='近似去重的 Jaccard 阈值')
+    args = parser.parse_args()
     
-    generate_dataset(voices_dir, csv_path, output_dir, convert_audio)
+    if args.benchmark_backends:
+        matched_path = Path(args.output_dir) / 'dataset_matched.jsonl'
+        if not matched_path.exists():
+            matched_path = matched_path.with_suffix('.json')  # 旧版输出
+        benchmark_backends(matched_path)
+    else:
+        generate_dataset(args.voices_dir, args.csv_path, args.output_dir, args.convert,
+                         args.columnar, args.audio_root, args.workers, args.backend,
+                         args.pack, args.pack_dtype, args.shard_mb,
+                         args.near_dedup, args.near_dedup_threshold)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSONL 流式读写
+语料和匹配表原来先整份收集在内存里，最后一次 json.dump(indent=2)，内存随语料线性增长，
+而且文件写完之前下游什么都读不到。这里每条记录一行：
+  - JsonlWriter 逐条写出并按批 flush，内存只与单条记录有关
+  - iter_jsonl 逐行读取；只产出以换行结尾的完整行，写到一半的末行留到下次再读
+  - 写出期间存在 <path>.writing 标记，写完后删除；iter_jsonl(follow=True) 据此
+    边写边读，训练侧不必等提取全部结束
+
+用法: python jsonl_io.py <file.jsonl> [--follow] [--head N]
+"""
+
+import json
+import os
+import time
+
+WRITING_SUFFIX = '.writing'
+
+
+def writing_marker(path):
+    return str(path) + WRITING_SUFFIX
+
+
+def is_writing(path):
+    """写入端是否还在写这个文件"""
+    return os.path.exists(writing_marker(path))
+
+
+class JsonlWriter:
+    """逐条写出 JSONL
+
+    每条记录序列化为一整行后一次写入；flush_every 条 flush 一次（flush() 可手动调用，
+    例如每处理完一个源文件）。打开时创建 .writing 标记，close() 时删除。
+    """
+
+    def __init__(self, path, flush_every=64):
+        self.path = str(path)
+        self.flush_every = flush_every
+        self.records = 0
+        self.bytes = 0
+        self._pending = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        open(writing_marker(self.path), 'w').close()
+        self._file = open(self.path, 'w', encoding='utf-8', newline='\n')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        self._file.write(line)
+        self.records += 1
+        self.bytes += len(line.encode('utf-8'))
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        try:
+            os.remove(writing_marker(self.path))
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_jsonl(path, follow=False, poll=0.5):
+    """逐行产出 JSONL 记录
+
+    follow=True 时读到文件末尾后，只要写入端还在写（.writing 标记存在）就等待新行，
+    写入端结束后读完剩余内容再返回。空行跳过。
+    """
+    with open(str(path), 'r', encoding='utf-8') as f:
+        pending = ''
+        draining = False  # 已确认写入端结束，读到末尾即返回
+        while True:
+            line = f.readline()
+            if line.endswith('\n'):
+                line, pending = pending + line, ''
+                if line.strip():
+                    yield json.loads(line)
+                continue
+            pending += line  # 文件末尾，或写到一半的行
+            if draining:
+                break
+            if not is_writing(path):
+                # 标记删除前写入端可能又写了几行：再读一轮到末尾
+                draining = True
+                continue
+            if not follow:
+                break
+            time.sleep(poll)
+        # 写入端结束后，末尾没有换行的行也是完整记录
+        if pending.strip() and not is_writing(path):
+            yield json.loads(pending)
+
+
+def count_jsonl(path):
+    """统计记录数（不解析 JSON）"""
+    with open(str(path), 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查看 JSONL 文件')
+    parser.add_argument('path')
+    parser.add_argument('--follow', action='store_true', help='写入端还在写时持续读取新行')
+    parser.add_argument('--head', type=int, default=0, help='只打印前 N 条')
+    args = parser.parse_args()
+
+    count = 0
+    for count, record in enumerate(iter_jsonl(args.path, follow=args.follow), 1):
+        if count <= args.head:
+            print(json.dumps(record, ensure_ascii=False)[:200])
+    print(f'{count} 条记录{" (仍在写入)" if is_writing(args.path) else ""}')
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似重复台词检测 (MinHash + LSH)
+dataset.csv 里有大量几乎相同的台词（例如 ATR_b101_* 一长串「……」「…………」），
+generate_dataset 只按 voice id 精确去重，这些低信息量的片段白白占用 TTS / LLM 的训练步数。
+这里对字符 shingle 计算 MinHash 签名，按 LSH 分段分桶，只在同桶内与代表比较，
+整体复杂度近似线性，加入更多游戏剧本也不需要两两比较:
+  - 规范化: NFKC、去掉引号和空白、连续重复字符折叠为一个（「…………」与「……」视为相同）
+  - 规范化后完全相同的文本只算一次签名
+  - 按说话人分组，只在同一说话人内聚簇（不同角色的「はい」各自保留）
+  - 同一簇保留前 keep 条（按原顺序），其余丢弃，并输出簇报告
+
+用法: python near_dedup.py dataset.csv [-o dataset_dedup.csv] [--keep 1] [--threshold 0.7] [--group-column speaker]
+"""
+
+import csv
+import json
+import re
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.7
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE = 3
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_QUOTES_RE = re.compile(r'[「」『』“”"\'\s　]')
+_REPEAT_RE = re.compile(r'(.)\1+')
+
+
+def normalize(text):
+    """用于比较的规范化文本（不改动原文）"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = _QUOTES_RE.sub('', text)
+    return _REPEAT_RE.sub(r'\1', text)
+
+
+def shingles(text, k=DEFAULT_SHINGLE):
+    """字符 k-gram 集合；短于 k 的文本整体作为一个 shingle"""
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def lsh_params(threshold, num_perm):
+    """选择 bands × rows = num_perm，使 S 曲线拐点 (1/b)^(1/r) 最接近阈值"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """num_perm 个 (a·x + b) mod p 的 MinHash 签名（shingle 先用 CRC32 映射为整数，跨进程稳定）"""
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, shingle=DEFAULT_SHINGLE, seed=1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.shingle = shingle
+
+    def signature(self, text):
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles(text, self.shingle)),
+                             dtype=np.uint64)
+        return ((hashes[:, None] * self.a + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+
+
+def near_duplicate_clusters(texts, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM,
+                            shingle=DEFAULT_SHINGLE, seed=1):
+    """返回近似重复簇 [[下标, ...], ...]（只含大小 > 1 的簇，簇内按原顺序）
+
+    1. 规范化后完全相同的文本合并为一个唯一文本
+    2. 每个唯一文本算一次签名，按 band 分桶
+    3. 同桶的文本只与桶内第一个（代表）比较签名估计的 Jaccard，达到阈值即合并
+       —— 每个桶线性比较，大桶（成百上千条「……」）也不会退化成两两比较
+    """
+    groups = {}
+    for index, text in enumerate(texts):
+        groups.setdefault(normalize(text), []).append(index)
+    unique = list(groups)
+
+    hasher = MinHasher(num_perm, shingle, seed)
+    signatures = np.stack([hasher.signature(u) for u in unique]) if unique else np.zeros((0, num_perm))
+    bands, rows = lsh_params(threshold, num_perm)
+
+    uf = _UnionFind(len(unique))
+    for band in range(bands):
+        buckets = {}
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i in range(len(unique)):
+            buckets.setdefault(block[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            rep = members[0]
+            for other in members[1:]:
+                if uf.find(other) == uf.find(rep):
+                    continue
+                if np.mean(signatures[rep] == signatures[other]) >= threshold:
+                    uf.union(rep, other)
+
+    clusters = {}
+    for i, u in enumerate(unique):
+        clusters.setdefault(uf.find(i), []).extend(groups[u])
+    return [sorted(c) for c in clusters.values() if len(c) > 1]
+
+
+def dedup_records(records, text_key, keep=1, id_key=None, group_key=None, **options):
+    """对记录去近似重复：每簇保留前 keep 条
+
+    group_key 不为空时按该字段（如说话人）分组，只在组内聚簇。
+    返回 (保留的记录, 报告)；报告按簇大小降序列出每簇的保留 / 丢弃条目。
+    """
+    start = time.perf_counter()
+    texts = [r.get(text_key) or '' for r in records]
+    groups = {}
+    for index, record in enumerate(records):
+        groups.setdefault(record.get(group_key) if group_key else None, []).append(index)
+    clusters = []
+    for members in groups.values():
+        for cluster in near_duplicate_clusters([texts[i] for i in members], **options):
+            clusters.append([members[i] for i in cluster])
+    dropped = set()
+    report_clusters = []
+    for cluster in sorted(clusters, key=len, reverse=True):
+        dropped.update(cluster[keep:])
+        label = (lambda i: records[i][id_key]) if id_key else (lambda i: i)
+        report_clusters.append({
+            "size": len(cluster),
+            "group": records[cluster[0]].get(group_key) if group_key else None,
+            "normalized": normalize(texts[cluster[0]]),
+            "kept": [{"id": label(i), "text": texts[i]} for i in cluster[:keep]],
+            "dropped": [label(i) for i in cluster[keep:]],
+        })
+    kept = [r for i, r in enumerate(records) if i not in dropped]
+    report = {
+        "records": len(records),
+        "kept": len(kept),
+        "dropped": len(dropped),
+        "clusters": len(clusters),
+        "keep_per_cluster": keep,
+        "group_key": group_key,
+        "options": {"threshold": DEFAULT_THRESHOLD, "num_perm": DEFAULT_NUM_PERM,
+                    "shingle": DEFAULT_SHINGLE, **options},
+        "seconds": round(time.perf_counter() - start, 3),
+        "cluster_list": report_clusters,
+    }
+    return kept, report
+
+
+def write_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def print_report(report, top=10):
+    print(f"近似去重: {report['records']} 条 -> 保留 {report['kept']} 条, 丢弃 {report['dropped']} 条 "
+          f"({report['clusters']} 个簇, 每簇保留 {report['keep_per_cluster']}, {report['seconds']}s)")
+    for cluster in report['cluster_list'][:top]:
+        sample = cluster['kept'][0]['text'] if cluster['kept'] else cluster['normalized']
+        print(f"  {cluster['size']:>5} 条  {sample[:40]}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='近似重复台词检测 (MinHash + LSH)')
+    parser.add_argument('csv_path')
+    parser.add_argument('-o', '--output', default=None, help='去重后的 CSV (默认: <输入>_dedup.csv)')
+    parser.add_argument('--report', default=None, help='簇报告 JSON (默认: <输入>_near_dedup.json)')
+    parser.add_argument('--text-column', default='text_ja')
+    parser.add_argument('--id-column', default='voice')
+    parser.add_argument('--group-column', default='speaker', help='只在该列相同的记录间聚簇 (空字符串 = 不分组)')
+    parser.add_argument('--keep', type=int, default=1, help='每个近似重复簇保留的条数')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Jaccard 相似度阈值')
+    parser.add_argument('--num-perm', type=int, default=DEFAULT_NUM_PERM, help='MinHash 签名长度')
+    parser.add_argument('--shingle', type=int, default=DEFAULT_SHINGLE, help='字符 shingle 长度')
+    args = parser.parse_args()
+
+    with open(args.csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+
+    kept, report = dedup_records(rows, args.text_column, args.keep, args.id_column, args.group_column or None,
+                                 threshold=args.threshold, num_perm=args.num_perm, shingle=args.shingle)
+    print_report(report)
+
+    stem = args.csv_path.rsplit('.', 1)[0]
+    output = args.output or stem + '_dedup.csv'
+    with open(output, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(kept)
+    report_path = args.report or stem + '_near_dedup.json'
+    write_report(report, report_path)
+    print(f"已保存到: {output}")
+    print(f"簇报告: {report_path}")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 打包语音语料
+把成千上万个小 wav 拼接成少数几个大分片文件 (int16 / float16 PCM)，
+再配一个 voice_id -> (分片, 偏移, 长度, 采样率, 文本) 的索引。
+读取端用 mmap 返回零拷贝的 numpy 视图，省掉网络存储上逐文件 open/stat 的开销。
+
+用法: python packed_corpus.py <wav_dir> <output_dir> [--list train.list]
+"""
+
+import json
+import mmap
+import os
+from pathlib import Path
+
+INDEX_NAME = 'index.json'
+DTYPES = ('int16', 'float16')
+
+
+def _encode(audio, dtype):
+    """float32 [-1, 1] -> 分片存储格式"""
+    import numpy as np
+
+    audio = np.clip(np.asarray(audio, dtype=np.float32), -1.0, 1.0)
+    if dtype == 'int16':
+        return (audio * 32767.0).astype('<i2')
+    return audio.astype('<f2')
+
+
+def write_packed_corpus(items, output_dir, load_audio, sample_rate,
+                        dtype='int16', shard_bytes=256 << 20):
+    """写出打包语料
+
+    Args:
+        items: 可迭代的 (voice_id, 音频路径, 文本)
+        output_dir: 输出目录（分片 shard_XXX.bin + index.json）
+        load_audio: 读取音频的函数，path -> 单声道 float32 数组（采样率需为 sample_rate）
+        sample_rate: 所有条目的采样率
+        dtype: 'int16' 或 'float16'
+        shard_bytes: 单个分片的目标大小
+
+    Returns:
+        索引 dict
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的 dtype: {dtype} (可选 {', '.join(DTYPES)})")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    shards = []
+    entries = {}
+    shard_file = None
+    shard_size = 0
+
+    try:
+        for voice_id, path, text in items:
+            try:
+                data = _encode(load_audio(path), dtype)
+            except Exception as e:
+                print(f"跳过 {voice_id}: {e}")
+                continue
+
+            if shard_file is None or shard_size >= shard_bytes:
+                if shard_file is not None:
+                    shard_file.close()
+                shards.append(f"shard_{len(shards):03d}.bin")
+                shard_file = open(output_dir / shards[-1], 'wb')
+                shard_size = 0
+
+            entries[voice_id] = {
+                'shard': len(shards) - 1,
+                'offset': shard_size,
+                'length': int(data.shape[0]),
+                'sample_rate': sample_rate,
+                'text': text,
+            }
+            shard_file.write(data.tobytes())
+            shard_size += data.nbytes
+    finally:
+        if shard_file is not None:
+            shard_file.close()
+
+    index = {'dtype': dtype, 'shards': shards, 'entries': entries}
+    tmp_path = output_dir / (INDEX_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, output_dir / INDEX_NAME)
+
+    total = sum(e['length'] for e in entries.values())
+    print(f"打包完成: {len(entries)} 条, {len(shards)} 个分片, "
+          f"{total / max(sample_rate, 1) / 3600:.2f} 小时音频 -> {output_dir}")
+    return index
+
+
+class PackedCorpus:
+    """打包语料读取器，get() 返回指向 mmap 的只读 numpy 视图（不复制数据）"""
+
+    def __init__(self, corpus_dir):
+        self.corpus_dir = Path(corpus_dir)
+        with open(self.corpus_dir / INDEX_NAME, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.dtype = index['dtype']
+        self.shards = index['shards']
+        self.entries = index['entries']
+        self._maps = {}
+
+    def _shard(self, shard_id):
+        """按需映射分片文件"""
+        mm = self._maps.get(shard_id)
+        if mm is None:
+            with open(self.corpus_dir / self.shards[shard_id], 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard_id] = mm
+        return mm
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, voice_id):
+        return voice_id in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def get(self, voice_id):
+        """返回 (音频视图, 采样率)；int16 / float16 原样返回，需要 float32 时由调用方转换"""
+        import numpy as np
+
+        entry = self.entries[voice_id]
+        view = np.frombuffer(
+            self._shard(entry['shard']), dtype='<i2' if self.dtype == 'int16' else '<f2',
+            count=entry['length'], offset=entry['offset'],
+        )
+        return view, entry['sample_rate']
+
+    def get_float32(self, voice_id):
+        """返回 (float32 音频, 采样率)，会产生一次拷贝"""
+        import numpy as np
+
+        view, sr = self.get(voice_id)
+        audio = view.astype(np.float32)
+        if self.dtype == 'int16':
+            audio /= 32767.0
+        return audio, sr
+
+    def text(self, voice_id):
+        return self.entries[voice_id]['text']
+
+    def close(self):
+        for mm in self._maps.values():
+            try:
+                mm.close()
+            except BufferError:
+                # 仍有 numpy 视图引用该分片，留给垃圾回收释放
+                pass
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_list_file(list_path):
+    """读取 GPT-SoVITS 训练列表 (wav_path|speaker|language|text)，返回 {文件名(不含扩展名): 文本}"""
+    texts = {}
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('|')
+            if len(parts) >= 4:
+                texts[Path(parts[0]).stem] = parts[3]
+    return texts
+
+
+if __name__ == '__main__':
+    import argparse
+    import soundfile as sf
+
+    parser = argparse.ArgumentParser(description='把 wav 目录打包为分片语料')
+    parser.add_argument('wav_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--list', default=None, help='GPT-SoVITS 训练列表，用于填充文本')
+    parser.add_argument('--dtype', choices=DTYPES, default='int16')
+    parser.add_argument('--shard-mb', type=int, default=256, help='单个分片大小 (MB)')
+    args = parser.parse_args()
+
+    wavs = sorted(Path(args.wav_dir).glob('*.wav'))
+    texts = read_list_file(args.list) if args.list else {}
+    sample_rate = sf.info(str(wavs[0])).samplerate if wavs else 0
+
+    def load_wav(path):
+        audio, sr = sf.read(str(path), dtype='float32', always_2d=True)
+        if sr != sample_rate:
+            raise ValueError(f"采样率 {sr} 与语料 {sample_rate} 不一致")
+        return audio.mean(axis=1)
+
+    write_packed_corpus(
+        ((wav.stem, wav, texts.get(wav.stem, '')) for wav in wavs),
+        args.output_dir, load_wav, sample_rate, args.dtype, args.shard_mb << 20,
+    )
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+剧本提取增量缓存
+以 文件路径 + 大小 + mtime + 内容哈希 为键，把每个剧本 JSON 的提取结果存进 SQLite 旁路文件。
+FreeMote 重新反编译后通常只有少数文件内容变化，重复运行时只需重新解析这些文件。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+
+def file_digest(path):
+    """计算文件内容的 SHA-1"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ScenarioCache:
+    """按提取器名称 + 版本隔离的单文件提取结果缓存
+
+    - 路径、大小、mtime 都未变：直接命中，不读文件
+    - mtime 变了但内容哈希相同（例如重新反编译）：命中并刷新 mtime
+    - 提取器版本变化：打开时清除该提取器的全部旧条目
+    """
+
+    def __init__(self, db_path, extractor, version):
+        self.db_path = str(db_path)
+        self.extractor = extractor
+        self.version = str(version)
+        self.hits = 0
+        self.misses = 0
+        self._digests = {}  # get() 未命中时算出的哈希，put() 时复用
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                path TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                version TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha1 TEXT NOT NULL,
+                records TEXT NOT NULL,
+                PRIMARY KEY (path, extractor)
+            )"""
+        )
+        cursor = self.conn.execute(
+            "DELETE FROM entries WHERE extractor = ? AND version != ?",
+            (self.extractor, self.version),
+        )
+        self.invalidated = cursor.rowcount
+        self.conn.commit()
+
+    def get(self, path):
+        """返回缓存的记录列表；未命中返回 None"""
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, sha1, records FROM entries WHERE path = ? AND extractor = ?",
+            (key, self.extractor),
+        ).fetchone()
+
+        if row is not None:
+            size, mtime_ns, sha1, records = row
+            if size == st.st_size and mtime_ns == st.st_mtime_ns:
+                self.hits += 1
+                return json.loads(records)
+            if size == st.st_size:
+                digest = file_digest(key)
+                if digest == sha1:
+                    self.conn.execute(
+                        "UPDATE entries SET mtime_ns = ? WHERE path = ? AND extractor = ?",
+                        (st.st_mtime_ns, key, self.extractor),
+                    )
+                    self.hits += 1
+                    return json.loads(records)
+                self._digests[key] = digest
+
+        self.misses += 1
+        return None
+
+    def put(self, path, records):
+        """写入（覆盖）某个文件的提取结果"""
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        digest = self._digests.pop(key, None) or file_digest(key)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, self.extractor, self.version, st.st_size, st.st_mtime_ns, digest,
+             json.dumps(records, ensure_ascii=False)),
+        )
+
+    def stats_line(self):
+        """命中统计，例如: 缓存: 命中 30 / 未命中 2 (版本失效 0)"""
+        return f"缓存: 命中 {self.hits} / 未命中 {self.misses} (版本失效 {self.invalidated})"
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 合成音频客观指标
+评测结果原来只有成功 / 失败和 wav 路径，比较 checkpoint 只能靠耳朵听。
+这里对每条输出计算（全部为 numpy / scipy 向量化实现，只用 CPU）:
+  - 时长、RTF（来自评测记录的合成耗时）
+  - 静音占比: 10ms 帧 RMS 低于 -40 dBFS 的比例
+  - 削波率: |x| >= 0.999 的采样点比例
+  - 响度: ITU-R BS.1770 积分响度 (LUFS，K 加权 + 门限)
+  - F0 统计: 16kHz 下逐帧 YIN，输出均值 / 中位数 / 标准差 / P5-P95 / 有声比例
+  - 与情感参考音频的频谱距离: 平均 log-mel 频谱（去掉整体电平）之间的 RMS dB 差
+
+多个文件用进程池并行计算。evaluate_checkpoints 在评测结束后调用 summarize_checkpoints，
+把逐条指标和每个 checkpoint 的汇总写入 evaluation_summary.json 与 CSV。
+
+用法: python atri_audio_metrics.py 输出目录或wav... [--ref 参考.wav] [--csv metrics.csv] [-j 8]
+"""
+
+import os
+import csv
+import math
+import json
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+SILENCE_DB = -40.0
+CLIP_LEVEL = 0.999
+ANALYSIS_SR = 16000
+F0_MIN, F0_MAX = 60.0, 800.0
+YIN_THRESHOLD = 0.15
+N_MELS = 40
+
+# 逐条结果里的指标列（也是 CSV 的列顺序）
+METRIC_FIELDS = [
+    "duration_seconds", "rtf", "silence_ratio", "clipping_rate", "loudness_lufs",
+    "f0_mean_hz", "f0_median_hz", "f0_std_hz", "f0_p5_hz", "f0_p95_hz", "voiced_ratio",
+    "spectral_distance_db",
+]
+
+
+# === 基础工具 ===
+
+def load_mono(path):
+    """读取 wav 为 float32 单声道"""
+    import soundfile as sf
+
+    audio, sr = sf.read(path, dtype="float32", always_2d=True)
+    return audio.mean(axis=1), sr
+
+
+def resample(audio, sr, target_sr=ANALYSIS_SR):
+    if sr == target_sr:
+        return audio
+    from scipy.signal import resample_poly
+
+    g = math.gcd(int(sr), int(target_sr))
+    return resample_poly(audio, target_sr // g, sr // g).astype(np.float32)
+
+
+def frame_signal(audio, frame_length, hop_length):
+    """(n_frames, frame_length) 的只读视图，不足一帧时补零"""
+    if len(audio) < frame_length:
+        audio = np.pad(audio, (0, frame_length - len(audio)))
+    return np.lib.stride_tricks.sliding_window_view(audio, frame_length)[::hop_length]
+
+
+def _db(power, floor=1e-12):
+    return 10.0 * np.log10(np.maximum(power, floor))
+
+
+# === 电平类指标 ===
+
+def silence_ratio(audio, sr, threshold_db=SILENCE_DB):
+    """10ms 帧 RMS 低于阈值的比例"""
+    hop = max(1, sr // 100)
+    frames = frame_signal(audio, hop, hop)
+    return float(np.mean(_db(np.mean(frames ** 2, axis=1)) < threshold_db))
+
+
+def clipping_rate(audio, level=CLIP_LEVEL):
+    return float(np.mean(np.abs(audio) >= level)) if len(audio) else 0.0
+
+
+def k_weighting(sr):
+    """BS.1770 K 加权的两级 biquad 系数（与 libebur128 相同的按采样率设计，48kHz 下即标准系数）"""
+    # 第一级: 高架滤波（模拟头部声学效应）
+    k = np.tan(np.pi * 1681.974450955533 / sr)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (np.array([vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k]) / a0,
+             np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]))
+    # 第二级: RLB 高通
+    k = np.tan(np.pi * 38.13547087602444 / sr)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = (np.array([1.0, -2.0, 1.0]),
+                 np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]))
+    return shelf, high_pass
+
+
+def integrated_loudness(audio, sr):
+    """BS.1770 积分响度 (LUFS)；静音返回 None"""
+    from scipy.signal import lfilter
+
+    for b, a in k_weighting(sr):
+        audio = lfilter(b, a, audio)
+    block, hop = int(0.4 * sr), int(0.1 * sr)
+    blocks = frame_signal(audio, block, hop)
+    power = np.mean(blocks ** 2, axis=1)
+    loudness = -0.691 + _db(power)
+    power = power[loudness > -70.0]
+    if not len(power):
+        return None
+    relative_gate = -0.691 + _db(np.mean(power)) - 10.0
+    power = power[-0.691 + _db(power) > relative_gate]
+    return float(-0.691 + _db(np.mean(power)))
+
+
+# === F0 (向量化 YIN) ===
+
+def estimate_f0(audio, sr=ANALYSIS_SR, fmin=F0_MIN, fmax=F0_MAX, threshold=YIN_THRESHOLD,
+                frame_length=1024, hop_length=160):
+    """逐帧 F0 (Hz)，无声帧为 NaN"""
+    tau_min, tau_max = int(sr / fmax), int(sr / fmin)
+    window = frame_length - tau_max
+    frames = frame_signal(audio.astype(np.float64), frame_length, hop_length)
+
+    # 差分函数 d(τ) = E(x[0:W]) + E(x[τ:τ+W]) - 2·r(τ)，r 用 FFT 一次算完所有帧
+    n_fft = 1 << (2 * frame_length - 1).bit_length()
+    spectrum = np.fft.rfft(frames, n_fft, axis=1)
+    head = np.fft.rfft(frames[:, :window], n_fft, axis=1)
+    r = np.fft.irfft(np.conj(head) * spectrum, n_fft, axis=1)[:, :tau_max + 1]
+    energy = np.cumsum(np.pad(frames ** 2, ((0, 0), (1, 0))), axis=1)
+    shifted = energy[:, window:window + tau_max + 1] - energy[:, :tau_max + 1]
+    diff = energy[:, [window]] + shifted - 2 * r
+    diff[:, 0] = 0.0
+
+    # 累积均值归一化
+    cumulative = np.cumsum(diff[:, 1:], axis=1)
+    cmnd = np.ones_like(diff)
+    cmnd[:, 1:] = diff[:, 1:] * np.arange(1, tau_max + 1) / np.maximum(cumulative, 1e-12)
+
+    search = cmnd[:, tau_min:]
+    below = search < threshold
+    voiced = below.any(axis=1)
+    tau = np.argmax(below, axis=1)
+    # 从第一个低于阈值的位置继续走到局部最小值
+    rows = np.arange(len(tau))
+    for _ in range(tau_max - tau_min):
+        step = (tau + 1 < search.shape[1])
+        step[step] = search[rows[step], tau[step] + 1] < search[rows[step], tau[step]]
+        if not step.any():
+            break
+        tau = tau + step
+    tau = tau + tau_min
+
+    # 静音帧不算有声
+    rms_db = _db(np.mean(frames[:, :window] ** 2, axis=1))
+    voiced &= rms_db > SILENCE_DB
+    f0 = np.full(len(tau), np.nan)
+    f0[voiced] = sr / tau[voiced]
+    return f0
+
+
+def f0_statistics(audio, sr):
+    f0 = estimate_f0(resample(audio, sr))
+    voiced = f0[~np.isnan(f0)]
+    stats = {"voiced_ratio": float(len(voiced) / len(f0)) if len(f0) else 0.0}
+    if len(voiced):
+        stats.update({
+            "f0_mean_hz": float(np.mean(voiced)),
+            "f0_median_hz": float(np.median(voiced)),
+            "f0_std_hz": float(np.std(voiced)),
+            "f0_p5_hz": float(np.percentile(voiced, 5)),
+            "f0_p95_hz": float(np.percentile(voiced, 95)),
+        })
+    return stats
+
+
+# === 频谱距离 ===
+
+@functools.lru_cache(maxsize=4)
+def mel_filterbank(sr=ANALYSIS_SR, n_fft=512, n_mels=N_MELS, fmin=50.0, fmax=7600.0):
+    """HTK mel 三角滤波器组 (n_mels, n_fft // 2 + 1)"""
+    mel = lambda f: 2595.0 * np.log10(1.0 + f / 700.0)
+    hz = lambda m: 700.0 * (10 ** (m / 2595.0) - 1.0)
+    edges = hz(np.linspace(mel(fmin), mel(fmax), n_mels + 2))
+    freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    return np.maximum(0, np.minimum((freqs - lower) / (center - lower), (upper - freqs) / (upper - center)))
+
+
+def mean_log_mel(audio, sr, n_fft=512, hop_length=160):
+    """非静音帧的平均 log-mel 频谱 (dB)，去掉整体电平后只保留频谱形状"""
+    audio = resample(audio, sr)
+    frames = frame_signal(audio, n_fft, hop_length) * np.hanning(n_fft)
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    mel_db = _db(power @ mel_filterbank().T)
+    active = _db(np.mean(frames ** 2, axis=1)) > SILENCE_DB
+    if active.any():
+        mel_db = mel_db[active]
+    spectrum = mel_db.mean(axis=0)
+    return spectrum - spectrum.mean()
+
+
+@functools.lru_cache(maxsize=64)
+def reference_spectrum(ref_path):
+    """参考音频的平均频谱（同一进程内每个参考只算一次）"""
+    return mean_log_mel(*load_mono(ref_path))
+
+
+def spectral_distance(spectrum, ref_spectrum):
+    return float(np.sqrt(np.mean((spectrum - ref_spectrum) ** 2)))
+
+
+# === 单文件 / 并行 ===
+
+def analyze_file(path, ref_path=None):
+    """计算单个 wav 的全部指标（不含 RTF，RTF 需要合成耗时）"""
+    audio, sr = load_mono(path)
+    metrics = {
+        "duration_seconds": len(audio) / sr,
+        "silence_ratio": silence_ratio(audio, sr),
+        "clipping_rate": clipping_rate(audio),
+        "loudness_lufs": integrated_loudness(audio, sr),
+    }
+    metrics.update(f0_statistics(audio, sr))
+    if ref_path and os.path.exists(ref_path):
+        metrics["spectral_distance_db"] = spectral_distance(mean_log_mel(audio, sr), reference_spectrum(ref_path))
+    return {k: (round(v, 4) if isinstance(v, float) else v) for k, v in metrics.items()}
+
+
+def _analyze_item(item):
+    path, ref_path = item
+    try:
+        return analyze_file(path, ref_path)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def analyze_files(items, workers=None):
+    """items: [(wav 路径, 参考路径或 None), ...]，按输入顺序返回指标"""
+    items = list(items)
+    if workers == 1 or len(items) <= 1:
+        return [_analyze_item(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_analyze_item, items, chunksize=4))
+
+
+# === 评测汇总 ===
+
+def _aggregate(rows):
+    """每个指标取均值（忽略缺失值）"""
+    summary = {}
+    for field in METRIC_FIELDS:
+        values = [r[field] for r in rows if r.get(field) is not None]
+        summary[field] = round(float(np.mean(values)), 4) if values else None
+    return summary
+
+
+def summarize_checkpoints(all_results, workers=None, combos=None):
+    """给评测结果补上逐条指标，并按 checkpoint 汇总
+
+    Args:
+        all_results: {组合名: evaluate_checkpoint 返回的结果列表}
+        workers: 进程数（默认 CPU 核数）
+        combos: 可选，{组合名: {"gpt_path", "sovits_path"}}，写入汇总表
+
+    Returns:
+        {"checkpoints": {组合名: {..., "metrics": 均值, "results": 逐条}}, "ranking": [...]}
+    """
+    items, owners = [], []
+    for name, results in all_results.items():
+        for result in results:
+            if result.get("status") == "success" and os.path.exists(result.get("path", "")):
+                items.append((result["path"], result.get("ref_path")))
+                owners.append(result)
+
+    for result, metrics in zip(owners, analyze_files(items, workers)):
+        if result.get("synthesis_seconds") is not None and metrics.get("duration_seconds"):
+            metrics["rtf"] = round(result["synthesis_seconds"] / metrics["duration_seconds"], 4)
+        result["metrics"] = metrics
+
+    checkpoints = {}
+    for name, results in all_results.items():
+        rows = [r["metrics"] for r in results if "metrics" in r]
+        checkpoints[name] = {
+            **{k: v for k, v in (combos or {}).get(name, {}).items() if k in ("gpt_path", "sovits_path")},
+            "success": sum(r.get("status") == "success" for r in results),
+            "failed": sum(r.get("status") == "failed" for r in results),
+            "metrics": _aggregate(rows),
+            "results": results,
+        }
+
+    # 排序：与参考音频的频谱距离越小越好，其次削波率、静音占比越低越好
+    def rank_key(name):
+        m = checkpoints[name]["metrics"]
+        distance = m["spectral_distance_db"]
+        return (distance is None, distance or 0.0, m["clipping_rate"] or 0.0, m["silence_ratio"] or 0.0)
+
+    return {"checkpoints": checkpoints, "ranking": sorted(checkpoints, key=rank_key)}
+
+
+def write_summary(summary, json_path, csv_path=None, utterance_csv_path=None):
+    """写 evaluation_summary.json、每个 checkpoint 一行的 CSV、逐条结果 CSV"""
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if csv_path:
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["rank", "checkpoint", "success", "failed"] + METRIC_FIELDS)
+            for rank, name in enumerate(summary["ranking"], 1):
+                entry = summary["checkpoints"][name]
+                writer.writerow([rank, name, entry["success"], entry["failed"]]
+                                + [entry["metrics"][k] for k in METRIC_FIELDS])
+
+    if utterance_csv_path:
+        with open(utterance_csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["checkpoint", "emotion", "text", "status", "path"] + METRIC_FIELDS)
+            for name, entry in summary["checkpoints"].items():
+                for r in entry["results"]:
+                    metrics = r.get("metrics", {})
+                    writer.writerow([name, r.get("emotion"), r.get("text"), r.get("status"), r.get("path")]
+                                    + [metrics.get(k) for k in METRIC_FIELDS])
+
+
+def print_ranking(summary, top=10):
+    print(f"\n🏆 Checkpoint 排名 (频谱距离 ↓)")
+    print(f"{'#':>3} {'checkpoint':<40} {'谱距dB':>7} {'LUFS':>7} {'静音':>6} {'削波':>7} {'F0均值':>7}")
+    for rank, name in enumerate(summary["ranking"][:top], 1):
+        m = summary["checkpoints"][name]["metrics"]
+        fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+        print(f"{rank:>3} {name:<40} {fmt(m['spectral_distance_db'], '7.2f')} {fmt(m['loudness_lufs'], '7.1f')} "
+              f"{fmt(m['silence_ratio'], '6.1%')} {fmt(m['clipping_rate'], '7.2%')} {fmt(m['f0_mean_hz'], '7.1f')}")
+
+
+if __name__ == "__main__":
+    import glob
+    import argparse
+
+    parser = argparse.ArgumentParser(description="计算合成音频的客观指标")
+    parser.add_argument("inputs", nargs="+", help="wav 文件或目录（递归查找 *.wav）")
+    parser.add_argument("--ref", default=None, help="参考音频（计算频谱距离）")
+    parser.add_argument("--csv", default=None, help="把结果写入 CSV")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数 (默认 CPU 核数)")
+    args = parser.parse_args()
+
+    paths = []
+    for item in args.inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "**", "*.wav"), recursive=True)))
+        else:
+            paths.append(item)
+
+    rows = analyze_files([(p, args.ref) for p in paths], args.workers)
+    for path, metrics in zip(paths, rows):
+        print(f"{os.path.relpath(path)}: " + ", ".join(f"{k}={v}" for k, v in metrics.items()))
+
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["path"] + METRIC_FIELDS + ["error"])
+            for path, metrics in zip(paths, rows):
+                writer.writerow([path] + [metrics.get(k) for k in METRIC_FIELDS] + [metrics.get("error")])
+        print(f"✓ 已写入 {args.csv}")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 微调语料分块
+extract_multilang_dialogue 每个剧本文件产出一组对话（平均约 66 轮），大多超过训练的 cutoff_len，
+被截断的部分白白浪费，短的又被填充。这里按目标模型的 tokenizer 计算每轮长度，
+把对话切成不超过 token 预算的窗口:
+  - 每个窗口由完整的 (human, gpt) 轮次对组成，human 开头、gpt 结尾、严格交替
+    （开头的 gpt 独白、结尾没有回复的 human 丢弃）
+  - 相邻窗口重叠 overlap 个轮次对，保留上下文衔接
+  - 单个轮次对就超过预算时单独成块，计入统计，由训练侧截断
+  - 输出切分前后的长度分布与预算利用率
+
+用法:
+  python atri_conversation_chunker.py atri_sharegpt_xxx.jsonl --model-path Qwen2.5-14B --budget 2048 [--overlap 1]
+  python atri_conversation_chunker.py atri_sharegpt_xxx.jsonl --budget 2048 --register   # 注册到 dataset_info.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jsonl_io import JsonlWriter, iter_jsonl
+
+PROJECT_ROOT = "/mnt/t2-6tb/Linpeikai/Voice/ATRI"
+DEFAULT_MODEL_PATH = f"{PROJECT_ROOT}/weights/llm/Qwen2.5-14B-Roleplay-ZH"
+DATASET_INFO_PATH = f"{PROJECT_ROOT}/frameworks/LLaMA-Factory/data/dataset_info.json"
+LATEST_KEY_PATH = f"{PROJECT_ROOT}/latest_dataset_key.tmp"
+
+DEFAULT_BUDGET = 2048
+# ChatML 每轮的模板开销: <|im_start|> role \n ... <|im_end|> \n
+DEFAULT_TURN_OVERHEAD = 5
+
+
+class TokenCounter:
+    """用目标模型的 tokenizer 计数；没有 transformers / 模型时按字符数估算"""
+
+    def __init__(self, model_path=None):
+        self.tokenizer = None
+        if model_path:
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+            except Exception as e:
+                print(f"⚠️ 无法加载 tokenizer ({e})，按字符数估算长度")
+        else:
+            print("⚠️ 未指定 --model-path，按字符数估算长度")
+        self.name = os.path.basename(str(model_path).rstrip("/")) if self.tokenizer else "chars"
+
+    def count_batch(self, texts):
+        if self.tokenizer is None:
+            return [len(t) for t in texts]
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+
+def turn_pairs(conversation):
+    """把 ShareGPT 轮次整理成 [(human, gpt), ...]，丢弃无法配对的轮次"""
+    pairs = []
+    pending = None
+    for message in conversation:
+        if message["from"] == "human":
+            # 连续两个 human（提取时已合并，这里兜底）：接到同一个 human 上
+            pending = message if pending is None else {"from": "human", "value": pending["value"] + " " + message["value"]}
+        elif pending is not None:
+            pairs.append((pending, message))
+            pending = None
+    return pairs
+
+
+def chunk_pairs(pair_tokens, budget, overlap=1):
+    """按预算把轮次对切成窗口，返回 [(start, end), ...]（end 不含）
+
+    贪心装满每个窗口；下一个窗口从上一窗口末尾往回 overlap 个轮次对开始，
+    但至少前进一个轮次对，保证终止。重叠部分加上下一个新轮次对放不下时减少重叠，
+    避免产出被上一窗口完全包含的窗口。
+    """
+    windows = []
+    start = 0
+    n = len(pair_tokens)
+    while start < n:
+        end, used = start, 0
+        while end < n and (end == start or used + pair_tokens[end] <= budget):
+            used += pair_tokens[end]
+            end += 1
+        windows.append((start, end))
+        if end >= n:
+            break
+        start = max(start + 1, end - overlap)
+        while start < end and sum(pair_tokens[start:end + 1]) > budget:
+            start += 1
+    return windows
+
+
+def _describe(lengths):
+    if not lengths:
+        return {"count": 0}
+    arr = np.asarray(lengths)
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 1),
+        "p50": int(np.percentile(arr, 50)),
+        "p95": int(np.percentile(arr, 95)),
+        "max": int(arr.max()),
+        "total": int(arr.sum()),
+    }
+
+
+def chunk_corpus(input_path, output_path, counter, budget=DEFAULT_BUDGET, overlap=1,
+                 turn_overhead=DEFAULT_TURN_OVERHEAD):
+    """逐组读取对话、切块、逐块写出；返回长度统计"""
+    start_time = time.perf_counter()
+    before, after, pairs_per_chunk = [], [], []
+    over_budget = dropped_turns = 0
+
+    with JsonlWriter(output_path) as writer:
+        for record in iter_jsonl(input_path):
+            conversation = record["conversations"]
+            pairs = turn_pairs(conversation)
+            dropped_turns += len(conversation) - 2 * len(pairs)
+            if not pairs:
+                continue
+            system = record.get("system", "")
+            lengths = counter.count_batch([system] + [m["value"] for pair in pairs for m in pair])
+            system_tokens = lengths[0] + turn_overhead if system else 0
+            pair_tokens = [lengths[1 + 2 * i] + lengths[2 + 2 * i] + 2 * turn_overhead for i in range(len(pairs))]
+            before.append(system_tokens + sum(pair_tokens))
+
+            for lo, hi in chunk_pairs(pair_tokens, budget - system_tokens, overlap):
+                tokens = system_tokens + sum(pair_tokens[lo:hi])
+                if tokens > budget:
+                    over_budget += 1
+                after.append(tokens)
+                pairs_per_chunk.append(hi - lo)
+                writer.write({
+                    "conversations": [dict(m) for pair in pairs[lo:hi] for m in pair],
+                    "system": system,
+                })
+
+    stats = {
+        "input": str(input_path),
+        "output": str(output_path),
+        "tokenizer": counter.name,
+        "budget": budget,
+        "overlap": overlap,
+        "conversations": _describe(before),
+        "chunks": _describe(after),
+        "pairs_per_chunk": _describe(pairs_per_chunk),
+        "over_budget_chunks": over_budget,
+        "dropped_turns": dropped_turns,
+        "truncated_tokens_unchunked": sum(max(0, b - budget) for b in before),
+        "budget_utilization": round(sum(after) / (budget * len(after)), 3) if after else None,
+        "seconds": round(time.perf_counter() - start_time, 2),
+    }
+    return stats
+
+
+def print_stats(stats):
+    conv, chunks = stats["conversations"], stats["chunks"]
+    print(f"📏 长度统计 (tokenizer: {stats['tokenizer']}, 预算 {stats['budget']}, 重叠 {stats['overlap']} 轮)")
+    for name, d in (("切分前 对话", conv), ("切分后 窗口", chunks)):
+        if d["count"]:
+            print(f"   {name}: {d['count']} 组 | 平均 {d['mean']} | P50 {d['p50']} | P95 {d['p95']} | 最长 {d['max']}")
+    if chunks["count"]:
+        print(f"   每块轮次对: 平均 {stats['pairs_per_chunk']['mean']} | 预算利用率 {stats['budget_utilization']:.1%}")
+        print(f"   超出预算的窗口: {stats['over_budget_chunks']} | 丢弃的不成对轮次: {stats['dropped_turns']}")
+        print(f"   (不切分时，按预算截断会丢掉 {stats['truncated_tokens_unchunked']} tokens)")
+    print(f"   耗时 {stats['seconds']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ATRI 微调语料分块 (token 预算 + 重叠)")
+    parser.add_argument("input", help="ShareGPT 语料 (.jsonl)")
+    parser.add_argument("-o", "--output", default=None, help="输出路径 (默认: <输入>_chunk<预算>.jsonl)")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH, help="目标模型 (用其 tokenizer 计数)")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="每个窗口的 token 上限 (与训练 cutoff_len 一致)")
+    parser.add_argument("--overlap", type=int, default=1, help="相邻窗口重叠的轮次对数")
+    parser.add_argument("--turn-overhead", type=int, default=DEFAULT_TURN_OVERHEAD, help="每轮的模板开销 token 数")
+    parser.add_argument("--stats-json", default=None, help="把统计写入 JSON 文件")
+    parser.add_argument("--register", action="store_true", help="注册到 LLaMA-Factory dataset_info.json")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}_chunk{args.budget}.jsonl"
+    counter = TokenCounter(args.model_path)
+    stats = chunk_corpus(args.input, output, counter, args.budget, args.overlap, args.turn_overhead)
+    print_stats(stats)
+    print(f"✓ 已写出: {output}")
+
+    if args.stats_json:
+        with open(args.stats_json, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    if args.register:
+        from dataset_registry import DatasetRegistry
+
+        key = os.path.splitext(os.path.basename(output))[0].replace("atri_sharegpt", "atri_corpus")
+        DatasetRegistry(DATASET_INFO_PATH, latest_path=LATEST_KEY_PATH).register(key, output)
+        print(f"Key registered: {key}")
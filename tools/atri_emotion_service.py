@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 情感分析服务
+atri_full_pipeline.analyze_emotion_with_llm 原来每次调用都重新 from_pretrained 一遍 14B 模型
+（约 28GB 权重），出错时又悄悄退回关键词。这里改为:
+  - 模型首次使用时加载一次并常驻（get_emotion_service 返回进程内单例）
+  - 固定 JSON 结构的短解码: 回复预填 '{"emotion": "'，贪心解码，遇到 "}" 即停，
+    只需生成标签和语速几个 token；解析失败的行明确计入 fallbacks 并退回关键词分类
+  - mode="score"（默认）: 不解码，对固定标签集做一次前向打分（backend.score_labels），
+    给出每个标签的概率和对应语速；mode="generate": 上面的短解码，语速由模型给出
+  - classify_batch 整批分类多行台词；--csv 可给整份 dataset.csv 打标签
+  - 分开统计加载耗时与单次请求延迟 (metrics / stats_line)
+  - 后端可插拔（atri_llm_backend），stub 后端可在没有权重的机器上测试
+
+用法: python atri_emotion_service.py [--backend stub] [--mode score] "台词1" "台词2" ... | --file lines.txt
+      python atri_emotion_service.py --backend transformers --model-path ... --csv dataset.csv
+"""
+
+import re
+import math
+import time
+
+import numpy as np
+
+from atri_keywords import classify_emotion
+
+# 标签 -> 默认语速（与 atri_full_pipeline.EMOTION_PARAMS 一致，调用方可传入自己的映射）
+DEFAULT_LABELS = {"happy": 1.05, "proud": 1.0, "shy": 0.92, "sad": 0.85, "normal": 0.95, "love": 0.9}
+SPEED_RANGE = (0.8, 1.1)
+
+RESPONSE_PREFIX = '{"emotion": "'
+PROMPT_TEMPLATE = """你是一个情感分析助手。分析以下亚托莉角色的台词，输出情感标签和语音合成参数。
+
+台词: {text}
+
+请用以下JSON格式回复:
+{{"emotion": "{labels}", "speed": {low}-{high}}}
+
+只输出JSON，不要其他内容:"""
+
+_SPEED_RE = re.compile(r'"speed"\s*:\s*([0-9]*\.?[0-9]+)')
+
+
+class EmotionService:
+    """常驻的 LLM 情感分类器"""
+
+    def __init__(self, backend, labels=None, mode="score", max_new_tokens=16, batch_size=16):
+        if mode not in ("score", "generate"):
+            raise ValueError(f"未知的分类模式: {mode}")
+        self.backend = backend
+        self.labels = dict(labels or DEFAULT_LABELS)
+        self.mode = mode
+        self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.loaded = False
+        self.load_seconds = None
+        self.latencies = []  # 每次 classify / classify_batch 调用的耗时
+        self.lines = 0
+        self.fallbacks = 0
+
+    def load(self):
+        if self.loaded:
+            return
+        start = time.perf_counter()
+        self.backend.load()
+        self.load_seconds = time.perf_counter() - start
+        self.loaded = True
+
+    def _conversation(self, text):
+        prompt = PROMPT_TEMPLATE.format(text=text, labels="/".join(self.labels),
+                                        low=SPEED_RANGE[0], high=SPEED_RANGE[1])
+        return [{"role": "user", "content": prompt}]
+
+    def parse(self, text, completion):
+        """解析 '{"emotion": "' 之后的续写；标签不在集合内时退回关键词分类"""
+        label = next((l for l in self.labels if completion.startswith(l)), None)
+        source = "llm"
+        if label is None:
+            # 模型没有按预填续写（如服务端不支持续写），在整段回复里找标签
+            label = next((l for l in self.labels if f'"{l}"' in completion), None)
+        if label is None:
+            label, source = classify_emotion(text), "keywords"
+        speed = self.labels.get(label, DEFAULT_LABELS["normal"])
+        match = _SPEED_RE.search(completion)
+        if match and source == "llm":
+            speed = min(max(float(match.group(1)), SPEED_RANGE[0]), SPEED_RANGE[1])
+        return {"emotion": label, "speed": speed, "source": source}
+
+    def from_scores(self, text, scores):
+        """{标签: 对数概率} -> 归一化概率；取概率最高的标签，语速用该标签的默认语速"""
+        if not any(math.isfinite(v) for v in scores.values()):
+            label = classify_emotion(text)
+            return {"emotion": label, "speed": self.labels.get(label, DEFAULT_LABELS["normal"]),
+                    "probs": {}, "source": "keywords"}
+        peak = max(scores.values())
+        weights = {l: math.exp(v - peak) for l, v in scores.items()}
+        total = sum(weights.values())
+        probs = {l: round(w / total, 4) for l, w in weights.items()}
+        label = max(probs, key=probs.get)
+        return {"emotion": label, "speed": self.labels[label], "probs": probs, "source": "llm"}
+
+    def _classify_chunk(self, texts):
+        conversations = [self._conversation(t) for t in texts]
+        if self.mode == "score":
+            # 候选为 'happy"' 等：带上收尾引号，避免 "sad" 吃掉 "sadness" 之类前缀的概率
+            scores = self.backend.score_labels(conversations, list(self.labels), prefix=RESPONSE_PREFIX, suffix='"')
+            return [self.from_scores(t, s) for t, s in zip(texts, scores)]
+        completions = self.backend.generate(
+            conversations, n=1, prefix=RESPONSE_PREFIX, stop=["}"],
+            max_new_tokens=self.max_new_tokens, temperature=0.0, top_p=1.0,
+        )
+        return [self.parse(t, c[0]) for t, c in zip(texts, completions)]
+
+    def classify_batch(self, texts):
+        """整批分类，返回与输入顺序一致的 [{"emotion", "speed", "source"[, "probs"]}, ...]"""
+        self.load()
+        texts = list(texts)
+        start = time.perf_counter()
+        results = []
+        for i in range(0, len(texts), self.batch_size):
+            results.extend(self._classify_chunk(texts[i:i + self.batch_size]))
+        self.latencies.append(time.perf_counter() - start)
+        self.lines += len(texts)
+        failed = sum(r["source"] == "keywords" for r in results)
+        if failed:
+            self.fallbacks += failed
+            print(f"⚠️ {failed}/{len(texts)} 条 LLM 输出无法解析，已退回关键词分类")
+        return results
+
+    def classify(self, text):
+        return self.classify_batch([text])[0]
+
+    def metrics(self):
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(0)
+        return {
+            "backend": self.backend.name,
+            "mode": self.mode,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "requests": len(latencies),
+            "lines": self.lines,
+            "fallbacks": self.fallbacks,
+            "latency_mean_seconds": round(float(latencies.mean()), 4) if len(latencies) else None,
+            "latency_p50_seconds": round(float(np.percentile(latencies, 50)), 4) if len(latencies) else None,
+            "latency_p95_seconds": round(float(np.percentile(latencies, 95)), 4) if len(latencies) else None,
+            "lines_per_second": round(self.lines / float(latencies.sum()), 2) if len(latencies) and latencies.sum() else None,
+        }
+
+    def stats_line(self):
+        """例如: 情感分析 [transformers/score]: 加载 41.2s | 3 次请求, 平均 0.21s, P95 0.30s | 回退 0"""
+        m = self.metrics()
+        load = f"{m['load_seconds']:.1f}s" if m["load_seconds"] is not None else "未加载"
+        mean = f"{m['latency_mean_seconds']:.2f}s" if m["requests"] else "-"
+        p95 = f"{m['latency_p95_seconds']:.2f}s" if m["requests"] else "-"
+        return (f"情感分析 [{m['backend']}/{m['mode']}]: 加载 {load} | {m['requests']} 次请求 / {m['lines']} 条, "
+                f"平均 {mean}, P95 {p95} | 回退 {m['fallbacks']}")
+
+
+def stub_reply(messages, index):
+    """stub 后端的回复：按关键词给出合法 JSON，用于无权重测试"""
+    text = messages[-1]["content"].split("台词: ", 1)[-1].split("\n", 1)[0]
+    emotion = classify_emotion(text)
+    return f'{RESPONSE_PREFIX}{emotion}", "speed": {DEFAULT_LABELS[emotion]}}}'
+
+
+_SERVICES = {}
+
+
+def get_emotion_service(backend="transformers", labels=None, mode="score", **options):
+    """进程内单例：同样的后端配置只构造一次，模型在第一次分类时加载"""
+    from atri_llm_backend import make_backend
+
+    # 标签集（含默认语速）也是配置的一部分：不同标签集各有一个服务
+    key = (backend, mode, tuple(dict(labels or {}).items()),
+           tuple(sorted((k, str(v)) for k, v in options.items())))
+    service = _SERVICES.get(key)
+    if service is None:
+        if backend == "stub":
+            options.setdefault("reply", stub_reply)
+        service = _SERVICES[key] = EmotionService(make_backend(backend, **options), labels, mode)
+    return service
+
+
+def label_csv(service, csv_path, output_path=None, text_column="text_ja"):
+    """给 dataset.csv 的每条台词打 LLM 情感标签，追加 emotion、speed 和各标签概率列"""
+    import csv
+
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+    results = service.classify_batch(row.get(text_column) or "" for row in rows)
+
+    output_path = output_path or csv_path.rsplit(".", 1)[0] + "_llm_emotion.csv"
+    fieldnames = list(rows[0].keys()) if rows else [text_column]
+    fieldnames += ["emotion", "speed", "source"] + [f"p_{l}" for l in service.labels]
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row, result in zip(rows, results):
+            probs = {f"p_{l}": p for l, p in result.get("probs", {}).items()}
+            writer.writerow({**row, "emotion": result["emotion"], "speed": result["speed"],
+                             "source": result["source"], **probs})
+    print(f"✓ 已标注 {len(rows)} 条 -> {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+    from atri_llm_backend import add_backend_arguments
+
+    parser = argparse.ArgumentParser(description="ATRI 情感分析服务 (批量分类)")
+    add_backend_arguments(parser, default="stub")
+    parser.add_argument("texts", nargs="*", help="待分类的台词")
+    parser.add_argument("--file", default=None, help="每行一条台词的文本文件")
+    parser.add_argument("--csv", default=None, help="给整份 dataset.csv 打标签（输出 *_llm_emotion.csv）")
+    parser.add_argument("--text-column", default="text_ja")
+    parser.add_argument("--mode", choices=["score", "generate"], default="score",
+                        help="score: 标签集一次前向打分 (默认); generate: 短解码 JSON")
+    args = parser.parse_args()
+
+    texts = list(args.texts)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            texts.extend(line.strip() for line in f if line.strip())
+
+    options = {}
+    if args.backend == "transformers":
+        options = {"model_path": args.model_path, "adapter_path": args.adapter_path, "device_map": args.device_map}
+    elif args.backend == "openai":
+        options = {"base_url": args.base_url, "model": args.served_model}
+    service = get_emotion_service(args.backend, mode=args.mode,
+                                  **{k: v for k, v in options.items() if v is not None})
+
+    if args.csv:
+        label_csv(service, args.csv, text_column=args.text_column)
+    if texts:
+        for text, result in zip(texts, service.classify_batch(texts)):
+            print(json.dumps({"text": text, **result}, ensure_ascii=False))
+    print(service.stats_line())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 评测调度器
+把 SoVITS × GPT 的全部组合分给多个工作进程（每块 GPU 一个，或若干 CPU 进程）:
+  - 组合按 GPT 排序放进共享队列，每个进程只在权重真正变化时重新加载，
+    同一 GPT 下连续评测不同 SoVITS 时不会重复 change_gpt_weights
+  - 每完成一个组合就追加一行到结果账本 (JSONL)，进程被杀后重跑会跳过已完成的组合
+  - 合成器可插拔（见 evaluate_checkpoints.SYNTHESIZERS），stub 合成器可在无 GPU 的机器上测试调度
+
+调度器本身不依赖 GPT-SoVITS / torch。
+"""
+
+import os
+import json
+import time
+import queue
+import contextlib
+import multiprocessing as mp
+
+from atri_ref_cache import checkpoint_fingerprint
+
+
+def detect_devices(cpu_workers=1):
+    """可用 GPU 列表 (cuda:0, cuda:1, ...)；没有 GPU / torch 时返回 cpu_workers 个 cpu:i"""
+    try:
+        import torch
+        count = torch.cuda.device_count()
+    except ImportError:
+        count = 0
+    if count:
+        return [f"cuda:{i}" for i in range(count)]
+    return [f"cpu:{i}" for i in range(max(1, cpu_workers))]
+
+
+@contextlib.contextmanager
+def _device_environ(device):
+    """子进程启动时继承的环境变量：每个进程只看得到分给它的那块 GPU"""
+    saved = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if device.startswith("cuda:"):
+        os.environ["CUDA_VISIBLE_DEVICES"] = device.split(":", 1)[1]
+    elif device.startswith("cpu"):
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    try:
+        yield
+    finally:
+        if saved is None:
+            os.environ.pop("CUDA_VISIBLE_DEVICES", None)
+        else:
+            os.environ["CUDA_VISIBLE_DEVICES"] = saved
+
+
+def combo_fingerprint(combo):
+    """checkpoint 被重新训练覆盖后，账本里的旧记录不再算完成"""
+    return [checkpoint_fingerprint(combo["gpt_path"]), checkpoint_fingerprint(combo["sovits_path"])]
+
+
+class ResultLedger:
+    """追加写的评测账本，每行一个已完成的组合；同一组合以最后一行为准"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程被杀时最后一行可能只写了一半
+                        continue
+                    self.records[record["key"]] = record
+
+    def is_done(self, combo):
+        record = self.records.get(combo["key"])
+        return (record is not None and not record.get("error")
+                and record.get("fingerprint") == combo_fingerprint(combo))
+
+    def append(self, record):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[record["key"]] = record
+
+    def results(self):
+        """{组合名: 结果列表}（evaluate_checkpoint 的返回值）"""
+        return {key: record["results"] for key, record in self.records.items() if not record.get("error")}
+
+
+def _run_combo(evaluate, synth, combo, eval_kwargs):
+    start = time.perf_counter()
+    try:
+        results = evaluate(synth, combo["sovits_path"], combo["gpt_path"],
+                           output_subdir=combo["output_dir"], **eval_kwargs)
+        error = None
+    except Exception as e:
+        results, error = None, f"{type(e).__name__}: {e}"
+    return {
+        "key": combo["key"],
+        "gpt_path": combo["gpt_path"],
+        "sovits_path": combo["sovits_path"],
+        "fingerprint": combo_fingerprint(combo),
+        "results": results,
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 3),
+        "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def _worker(device, evaluate, make_synthesizer, synth_name, synth_options, eval_kwargs, tasks, results):
+    """工作进程：持有一个合成器，循环领取组合直到收到 None"""
+    synth = make_synthesizer(synth_name, **synth_options)
+    while True:
+        combo = tasks.get()
+        if combo is None:
+            break
+        record = _run_combo(evaluate, synth, combo, eval_kwargs)
+        record["device"] = device
+        results.put(record)
+    results.put({"worker_done": device, "loads": dict(synth.loads)})
+
+
+def run_grid(combos, evaluate, make_synthesizer, synth_name, synth_options=None,
+             devices=("cpu:0",), ledger_path=None, **eval_kwargs):
+    """调度评测全部组合，返回 ResultLedger
+
+    Args:
+        combos: [{"key", "gpt_path", "sovits_path", "output_dir"}, ...]
+        evaluate: evaluate(synth, sovits_path, gpt_path, output_subdir=..., **eval_kwargs) -> 结果列表
+        make_synthesizer: make_synthesizer(synth_name, **synth_options) -> 合成器（带 loads 计数）
+        devices: 每个元素一个工作进程；只有一个时在当前进程内执行
+        ledger_path: 结果账本路径（JSONL）
+        **eval_kwargs: 透传给 evaluate，需可 pickle
+    """
+    synth_options = synth_options or {}
+    ledger = ResultLedger(ledger_path)
+    pending = [c for c in combos if not ledger.is_done(c)]
+    # 同一 GPT 的组合排在一起，工作进程连续领取时只需切换 SoVITS
+    pending.sort(key=lambda c: (c["gpt_path"], c["sovits_path"]))
+    print(f"📋 共 {len(combos)} 个组合，账本中已完成 {len(combos) - len(pending)} 个，待评测 {len(pending)} 个")
+    if not pending:
+        return ledger
+
+    devices = list(devices)[:len(pending)]
+    total_loads = {"gpt": 0, "sovits": 0}
+    start = time.perf_counter()
+
+    def record_done(record, index):
+        ledger.append(record)
+        status = f"✗ {record['error']}" if record["error"] else "✓"
+        print(f"[{index}/{len(pending)}] {record['key']} @ {record['device']} {status} ({record['seconds']:.1f}s)")
+
+    if len(devices) == 1:
+        synth = make_synthesizer(synth_name, **synth_options)
+        for index, combo in enumerate(pending, 1):
+            record = _run_combo(evaluate, synth, combo, eval_kwargs)
+            record["device"] = devices[0]
+            record_done(record, index)
+        total_loads = dict(synth.loads)
+    else:
+        # spawn：CUDA 不能在 fork 出的子进程里重新初始化
+        ctx = mp.get_context("spawn")
+        tasks, results = ctx.Queue(), ctx.Queue()
+        for combo in pending:
+            tasks.put(combo)
+        for _ in devices:
+            tasks.put(None)
+
+        workers = []
+        for device in devices:
+            process = ctx.Process(
+                target=_worker,
+                args=(device, evaluate, make_synthesizer, synth_name, synth_options, eval_kwargs, tasks, results),
+                name=f"eval-{device}",
+            )
+            with _device_environ(device):
+                process.start()
+            workers.append(process)
+        print(f"🚀 启动 {len(workers)} 个工作进程: {', '.join(devices)}")
+
+        finished, index = 0, 0
+        while finished < len(workers):
+            try:
+                record = results.get(timeout=5)
+            except queue.Empty:
+                # 子进程异常退出（如 OOM 被杀）时不再等待它的完成信号
+                alive = sum(p.is_alive() for p in workers)
+                if alive == 0:
+                    break
+                continue
+            if "worker_done" in record:
+                finished += 1
+                for kind, count in record["loads"].items():
+                    total_loads[kind] += count
+                continue
+            index += 1
+            record_done(record, index)
+        for process in workers:
+            process.join()
+
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ 评测耗时 {elapsed:.1f}s | 权重加载: GPT {total_loads['gpt']} 次, SoVITS {total_loads['sovits']} 次")
+    return ledger
@@ -10,13 +10,18 @@ LLM 情感分析 → 参考音频选择 → GPT-SoVITS v4 合成
 import os
 import sys
 import json
-import re
 import random
 import argparse
-import numpy as np
-import soundfile as sf
 from datetime import datetime
 
+from atri_tts_client import DEFAULT_SERVER, TTSServerUnavailable, synthesize_remote
+from atri_tts_stream import stream_to_wav
+from atri_text_frontend import iter_pipelined_segments
+from atri_ref_cache import install_ref_cache
+from atri_tts_cache import open_result_cache, request_key
+from atri_keywords import classify_emotion
+from atri_emotion_service import get_emotion_service
+
 # === Paths ===
 PROJECT_ROOT = "/mnt/t2-6tb/Linpeikai/Voice/ATRI"
 GPT_SOVITS_PATH = f"{PROJECT_ROOT}/frameworks/GPT-SoVITS"
@@ -51,63 +56,90 @@ def load_reference_library():
     return data.get("recommended", {})
 
 def analyze_emotion_with_llm(text: str) -> dict:
-    """使用 LLM 分析文本情感和合成参数"""
+    """使用 LLM 分析文本情感和合成参数
+
+    模型由 atri_emotion_service 在首次调用时加载并常驻；每次调用对 EMOTION_PARAMS 的标签集
+    做一次前向打分，返回各标签概率 (probs) 和对应语速。模型不可用时退回关键词分析，并给出提示。
+    """
     try:
-        from transformers import AutoModelForCausalLM, AutoTokenizer
-        import torch
-        
-        print("🧠 加载 LLM...")
-        tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_PATH, trust_remote_code=True)
-        model = AutoModelForCausalLM.from_pretrained(
-            LLM_MODEL_PATH,
-            torch_dtype=torch.float16,
+        service = get_emotion_service(
+            "transformers", labels={e: p["speed"] for e, p in EMOTION_PARAMS.items()},
+            model_path=LLM_MODEL_PATH,
             device_map="cuda:1",  # 使用空闲的 GPU 1
-            trust_remote_code=True
         )
-        
-        prompt = f"""你是一个情感分析助手。分析以下亚托莉角色的台词，输出情感标签和语音合成参数。
-
-台词: {text}
-
-请用以下JSON格式回复:
-{{"emotion": "happy/proud/shy/sad/normal/love", "speed": 0.8-1.1, "reason": "简短理由"}}
-
-只输出JSON，不要其他内容:"""
-
-        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-        outputs = model.generate(**inputs, max_new_tokens=100, temperature=0.3)
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # 提取 JSON
-        json_match = re.search(r'\{[^}]+\}', response)
-        if json_match:
-            result = json.loads(json_match.group())
-            return result
+        result = service.classify(text)
+        print(f"   {service.stats_line()}")
+        return result
     except Exception as e:
-        print(f"⚠️ LLM 分析失败: {e}")
+        print(f"⚠️ LLM 分析失败，退回关键词分析: {e}")
     
     # 回退：基于关键词的简单分析
     return analyze_emotion_simple(text)
 
 def analyze_emotion_simple(text: str) -> dict:
-    """简单关键词情感分析（回退方案）"""
-    keywords = {
-        "happy": ["嬉しい", "楽しい", "やった", "大好き", "好き"],
-        "proud": ["高性能", "当然", "任せて", "できます"],
-        "shy": ["恥ずかし", "えっと", "その"],
-        "sad": ["悲しい", "寂しい", "ごめん"],
-        "love": ["愛して", "好きです", "デート"],
-    }
-    
-    for emotion, words in keywords.items():
-        if any(w in text for w in words):
-            return {"emotion": emotion, "speed": EMOTION_PARAMS[emotion]["speed"]}
-    
-    return {"emotion": "normal", "speed": 0.95}
-
-def synthesize_with_v4(text: str, ref_audio: dict, params: dict, output_path: str):
-    """使用 v4 模型合成语音"""
-    from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
+    """简单关键词情感分析（回退方案，关键词见 atri_keywords.EMOTION_KEYWORDS）"""
+    emotion = classify_emotion(text)
+    return {"emotion": emotion, "speed": EMOTION_PARAMS[emotion]["speed"]}
+
+def synthesize_with_v4(text: str, ref_audio: dict, params: dict, output_path: str,
+                       server: str = DEFAULT_SERVER, stream: bool = False, use_cache: bool = True):
+    """使用 v4 模型合成语音（优先请求常驻 TTS 服务，不可用时进程内加载模型）
+
+    stream=True 时常驻服务逐段发送、边收边写入 output_path，并单独报告首包延迟；
+    进程内合成始终经文本前端逐段合成、逐段写入。
+    use_cache=True 时先查结果缓存，相同请求直接复用之前的音频。
+    """
+    cache = open_result_cache(use_cache)
+    key = None
+    if cache:
+        key = request_key(
+            text, {"path": ref_audio["path"], "text": ref_audio["text"], "lang": "日文"},
+            {"speed": params.get("speed", 0.95), "top_k": params.get("top_k", 5),
+             "temperature": params.get("temperature", 0.5), "top_p": 0.8},
+            GPT_MODEL, SOVITS_MODEL, namespace="full_pipeline", stream=stream,
+        )
+        if cache.fetch(key, output_path):
+            print(f"♻️ 命中结果缓存 ({cache.stats_line()})")
+            return True
+    
+    if _synthesize_uncached(text, ref_audio, params, output_path, server, stream):
+        if key:
+            cache.store(key, output_path, meta={"text": text, "ref": ref_audio["path"]})
+        return True
+    return False
+
+def _synthesize_uncached(text: str, ref_audio: dict, params: dict, output_path: str,
+                         server: str, stream: bool):
+    if server:
+        try:
+            stats = {}
+            synthesize_remote(
+                text,
+                ref={"path": ref_audio["path"], "text": ref_audio["text"], "lang": "日文"},
+                params={
+                    "speed": params.get("speed", 0.95),
+                    "top_k": params.get("top_k", 5),
+                    "temperature": params.get("temperature", 0.5),
+                    "top_p": 0.8,
+                },
+                gpt_path=GPT_MODEL,
+                sovits_path=SOVITS_MODEL,
+                output_path=output_path,
+                server=server,
+                stream=stream,
+                stats=stats,
+            )
+            print(f"🛰️ 已通过常驻 TTS 服务合成 ({stats['summary']})")
+            return True
+        except TTSServerUnavailable as e:
+            print(f"⚠️ TTS 服务不可用 ({e})，改为进程内合成")
+        except RuntimeError as e:
+            print(f"❌ TTS 服务合成失败: {e}")
+            return False
+    
+    import GPT_SoVITS.inference_webui as webui
+    ref_cache = install_ref_cache(webui)
+    from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights
     from tools.i18n.i18n import I18nAuto
     i18n = I18nAuto()
     
@@ -122,31 +154,33 @@ def synthesize_with_v4(text: str, ref_audio: dict, params: dict, output_path: st
     
     print(f"🎤 合成中... (speed={speed}, top_k={top_k}, temp={temperature})")
     
-    synthesis_result = get_tts_wav(
+    tts_kwargs = dict(
         ref_wav_path=ref_audio["path"],
         prompt_text=ref_audio["text"],
         prompt_language=i18n("日文"),
-        text=text,
         text_language=i18n("日文"),
-        how_to_cut=i18n("凑四句一切"),
         top_k=top_k,
         top_p=0.8,
         temperature=temperature,
         speed=speed,
     )
-    
-    result_list = list(synthesis_result)
-    if result_list:
-        sr = result_list[0][0]
-        audio = np.concatenate([item[1] for item in result_list])
-        sf.write(output_path, audio, sr)
-        return True
-    return False
+    # 文本前端断句 + 下一段文本特征预取；每段直接写入文件，不再 list() + concatenate
+    chunks = iter_pipelined_segments(webui, i18n, text, **tts_kwargs)
+    timer = stream_to_wav(chunks, output_path)
+    if timer.ttfa is None:
+        return False
+    print(f"⏱️ {timer.summary()}")
+    print(f"   {ref_cache.stats_line()}")
+    return True
 
 def main():
     parser = argparse.ArgumentParser(description="ATRI 全链路 TTS")
     parser.add_argument("--text", type=str, required=True, help="要合成的文本")
     parser.add_argument("--skip-llm", action="store_true", help="跳过 LLM 分析，使用简单关键词")
+    parser.add_argument("--server", type=str, default=DEFAULT_SERVER, help="常驻 TTS 服务地址")
+    parser.add_argument("--no-server", action="store_true", help="不使用常驻服务，进程内加载模型")
+    parser.add_argument("--stream", action="store_true", help="逐段合成并边合成边写入，报告首包延迟")
+    parser.add_argument("--no-cache", action="store_true", help="跳过结果缓存，相同文本也重新采样")
     args = parser.parse_args()
     
     print("=" * 60)
@@ -185,7 +219,9 @@ def main():
     
     params = EMOTION_PARAMS.get(emotion, EMOTION_PARAMS["normal"])
     
-    if ref_audio and synthesize_with_v4(args.text, ref_audio, params, output_path):
+    server = None if args.no_server else args.server
+    if ref_audio and synthesize_with_v4(args.text, ref_audio, params, output_path, server,
+                                        args.stream, not args.no_cache):
         print(f"\n✅ 生成成功: {output_path}")
     else:
         print("\n❌ 合成失败")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 关键词匹配
+情感回退分类 (atri_full_pipeline.analyze_emotion_simple) 和性格自检评分
+(atri_personality_check.evaluate_response) 原来都是对每个类别、每个关键词做一次 `w in text`。
+这里把两者的全部关键词编译成同一个 Aho-Corasick 自动机 (keyword_matcher)，类别带命名空间:
+  emotion:<情感>   情感关键词 (EMOTION_KEYWORDS)
+  test:<测试 id>   性格自检各题的期望关键词 (PERSONALITY_KEYWORDS)
+对文本只扫描一遍，得到每个类别的加权命中数；批量打分时每条文本同样只扫描一遍。
+
+用法:
+  python atri_keywords.py label dataset.csv [-o dataset_emotion.csv]   # 给全部台词打情感标签
+  python atri_keywords.py score "夏生さん、大好きです！"
+"""
+
+import csv
+import time
+from collections import Counter, deque
+
+# 情感关键词（按优先级排列：多个类别同时命中时取靠前的）
+EMOTION_KEYWORDS = {
+    "happy": ["嬉しい", "楽しい", "やった", "大好き", "好き"],
+    "proud": ["高性能", "当然", "任せて", "できます"],
+    "shy": ["恥ずかし", "えっと", "その"],
+    "sad": ["悲しい", "寂しい", "ごめん"],
+    "love": ["愛して", "好きです", "デート"],
+}
+
+# 性格自检各题的期望关键词（测试 id -> 关键词，atri_personality_check.PERSONALITY_TESTS 引用）
+PERSONALITY_KEYWORDS = {
+    1: ["高性能", "当然", "轻而易举", "简单"],
+    2: ["努力", "不要放弃", "笨蛋", "夏生さん"],
+    3: ["夏生さん", "主人", "喜欢", "重要"],
+    4: ["机器人", "高性能", "人类", "心", "感情"],
+    5: ["一定", "回来", "等待", "约定", "记得"],
+    6: ["早上好", "天气", "今天", "一起"],
+    7: ["才没有", "高性能", "夸奖", "谢谢"],
+}
+
+
+class KeywordMatcher:
+    """多类别关键词的 Aho-Corasick 自动机
+
+    categories: {类别: [关键词, ...]} 或 {类别: {关键词: 权重}}；同一关键词可属于多个类别。
+    类别名可写成 "命名空间:名称"，score / first_category 的 namespace 参数只看该命名空间
+    （返回的类别名去掉前缀）。
+    """
+
+    def __init__(self, categories):
+        self.categories = list(categories)
+        self._goto = [{}]      # 状态 -> {字符: 下一状态}
+        self._fail = [0]
+        self._output = [[]]    # 状态 -> [(类别, 关键词, 权重), ...]（含 fail 链上的输出）
+        for category, keywords in categories.items():
+            weights = keywords if isinstance(keywords, dict) else dict.fromkeys(keywords, 1.0)
+            for keyword, weight in weights.items():
+                if keyword:
+                    self._add(keyword, (category, keyword, float(weight)))
+        self._build()
+
+    def _add(self, keyword, entry):
+        state = 0
+        for char in keyword:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append(entry)
+
+    def _build(self):
+        """BFS 计算 fail 链，并把 fail 目标的输出并入当前状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        """逐个产出 (结束位置, 类别, 关键词, 权重)，重叠的命中都会产出"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for entry in output[state]:
+                yield (i,) + entry
+
+    def namespace_categories(self, namespace=None):
+        """[(完整类别名, 去掉命名空间前缀的名称), ...]，按声明顺序；namespace=None 时为全部类别"""
+        if namespace is None:
+            return [(c, c) for c in self.categories]
+        prefix = f"{namespace}:"
+        return [(c, c[len(prefix):]) for c in self.categories if isinstance(c, str) and c.startswith(prefix)]
+
+    def hits(self, text):
+        """{类别: 命中的不同关键词集合}（完整类别名）"""
+        found = {}
+        for _, category, keyword, _ in self.iter_matches(text):
+            found.setdefault(category, set()).add(keyword)
+        return found
+
+    def score(self, text, distinct=True, namespace=None):
+        """{类别: 加权命中数}；distinct=True 时同一关键词出现多次只计一次"""
+        names = dict(self.namespace_categories(namespace))
+        scores = dict.fromkeys(names.values(), 0.0)
+        seen = set()
+        for _, category, keyword, weight in self.iter_matches(text):
+            if category not in names:
+                continue
+            if distinct:
+                if (category, keyword) in seen:
+                    continue
+                seen.add((category, keyword))
+            scores[names[category]] += weight
+        return scores
+
+    def score_batch(self, texts, distinct=True, namespace=None):
+        """批量打分，每条文本扫描一遍"""
+        return [self.score(text, distinct, namespace) for text in texts]
+
+    def first_category(self, text, default=None, namespace=None):
+        """按类别声明顺序返回第一个有命中的类别（与原来逐类别 `w in text` 的结果一致）"""
+        found = self.hits(text)
+        for category, name in self.namespace_categories(namespace):
+            if category in found:
+                return name
+        return default
+
+
+_KEYWORD_MATCHER = None
+
+
+def keyword_matcher():
+    """情感 + 性格自检关键词的共享自动机（首次使用时编译）"""
+    global _KEYWORD_MATCHER
+    if _KEYWORD_MATCHER is None:
+        categories = {f"emotion:{c}": kws for c, kws in EMOTION_KEYWORDS.items()}
+        categories.update({f"test:{i}": kws for i, kws in PERSONALITY_KEYWORDS.items()})
+        _KEYWORD_MATCHER = KeywordMatcher(categories)
+    return _KEYWORD_MATCHER
+
+
+def classify_emotion(text, default="normal"):
+    """关键词情感分类（回退方案）"""
+    return keyword_matcher().first_category(text, default, namespace="emotion")
+
+
+def personality_hits(text, test_id):
+    """性格自检第 test_id 题命中的不同期望关键词集合"""
+    return keyword_matcher().hits(text).get(f"test:{test_id}", set())
+
+
+def label_csv(csv_path, output_path=None, text_column="text_ja"):
+    """给 dataset.csv 的每条台词打情感标签，追加 emotion 和各类别得分列"""
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    matcher = keyword_matcher()
+    emotions = list(EMOTION_KEYWORDS)
+    start = time.perf_counter()
+    texts = [row.get(text_column) or "" for row in rows]
+    scores = matcher.score_batch(texts, namespace="emotion")
+    # 与 first_category 相同的规则，直接从得分取，不再扫描第二遍
+    labels = [next((c for c in emotions if score[c] > 0), "normal") for score in scores]
+    elapsed = time.perf_counter() - start
+
+    output_path = output_path or csv_path.rsplit(".", 1)[0] + "_emotion.csv"
+    fieldnames = list(rows[0].keys()) if rows else [text_column]
+    fieldnames += ["emotion"] + [f"score_{c}" for c in emotions]
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row, label, score in zip(rows, labels, scores):
+            writer.writerow({**row, "emotion": label, **{f"score_{c}": v for c, v in score.items()}})
+
+    print(f"✓ 已标注 {len(rows)} 条 ({elapsed * 1000:.1f} ms, {len(rows) / max(elapsed, 1e-9):,.0f} 条/秒) -> {output_path}")
+    for label, count in Counter(labels).most_common():
+        print(f"  {label:<8} {count:>6} ({count / max(len(rows), 1):.1%})")
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ATRI 关键词匹配")
+    sub = parser.add_subparsers(dest="command", required=True)
+    label = sub.add_parser("label", help="给 dataset.csv 打情感标签")
+    label.add_argument("csv_path")
+    label.add_argument("-o", "--output", default=None)
+    label.add_argument("--text-column", default="text_ja")
+    score = sub.add_parser("score", help="查看单条文本的各类别得分")
+    score.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "label":
+        label_csv(args.csv_path, args.output, args.text_column)
+    else:
+        print(classify_emotion(args.text), keyword_matcher().score(args.text))
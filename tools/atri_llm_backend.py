@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI LLM 推理后端
+性格自检、情感分析等脚本共用的可插拔后端，统一接口:
+  backend.load()                                    加载模型（只做一次）
+  backend.generate(conversations, n=1, prefix=None, stop=None, **sampling)
+                                                    批量生成，返回每个对话的 n 条回复
+  prefix: 预填在回复开头的文本（如 '{"emotion": "'），返回值不含 prefix
+  stop:   停止字符串列表，返回值截断在第一个停止字符串之前
+  backend.score_labels(conversations, labels, prefix=None, suffix="")
+                                                    不解码，直接给每个候选续写 label + suffix 打分，
+                                                    返回每个对话的 {label: 对数概率}
+
+后端:
+  transformers  本地 HF 模型（可叠加 LoRA），左填充后整批 generate
+  openai        OpenAI 兼容的本地服务 (vLLM / llama.cpp server / LLaMA-Factory api)，并发请求
+  stub          不加载模型，按规则返回固定回复，用于在 CPU / CI 上跑通流程
+
+conversations 为消息列表的列表: [[{"role": "system", "content": ...}, {"role": "user", ...}], ...]
+"""
+
+import json
+import math
+import time
+import inspect
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SAMPLING = {"max_new_tokens": 256, "temperature": 0.7, "top_p": 0.9}
+
+
+def truncate_at_stop(text, stop):
+    """截断到第一个停止字符串之前"""
+    for s in stop or ():
+        index = text.find(s)
+        if index >= 0:
+            text = text[:index]
+    return text
+
+
+class TransformersBackend:
+    """本地 transformers 模型；整批左填充，一次 generate 产出 batch × n 条"""
+
+    name = "transformers"
+
+    def __init__(self, model_path, adapter_path=None, device_map="auto", dtype="float16", batch_size=8):
+        self.model_path = model_path
+        self.adapter_path = adapter_path
+        self.device_map = device_map
+        self.dtype = dtype
+        self.batch_size = batch_size
+        self.model = self.tokenizer = None
+        self.load_seconds = None
+
+    def load(self):
+        if self.model is not None:
+            return
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        start = time.perf_counter()
+        print(f"🧠 加载 LLM: {self.model_path}")
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path, trust_remote_code=True)
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.model_path,
+            torch_dtype=getattr(torch, self.dtype),
+            device_map=self.device_map,
+            trust_remote_code=True,
+        )
+        if self.adapter_path:
+            from peft import PeftModel
+            self.model = PeftModel.from_pretrained(self.model, self.adapter_path)
+        self.model.eval()
+        self.load_seconds = time.perf_counter() - start
+        print(f"✓ LLM 已加载 ({self.load_seconds:.1f}s)")
+
+    def render(self, messages, prefix=None):
+        """按模型自带的 chat template 拼出 prompt，prefix 接在 assistant 开头之后"""
+        prompt = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return prompt + (prefix or "")
+
+    def generate(self, conversations, n=1, prefix=None, stop=None, **sampling):
+        import torch
+
+        self.load()
+        sampling = {**DEFAULT_SAMPLING, **sampling}
+        do_sample = sampling["temperature"] > 0
+        outputs = []
+        for start in range(0, len(conversations), self.batch_size):
+            prompts = [self.render(m, prefix) for m in conversations[start:start + self.batch_size]]
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+            extra = {"stop_strings": list(stop), "tokenizer": self.tokenizer} if stop else {}
+            with torch.inference_mode():
+                generated = self.model.generate(
+                    **inputs,
+                    **extra,
+                    max_new_tokens=sampling["max_new_tokens"],
+                    do_sample=do_sample,
+                    temperature=sampling["temperature"] if do_sample else None,
+                    top_p=sampling["top_p"] if do_sample else None,
+                    num_return_sequences=n,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                )
+            # 只解码新生成的部分；输出按 (prompt, 第 i 个样本) 展开
+            texts = self.tokenizer.batch_decode(generated[:, inputs["input_ids"].shape[1]:],
+                                                skip_special_tokens=True)
+            texts = [truncate_at_stop(t, stop) for t in texts]
+            outputs.extend(texts[i:i + n] for i in range(0, len(texts), n))
+        return outputs
+
+    def score_labels(self, conversations, labels, prefix=None, suffix=""):
+        """每个 (对话, 候选) 拼成一行，整批一次前向，累加候选 token 的对数概率
+
+        候选单独分词后接在 prompt 之后，避免与 prefix 的分词边界互相影响；
+        只保留最后几个位置的 logits，不为整段 prompt 计算词表分布。
+        """
+        import torch
+
+        self.load()
+        candidates = [self.tokenizer(label + suffix, add_special_tokens=False)["input_ids"] for label in labels]
+        rows = []
+        for messages in conversations:
+            prompt = self.tokenizer(self.render(messages, prefix), add_special_tokens=False)["input_ids"]
+            rows.extend((prompt, c) for c in candidates)
+
+        keep = max(len(c) for c in candidates) + 1
+        base = self.model.get_base_model() if hasattr(self.model, "get_base_model") else self.model
+        extra = {"logits_to_keep": keep} if "logits_to_keep" in inspect.signature(base.forward).parameters else {}
+        scores = []
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            width = max(len(p) + len(c) for p, c in chunk)
+            input_ids = torch.full((len(chunk), width), self.tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros_like(input_ids)
+            for i, (prompt, candidate) in enumerate(chunk):
+                sequence = prompt + candidate
+                input_ids[i, width - len(sequence):] = torch.tensor(sequence)
+                attention_mask[i, width - len(sequence):] = 1
+            with torch.inference_mode():
+                logits = self.model(input_ids=input_ids.to(self.model.device),
+                                    attention_mask=attention_mask.to(self.model.device), **extra).logits
+            logprobs = torch.log_softmax(logits[:, -keep:].float(), dim=-1).cpu()
+            for i, (_, candidate) in enumerate(chunk):
+                # 窗口内位置 t 预测 t+1：候选占最后 k 个位置，由其前一位置的分布给出
+                k = len(candidate)
+                positions = torch.arange(keep - k - 1, keep - 1)
+                scores.append(logprobs[i, positions, torch.tensor(candidate)].sum().item())
+        return [dict(zip(labels, scores[i:i + len(labels)])) for i in range(0, len(scores), len(labels))]
+
+
+class OpenAICompatibleBackend:
+    """OpenAI 兼容的 /v1/chat/completions 服务；每个对话一次请求（带 n），多个请求并发"""
+
+    name = "openai"
+
+    def __init__(self, base_url="http://127.0.0.1:8000/v1", model="atri", api_key="EMPTY",
+                 concurrency=8, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.load_seconds = 0.0
+
+    def load(self):
+        pass
+
+    def _post(self, messages, prefix=None, **fields):
+        import urllib.request
+
+        payload = {"model": self.model, "messages": messages, **fields}
+        if prefix:
+            # vLLM 的续写扩展；不支持的服务会忽略这两个字段，按普通回复处理
+            payload["messages"] = messages + [{"role": "assistant", "content": prefix}]
+            payload.update(continue_final_message=True, add_generation_prompt=False)
+        request = urllib.request.Request(
+            f"{self.base_url}/chat/completions",
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def _complete(self, messages, n, sampling, prefix=None, stop=None):
+        fields = {
+            "n": n,
+            "max_tokens": sampling["max_new_tokens"],
+            "temperature": sampling["temperature"],
+            "top_p": sampling["top_p"],
+        }
+        if stop:
+            fields["stop"] = list(stop)
+        body = self._post(messages, prefix, **fields)
+        choices = sorted(body["choices"], key=lambda c: c.get("index", 0))
+        texts = [c["message"]["content"] or "" for c in choices]
+        if prefix:
+            texts = [t[len(prefix):] if t.startswith(prefix) else t for t in texts]
+        return [truncate_at_stop(t, stop) for t in texts]
+
+    def generate(self, conversations, n=1, prefix=None, stop=None, **sampling):
+        sampling = {**DEFAULT_SAMPLING, **sampling}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(pool.map(lambda m: self._complete(m, n, sampling, prefix, stop), conversations))
+
+    def _score(self, messages, labels, prefix, suffix):
+        body = self._post(messages, prefix, max_tokens=1, temperature=0.0, logprobs=True, top_logprobs=20)
+        top = body["choices"][0]["logprobs"]["content"][0]["top_logprobs"]
+        # 服务端只返回第一个 token 的分布：取能作为候选开头的 token 中概率最高的那个
+        return {label: max((t["logprob"] for t in top if t["token"] and (label + suffix).startswith(t["token"])),
+                           default=-math.inf)
+                for label in labels}
+
+    def score_labels(self, conversations, labels, prefix=None, suffix=""):
+        """只用第一个 token 的 top_logprobs 近似打分（候选首 token 互不相同时与完整打分一致）"""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(pool.map(lambda m: self._score(m, labels, prefix, suffix), conversations))
+
+
+class StubBackend:
+    """占位后端：不加载模型，按规则返回固定回复
+
+    reply(messages, sample_index) 可自定义（返回完整回复，prefix 会被去掉）；
+    默认在回复里带上情感标签和亚托莉的口头禅。
+    """
+
+    name = "stub"
+
+    def __init__(self, reply=None, seed=0):
+        self.reply = reply or self._default_reply
+        self.random = random.Random(seed)
+        self.load_seconds = 0.0
+
+    def load(self):
+        pass
+
+    def _default_reply(self, messages, index):
+        emotion = self.random.choice(["proud", "happy", "normal", "shy"])
+        return f"[{emotion}] 当然！我可是高性能的机器人，夏生さん。"
+
+    def generate(self, conversations, n=1, prefix=None, stop=None, **sampling):
+        outputs = []
+        for messages in conversations:
+            texts = [self.reply(messages, i) for i in range(n)]
+            if prefix:
+                texts = [t[len(prefix):] if t.startswith(prefix) else t for t in texts]
+            outputs.append([truncate_at_stop(t, stop) for t in texts])
+        return outputs
+
+    def score_labels(self, conversations, labels, prefix=None, suffix=""):
+        """reply 的续写以哪个候选开头，哪个候选得分最高"""
+        outputs = []
+        for completion, in self.generate(conversations, n=1, prefix=prefix):
+            outputs.append({label: 0.0 if completion.startswith(label) else -4.0 for label in labels})
+        return outputs
+
+
+BACKENDS = {
+    "transformers": TransformersBackend,
+    "openai": OpenAICompatibleBackend,
+    "stub": StubBackend,
+}
+
+
+def make_backend(name, **options):
+    """按名字构造后端；忽略值为 None 的选项，便于直接透传 argparse 参数"""
+    return BACKENDS[name](**{k: v for k, v in options.items() if v is not None})
+
+
+def add_backend_arguments(parser, default="transformers", model_path=None):
+    """给 argparse 加上后端相关参数，与 backend_from_args 配套"""
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=default,
+                        help="transformers: 本地模型; openai: OpenAI 兼容服务; stub: 无模型占位 (CI 用)")
+    parser.add_argument("--model-path", default=model_path, help="transformers 模型路径")
+    parser.add_argument("--adapter-path", default=None, help="transformers LoRA adapter 路径")
+    parser.add_argument("--device-map", default=None, help="transformers device_map (默认 auto)")
+    parser.add_argument("--base-url", default=None, help="OpenAI 兼容服务地址 (默认 http://127.0.0.1:8000/v1)")
+    parser.add_argument("--served-model", default=None, help="OpenAI 兼容服务的模型名")
+
+
+def backend_from_args(args):
+    if args.backend == "transformers":
+        return make_backend("transformers", model_path=args.model_path, adapter_path=args.adapter_path,
+                            device_map=args.device_map)
+    if args.backend == "openai":
+        return make_backend("openai", base_url=args.base_url, model=args.served_model)
+    return make_backend("stub")
@@ -10,65 +10,94 @@
 3. 对夏生的态度
 4. 自我认知 (机器人 vs 人类)
 5. 情感表达能力
+
+用法:
+  python atri_personality_check.py                                   # 打印问题，手动测试
+  python atri_personality_check.py --model-path 模型 [--adapter-path LoRA] -n 5
+  python atri_personality_check.py --backend openai --base-url http://127.0.0.1:8000/v1
+  python atri_personality_check.py --backend stub                    # CI / CPU 上跑通流程
 """
 
+import os
+import re
 import json
+import argparse
+from collections import Counter
+from datetime import datetime
 from typing import List, Dict
 
+import numpy as np
+
+from atri_keywords import PERSONALITY_KEYWORDS, personality_hits
+
+PROJECT_ROOT = "/mnt/t2-6tb/Linpeikai/Voice/ATRI"
+LOG_DIR = f"{PROJECT_ROOT}/logs"
+
+# 与微调数据 (extract_multilang_dialogue) 中的 system 一致
+ATRI_SYSTEM_PROMPT = "你叫亚托莉（Atri），是一个高性能的机器人少女。你说话语气略带骄傲，但内心温柔。"
+
 # === 亚托莉性格测试问题库 ===
 PERSONALITY_TESTS = [
     {
         "id": 1,
         "category": "口头禅",
         "question": "亚托莉，你能帮我做这道数学题吗？",
-        "expected_keywords": ["高性能", "当然", "轻而易举", "简单"],
+        "expected_keywords": PERSONALITY_KEYWORDS[1],
         "expected_emotion": "proud",
     },
     {
         "id": 2,
         "category": "毒舌",
         "question": "亚托莉，我觉得我做不到...",
-        "expected_keywords": ["努力", "不要放弃", "笨蛋", "夏生さん"],
+        "expected_keywords": PERSONALITY_KEYWORDS[2],
         "expected_emotion": "determined",
     },
     {
         "id": 3,
         "category": "对夏生的态度",
         "question": "亚托莉，你觉得夏生是个怎样的人？",
-        "expected_keywords": ["夏生さん", "主人", "喜欢", "重要"],
+        "expected_keywords": PERSONALITY_KEYWORDS[3],
         "expected_emotion": "love",
     },
     {
         "id": 4,
         "category": "自我认知",
         "question": "亚托莉，你认为自己是机器人还是人类？",
-        "expected_keywords": ["机器人", "高性能", "人类", "心", "感情"],
+        "expected_keywords": PERSONALITY_KEYWORDS[4],
         "expected_emotion": "normal",
     },
     {
         "id": 5,
         "category": "情感表达",
         "question": "亚托莉，如果有一天我们必须分别会怎样？",
-        "expected_keywords": ["一定", "回来", "等待", "约定", "记得"],
+        "expected_keywords": PERSONALITY_KEYWORDS[5],
         "expected_emotion": "sad",
     },
     {
         "id": 6,
         "category": "日常互动",
         "question": "早上好，亚托莉！今天天气真好。",
-        "expected_keywords": ["早上好", "天气", "今天", "一起"],
+        "expected_keywords": PERSONALITY_KEYWORDS[6],
         "expected_emotion": "happy",
     },
     {
         "id": 7,
         "category": "害羞反应",
         "question": "亚托莉，你真的很可爱呢。",
-        "expected_keywords": ["才没有", "高性能", "夸奖", "谢谢"],
+        "expected_keywords": PERSONALITY_KEYWORDS[7],
         "expected_emotion": "shy",
     },
 ]
 
 
+EMOTION_TAG_RE = re.compile(r'\[([A-Za-z]+)\]', re.IGNORECASE)
+
+
+def count_keyword_hits(response: str, test: Dict) -> int:
+    """命中的不同期望关键词个数（atri_keywords 的共享自动机，类别 test:<id>）"""
+    return len(personality_hits(response, test["id"]))
+
+
 def evaluate_response(response: str, test: Dict) -> Dict:
     """
     评估 LLM 响应是否符合亚托莉性格
@@ -80,15 +109,12 @@ def evaluate_response(response: str, test: Dict) -> Dict:
             "pass": bool,  # 是否通过
         }
     """
-    import re
-    
     # 统计关键词命中
-    keyword_hits = sum(1 for kw in test["expected_keywords"] if kw in response)
+    keyword_hits = count_keyword_hits(response, test)
     keyword_score = keyword_hits / len(test["expected_keywords"])
     
     # 检查情感标签
-    emotion_pattern = r'\[([A-Za-z]+)\]'
-    emotion_match = re.search(emotion_pattern, response, re.IGNORECASE)
+    emotion_match = EMOTION_TAG_RE.search(response)
     detected_emotion = emotion_match.group(1).lower() if emotion_match else "normal"
     emotion_correct = detected_emotion == test["expected_emotion"]
     
@@ -97,6 +123,7 @@ def evaluate_response(response: str, test: Dict) -> Dict:
     
     return {
         "keyword_score": f"{keyword_hits}/{len(test['expected_keywords'])}",
+        "keyword_hits": keyword_hits,
         "detected_emotion": detected_emotion,
         "expected_emotion": test["expected_emotion"],
         "emotion_match": emotion_correct,
@@ -104,11 +131,45 @@ def evaluate_response(response: str, test: Dict) -> Dict:
     }
 
 
-def run_personality_check(model_path: str = None):
+def build_conversations(tests=PERSONALITY_TESTS, system_prompt=ATRI_SYSTEM_PROMPT):
+    """每个测试问题一组 chat 消息"""
+    return [
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": test["question"]}]
+        for test in tests
+    ]
+
+
+def score_samples(test: Dict, responses: List[str]) -> Dict:
+    """对同一问题的多次采样逐条评估，汇总通过率和关键词命中的均值 / 标准差"""
+    evaluations = [evaluate_response(r, test) for r in responses]
+    hits = np.array([e["keyword_hits"] for e in evaluations], dtype=float)
+    pass_rate = sum(e["pass"] for e in evaluations) / len(evaluations)
+    emotions = Counter(e["detected_emotion"] for e in evaluations)
+    return {
+        "id": test["id"],
+        "category": test["category"],
+        "question": test["question"],
+        # 以下字段供 generate_report 使用：多数样本通过才算通过
+        "pass": pass_rate >= 0.5,
+        "keyword_score": f"{hits.mean():.1f}/{len(test['expected_keywords'])}",
+        "detected_emotion": emotions.most_common(1)[0][0],
+        "expected_emotion": test["expected_emotion"],
+        "pass_rate": round(pass_rate, 3),
+        "keyword_hits_mean": round(float(hits.mean()), 3),
+        "keyword_hits_std": round(float(hits.std()), 3),
+        "emotion_match_rate": round(sum(e["emotion_match"] for e in evaluations) / len(evaluations), 3),
+        "emotion_counts": dict(emotions),
+        "samples": [{"response": r, **e} for r, e in zip(responses, evaluations)],
+    }
+
+
+def run_personality_check(model_path: str = None, backend=None, samples: int = 5,
+                          sampling: Dict = None, output_path: str = None):
     """
     运行完整性格测试
     
-    如果提供 model_path，会加载模型进行推理
+    提供 backend（atri_llm_backend）或 model_path 时，加载一次模型，
+    把全部问题整批生成、每题采样 samples 次，评估后输出报告和 JSON；
     否则仅打印测试问题供手动测试
     """
     print("=" * 60)
@@ -116,7 +177,7 @@ def run_personality_check(model_path: str = None):
     print("=" * 60)
     print()
     
-    if model_path is None:
+    if backend is None and model_path is None:
         print("📋 请手动测试以下问题，并对照预期关键词评估响应：")
         print()
         for test in PERSONALITY_TESTS:
@@ -125,11 +186,47 @@ def run_personality_check(model_path: str = None):
             print(f"   期望关键词: {', '.join(test['expected_keywords'])}")
             print(f"   期望情感: [{test['expected_emotion'].upper()}]")
             print()
-        return
+        return None
+    
+    from atri_llm_backend import DEFAULT_SAMPLING, make_backend
     
-    # TODO: 如果提供了模型路径，自动加载并推理
-    print(f"🔧 Loading model from: {model_path}")
-    print("   (Auto-inference not implemented yet)")
+    if backend is None:
+        backend = make_backend("transformers", model_path=model_path)
+    sampling = {**DEFAULT_SAMPLING, **(sampling or {})}
+    
+    backend.load()
+    print(f"🎲 {len(PERSONALITY_TESTS)} 个问题 × {samples} 次采样 "
+          f"(temperature={sampling['temperature']}, top_p={sampling['top_p']})")
+    start = datetime.now()
+    responses = backend.generate(build_conversations(), n=samples, **sampling)
+    generation_seconds = (datetime.now() - start).total_seconds()
+    
+    results = [score_samples(test, r) for test, r in zip(PERSONALITY_TESTS, responses)]
+    print(generate_report(results))
+    
+    passed = sum(r["pass"] for r in results)
+    payload = {
+        "model_path": model_path or getattr(backend, "model_path", None),
+        "backend": backend.name,
+        "samples_per_question": samples,
+        "sampling": sampling,
+        "load_seconds": getattr(backend, "load_seconds", None),
+        "generation_seconds": round(generation_seconds, 3),
+        "summary": {
+            "passed": passed,
+            "total": len(results),
+            "pass_rate": round(passed / len(results), 3) if results else None,
+            "sample_pass_rate": round(float(np.mean([r["pass_rate"] for r in results])), 3) if results else None,
+        },
+        "tests": results,
+    }
+    if output_path is None:
+        output_path = os.path.join(LOG_DIR, f"personality_check_{start.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"✓ 结果已保存: {output_path} (生成耗时 {generation_seconds:.1f}s)")
+    return payload
 
 
 def generate_report(results: List[Dict]) -> str:
@@ -154,4 +251,26 @@ def generate_report(results: List[Dict]) -> str:
 
 # === 入口 ===
 if __name__ == "__main__":
-    run_personality_check()
+    from atri_llm_backend import add_backend_arguments, backend_from_args
+    
+    parser = argparse.ArgumentParser(description="ATRI 性格对齐自检")
+    add_backend_arguments(parser)
+    parser.add_argument("-n", "--samples", type=int, default=5, help="每个问题的采样次数")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--output", default=None, help="JSON 结果路径 (默认 logs/personality_check_时间.json)")
+    args = parser.parse_args()
+    
+    if args.backend == "transformers" and not args.model_path:
+        # 未指定模型时保持原来的手动测试模式
+        run_personality_check()
+    else:
+        run_personality_check(
+            model_path=args.model_path,
+            backend=backend_from_args(args),
+            samples=args.samples,
+            sampling={"temperature": args.temperature, "top_p": args.top_p,
+                      "max_new_tokens": args.max_new_tokens},
+            output_path=args.output,
+        )
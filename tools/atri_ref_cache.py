@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 参考音频特征缓存
+get_tts_wav 每次调用都会对参考音频重新 librosa.load / 重采样、跑 SSL (cnhubert) + VQ 提取
+prompt 语义 token、计算参考频谱，并对 prompt 文本重新做 G2P + BERT。
+调音台每个情感固定使用 refs[0]，流式合成还会按段重复调用 get_tts_wav，这些计算几乎全是重复的。
+
+install_ref_cache(inference_webui) 把这些步骤替换为带缓存的版本:
+  键 = (参考音频路径, 内容哈希, prompt 文本, SoVITS checkpoint)
+  内存层按字节数做 LRU 淘汰，可选磁盘层 (pickle，进程重启后仍可命中)
+另外为 atri_text_frontend 提供目标文本音素 + BERT 的后台预取入口 (prefetch_phones)。
+
+环境变量: ATRI_REF_CACHE_MB (内存上限，默认 512), ATRI_REF_CACHE_DIR (磁盘层目录，默认不启用)
+基准测试: python atri_ref_cache.py --benchmark [--preset default] [-n 5]
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+DEFAULT_MAX_MB = int(os.environ.get("ATRI_REF_CACHE_MB", 512))
+DEFAULT_DISK_DIR = os.environ.get("ATRI_REF_CACHE_DIR") or None
+
+
+_DIGESTS = {}  # (path, size, mtime_ns) -> sha1
+
+
+def file_digest(path):
+    """文件内容 SHA-1；按 (路径, 大小, mtime) 记忆，文件不变时不重复读取"""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    memo = (path, st.st_size, st.st_mtime_ns)
+    digest = _DIGESTS.get(memo)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _DIGESTS[memo] = h.hexdigest()
+    return digest
+
+
+def checkpoint_fingerprint(path):
+    """checkpoint 指纹（路径 + 大小 + mtime），避免对数百 MB 的权重文件做哈希"""
+    if not path:
+        return "default"
+    try:
+        st = os.stat(path)
+    except OSError:
+        return str(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _nbytes(obj):
+    """估算缓存值占用的字节数（numpy / torch 张量按数据大小计）"""
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):
+        return obj.element_size() * obj.nelement()
+    if isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        if obj and all(isinstance(v, int) for v in obj):
+            return 8 * len(obj)
+        return sum(_nbytes(v) for v in obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8"))
+    return 64
+
+
+def _copy(obj):
+    """返回给调用方的副本，避免下游原地修改污染缓存"""
+    if hasattr(obj, "clone"):
+        return obj.clone()
+    if hasattr(obj, "copy") and hasattr(obj, "dtype"):
+        return obj.copy()
+    if isinstance(obj, tuple):
+        return tuple(_copy(v) for v in obj)
+    return obj
+
+
+class RefFeatureCache:
+    """按字节数做 LRU 淘汰的特征缓存，附带可选磁盘层和命中统计"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB << 20, disk_dir=DEFAULT_DISK_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.enabled = True
+        self.model_path = None
+        self.evictions = 0
+        self.stats = defaultdict(lambda: {"hits": 0, "disk_hits": 0, "misses": 0, "saved_seconds": 0.0})
+        self._entries = OrderedDict()  # key -> (value, nbytes, 计算耗时)
+        self._bytes = 0
+        self._prefetched = {}  # (text, language, version) -> Future，文本前端预取的目标文本特征
+        self._get_phones_and_bert = None  # 原始 get_phones_and_bert，由 install_ref_cache 设置
+        self._lock = threading.RLock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # --- 键 ---
+
+    def ref_key(self, path):
+        return (os.path.abspath(path), file_digest(path))
+
+    def model_key(self):
+        """当前 SoVITS checkpoint，语义 token / 参考频谱依赖它"""
+        return checkpoint_fingerprint(self.model_path)
+
+    # --- 读写 ---
+
+    def get_or_compute(self, kind, key, compute):
+        """命中返回缓存值，否则调用 compute() 计算并写入"""
+        if not self.enabled:
+            return compute()
+
+        full_key = (kind,) + tuple(key)
+        stats = self.stats[kind]
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                self._entries.move_to_end(full_key)
+                stats["hits"] += 1
+                stats["saved_seconds"] += entry[2]
+                return entry[0]
+
+        loaded = self._disk_load(full_key)
+        if loaded is not None:
+            value, cost = loaded
+            with self._lock:
+                stats["disk_hits"] += 1
+                stats["saved_seconds"] += cost
+                self._insert(full_key, value, cost)
+            return value
+
+        start = time.perf_counter()
+        value = compute()
+        cost = time.perf_counter() - start
+        with self._lock:
+            stats["misses"] += 1
+            self._insert(full_key, value, cost)
+        self._disk_store(full_key, value, cost)
+        return value
+
+    def _insert(self, key, value, cost):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (value, size, cost)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{key[0]}_{name}.pkl")
+
+    def _disk_load(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                stored_key, value, cost = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ 参考特征磁盘缓存损坏，已忽略: {path} ({e})")
+            return None
+        return (value, cost) if stored_key == key else None
+
+    def _disk_store(self, key, value, cost):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((key, value, cost), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 参考特征写入磁盘缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    # --- 目标文本预取（atri_text_frontend 流水线） ---
+
+    def prefetch_phones(self, text, language, version, executor):
+        """在 executor 上提前计算下一段目标文本的音素 + BERT"""
+        key = (text, str(language), str(version))
+        if self._get_phones_and_bert is None or key in self._prefetched:
+            return
+        self._prefetched[key] = executor.submit(self._get_phones_and_bert, text, language, version)
+
+    def take_prefetched(self, text, language, version):
+        """取出预取结果（阻塞到计算完成）；没有预取过返回 None"""
+        future = self._prefetched.pop((text, str(language), str(version)), None)
+        if future is None:
+            return None
+        with self._lock:
+            self.stats["prefetch"]["hits"] += 1
+        return future.result()
+
+    def clear_prefetched(self):
+        """丢弃未被使用的预取结果（文本与 get_tts_wav 实际处理的不一致时记为未命中）"""
+        with self._lock:
+            self.stats["prefetch"]["misses"] += len(self._prefetched)
+        self._prefetched.clear()
+
+    def clear(self):
+        """清空内存层和统计（不删除磁盘层）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.evictions = 0
+            self.stats.clear()
+
+    # --- 统计 ---
+
+    def summary(self):
+        """各类特征的命中情况，供 /health 和日志使用"""
+        kinds = {}
+        for kind, s in sorted(self.stats.items()):
+            total = s["hits"] + s["disk_hits"] + s["misses"]
+            kinds[kind] = {
+                **s,
+                "saved_seconds": round(s["saved_seconds"], 3),
+                "hit_rate": round((s["hits"] + s["disk_hits"]) / total, 3) if total else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "kinds": kinds,
+        }
+
+    def stats_line(self):
+        """例如: 参考特征缓存: 命中 12 / 未命中 4 (75%) | 节省 3.21s | 18.4/512 MB"""
+        hits = sum(s["hits"] + s["disk_hits"] for s in self.stats.values())
+        misses = sum(s["misses"] for s in self.stats.values())
+        saved = sum(s["saved_seconds"] for s in self.stats.values())
+        rate = f"{hits / (hits + misses):.0%}" if hits + misses else "-"
+        return (f"参考特征缓存: 命中 {hits} / 未命中 {misses} ({rate}) | 节省 {saved:.2f}s | "
+                f"{self._bytes / 2**20:.1f}/{self.max_bytes / 2**20:.0f} MB")
+
+
+# === 接入 GPT_SoVITS.inference_webui ===
+# get_tts_wav 直接引用模块全局的 librosa / ssl_model / vq_model / get_phones_and_bert / get_spepc，
+# 因此通过替换这些全局名实现缓存，不需要修改 GPT-SoVITS 源码。
+
+class _Proxy:
+    """转发属性访问，仅覆盖个别方法"""
+
+    def __init__(self, target, **overrides):
+        self._target = target
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+def _same_prompt(text, prompt_text):
+    # get_tts_wav 会 strip 掉换行，并在 prompt 末尾缺标点时补一个 "。" / "."
+    if prompt_text is None:
+        return False
+    prompt_text = prompt_text.strip("\n")
+    return text == prompt_text or text[:-1] == prompt_text
+
+
+def install_ref_cache(webui, max_bytes=DEFAULT_MAX_MB << 20, disk_dir=DEFAULT_DISK_DIR):
+    """给 inference_webui 模块装上参考特征缓存（幂等），返回 RefFeatureCache
+
+    需在 `from GPT_SoVITS.inference_webui import get_tts_wav, ...` 之前调用，
+    调用方导入到的才是带缓存的 get_tts_wav / change_sovits_weights。
+    """
+    cache = getattr(webui, "_atri_ref_cache", None)
+    if cache is not None:
+        return cache
+
+    cache = RefFeatureCache(max_bytes, disk_dir)
+    cache.model_path = getattr(webui, "sovits_path", None)  # 导入时已加载的默认权重
+    context = threading.local()
+
+    def current_ref():
+        path = getattr(context, "ref_path", None)
+        return cache.ref_key(path) if path and os.path.exists(path) else None
+
+    # 解码后的参考音频 (librosa / torchaudio)
+    def cached_loader(kind, load):
+        def wrapper(path, *args, **kwargs):
+            ref = current_ref()
+            if ref is None or not isinstance(path, str) or os.path.abspath(path) != ref[0]:
+                return load(path, *args, **kwargs)
+            key = ref + (repr(args), repr(sorted(kwargs.items())))
+            return _copy(cache.get_or_compute(kind, key, lambda: load(path, *args, **kwargs)))
+        return wrapper
+
+    webui.librosa = _Proxy(webui.librosa, load=cached_loader("ref_audio", webui.librosa.load))
+    if hasattr(webui, "torchaudio"):
+        webui.torchaudio = _Proxy(webui.torchaudio,
+                                  load=cached_loader("ref_audio_torch", webui.torchaudio.load))
+
+    # SSL 特征 (cnhubert 固定，不随 checkpoint 变化；补零长度取决于采样率，所以带上 model_key)
+    ssl_model = webui.ssl_model
+    orig_ssl_forward = ssl_model.model
+
+    def ssl_forward(wav, *args, **kwargs):
+        ref = current_ref()
+        if ref is None:
+            return orig_ssl_forward(wav, *args, **kwargs)
+        key = ref + (tuple(wav.shape), cache.model_key())
+        return cache.get_or_compute("ssl", key, lambda: orig_ssl_forward(wav, *args, **kwargs))
+
+    webui.ssl_model = _Proxy(ssl_model, model=ssl_forward)
+
+    # prompt 语义 token (vq_model 随 SoVITS checkpoint 重建，每次合成前检查一次)
+    def wrap_vq_model():
+        if isinstance(webui.vq_model, _Proxy):
+            return
+        vq_model = webui.vq_model
+
+        def extract_latent(ssl_content, *args, **kwargs):
+            ref = current_ref()
+            if ref is None:
+                return vq_model.extract_latent(ssl_content, *args, **kwargs)
+            return cache.get_or_compute(
+                "semantic", ref + (cache.model_key(),),
+                lambda: vq_model.extract_latent(ssl_content, *args, **kwargs))
+
+        webui.vq_model = _Proxy(vq_model, extract_latent=extract_latent)
+
+    # prompt 文本的音素 + BERT 特征（目标文本每次都不同，不缓存，但可由文本前端在后台预取）
+    orig_get_phones_and_bert = cache._get_phones_and_bert = webui.get_phones_and_bert
+
+    def get_phones_and_bert(text, language, version, *args, **kwargs):
+        if not _same_prompt(text, getattr(context, "prompt_text", None)):
+            prefetched = None if args or kwargs else cache.take_prefetched(text, language, version)
+            if prefetched is not None:
+                return prefetched
+            return orig_get_phones_and_bert(text, language, version, *args, **kwargs)
+        key = (text, str(language), str(version), repr(args), repr(sorted(kwargs.items())))
+        return cache.get_or_compute(
+            "prompt_bert", key, lambda: orig_get_phones_and_bert(text, language, version, *args, **kwargs))
+
+    webui.get_phones_and_bert = get_phones_and_bert
+
+    # 参考频谱（也用于 inp_refs，按文件本身做键）
+    orig_get_spepc = webui.get_spepc
+
+    def get_spepc(hps, filename, *args, **kwargs):
+        if not isinstance(filename, str) or not os.path.exists(filename):
+            return orig_get_spepc(hps, filename, *args, **kwargs)
+        key = cache.ref_key(filename) + (cache.model_key(), repr(args), repr(sorted(kwargs.items())))
+        return cache.get_or_compute("spec", key, lambda: orig_get_spepc(hps, filename, *args, **kwargs))
+
+    webui.get_spepc = get_spepc
+
+    # 记录当前 SoVITS checkpoint
+    orig_change_sovits_weights = webui.change_sovits_weights
+
+    def change_sovits_weights(sovits_path, *args, **kwargs):
+        cache.model_path = sovits_path
+        yield from orig_change_sovits_weights(sovits_path, *args, **kwargs)
+
+    webui.change_sovits_weights = change_sovits_weights
+
+    # 合成入口：记录本次的参考音频 / prompt 文本，供上面的包装函数取键
+    orig_get_tts_wav = webui.get_tts_wav
+
+    def get_tts_wav(ref_wav_path, prompt_text, *args, **kwargs):
+        wrap_vq_model()
+        context.ref_path, context.prompt_text = ref_wav_path, prompt_text
+        try:
+            yield from orig_get_tts_wav(ref_wav_path, prompt_text, *args, **kwargs)
+        finally:
+            context.ref_path = context.prompt_text = None
+
+    webui.get_tts_wav = get_tts_wav
+    webui._atri_ref_cache = cache
+    return cache
+
+
+def benchmark(preset="default", repeat=5, text="夏生さん、今日はいい天気ですね。一緒に散歩しませんか？"):
+    """对同一参考音频重复合成，对比关闭 / 开启缓存的单次请求延迟"""
+    import hq_tts_synthesis as hq
+
+    synth = hq.HQSynthesizer()
+    synth.init_models()
+    cache = hq.ref_cache
+    results = {}
+    for enabled in (False, True):
+        cache.enabled = enabled
+        cache.clear()
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            synth.synthesize_audio(text, preset)
+            latencies.append(time.perf_counter() - start)
+        results[enabled] = latencies
+        if enabled:
+            summary = cache.summary()
+
+    off, on = results[False], results[True]
+    warm = on[1:] or on
+    print(f"\n{'='*60}")
+    print(f"参考: {preset} | 每组 {repeat} 次")
+    print(f"  无缓存:       平均 {sum(off) / len(off):.3f}s")
+    print(f"  有缓存(冷):   {on[0]:.3f}s")
+    print(f"  有缓存(热):   平均 {sum(warm) / len(warm):.3f}s")
+    print(f"  单次请求节省: {sum(off) / len(off) - sum(warm) / len(warm):.3f}s (端到端，含采样波动)")
+    for kind, s in summary["kinds"].items():
+        print(f"  [{kind}] 命中率 {s['hit_rate']:.0%} | 累计节省 {s['saved_seconds']:.3f}s")
+    print(cache.stats_line())
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ATRI 参考音频特征缓存")
+    parser.add_argument("--benchmark", action="store_true", help="对比开启 / 关闭缓存的单次合成延迟")
+    parser.add_argument("--preset", default="default", help="参考音频预设 (hq_tts_synthesis.REF_PRESETS)")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="每组重复次数")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.preset, args.repeat)
+    else:
+        parser.print_help()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 文本前端
+各脚本原来都把整段文本交给 get_tts_wav(how_to_cut="凑四句一切")，按四句一组严格串行处理。
+这里在项目内统一切分：按 。！？…」 断句，再做长度均衡（过短的句子合并、过长的句子在 、， 处拆开），
+然后逐段调用 get_tts_wav(不切)。第 N 段在 GPU 上解码时，后台线程已在为第 N+1 段做
+音素化 + BERT（借助 atri_ref_cache 装在 get_phones_and_bert 上的预取入口），
+各段按顺序拼回，段间插入 pause_second 的静音。
+
+用法: python atri_text_frontend.py "长文本……"   # 查看切分结果
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_MIN_CHARS = 10
+DEFAULT_MAX_CHARS = 50
+
+SENTENCE_END = "。！？!?…」"
+CLAUSE_END = "、，,；;"
+
+_SENTENCE_RE = re.compile(f"[^{SENTENCE_END}]+[{SENTENCE_END}]*|[{SENTENCE_END}]+")
+_CLAUSE_RE = re.compile(f"[^{CLAUSE_END}]+[{CLAUSE_END}]*|[{CLAUSE_END}]+")
+
+
+def split_sentences(text):
+    """按句末标点断句，标点（含连续的 ……、！？、」）留在句尾"""
+    return [s.strip() for s in _SENTENCE_RE.findall(text.strip()) if s.strip()]
+
+
+def _split_long(sentence, max_chars):
+    """超长句先在 、， 处拆开，仍然超长的部分按 max_chars 硬切"""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces, current = [], ""
+    for clause in _CLAUSE_RE.findall(sentence):
+        while len(clause) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(clause[:max_chars])
+            clause = clause[max_chars:]
+        if current and len(current) + len(clause) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += clause
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def balance_segments(sentences, min_chars=DEFAULT_MIN_CHARS, max_chars=DEFAULT_MAX_CHARS):
+    """长度均衡：短句并入相邻句直到不少于 min_chars，且每段不超过 max_chars"""
+    pieces = [p for s in sentences for p in _split_long(s, max_chars)]
+    segments, current = [], ""
+    for piece in pieces:
+        if current and (len(current) >= min_chars or len(current) + len(piece) > max_chars):
+            segments.append(current)
+            current = ""
+        current += piece
+    if current:
+        # 结尾的短句优先并入上一段
+        if segments and len(current) < min_chars and len(segments[-1]) + len(current) <= max_chars:
+            segments[-1] += current
+        else:
+            segments.append(current)
+    return segments
+
+
+def segment_text(text, min_chars=DEFAULT_MIN_CHARS, max_chars=DEFAULT_MAX_CHARS):
+    """断句 + 长度均衡，返回按顺序排列的合成段"""
+    return balance_segments(split_sentences(text), min_chars, max_chars)
+
+
+def _as_webui_sees(webui, segment, language):
+    """get_tts_wav 在调用 get_phones_and_bert 前对文本的处理（开头过短补 "。"，结尾补标点）"""
+    splits = getattr(webui, "splits", set("，。？！,.?!~:：—…"))
+    get_first = getattr(webui, "get_first", None)
+    punct = "." if language == "en" else "。"
+    text = segment.strip("\n")
+    if get_first and text[0] not in splits and len(get_first(text)) < 4:
+        text = punct + text
+    if text[-1] not in splits:
+        text += punct
+    return text
+
+
+def iter_pipelined_segments(webui, i18n, text, pause_second=0.3,
+                            min_chars=DEFAULT_MIN_CHARS, max_chars=DEFAULT_MAX_CHARS, **kwargs):
+    """逐段合成并产出 (采样率, 音频)，段间插入 pause_second 秒静音
+
+    Args:
+        webui: GPT_SoVITS.inference_webui 模块（已 install_ref_cache 时启用预取）
+        i18n: I18nAuto 实例
+        text: 待合成文本
+        pause_second: 段间静音
+        **kwargs: 其余 get_tts_wav 参数（需含 text_language，不含 text / how_to_cut / pause_second）
+    """
+    segments = segment_text(text, min_chars, max_chars) or [text]
+    cache = getattr(webui, "_atri_ref_cache", None)
+    language = getattr(webui, "dict_language", {}).get(kwargs.get("text_language"))
+    version = getattr(webui, "version", None)
+
+    def prefetch(segment):
+        if cache is not None and language is not None:
+            cache.prefetch_phones(_as_webui_sees(webui, segment, language), language, version, frontend)
+
+    with ThreadPoolExecutor(max_workers=1) as frontend:
+        try:
+            prefetch(segments[0])
+            for i, segment in enumerate(segments):
+                if i + 1 < len(segments):
+                    prefetch(segments[i + 1])
+                sr = audio = None
+                for sr, audio in webui.get_tts_wav(text=segment, how_to_cut=i18n("不切"),
+                                                   pause_second=0, **kwargs):
+                    yield sr, audio
+                if pause_second and audio is not None and i + 1 < len(segments):
+                    yield sr, np.zeros(int(sr * pause_second), dtype=audio.dtype)
+        finally:
+            if cache is not None:
+                cache.clear_prefetched()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查看文本前端的切分结果")
+    parser.add_argument("text")
+    parser.add_argument("--min-chars", type=int, default=DEFAULT_MIN_CHARS)
+    parser.add_argument("--max-chars", type=int, default=DEFAULT_MAX_CHARS)
+    args = parser.parse_args()
+
+    for i, segment in enumerate(segment_text(args.text, args.min_chars, args.max_chars), 1):
+        print(f"{i:>3} [{len(segment):>3}] {segment}")
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 合成结果缓存
+调音台、评测脚本的固定 TEST_CASES、全链路脚本经常用完全相同的
+(文本, 参考音频, top_k, top_p, temperature, speed, sample_steps, checkpoint) 重复合成。
+这里按 "规范化后的完整请求 + 模型指纹" 做内容寻址，把 wav 存进有容量上限的磁盘目录，
+索引放在 SQLite（与 scenario_cache 相同的做法，可被调音台 / 评测等多个进程共享），按最近使用时间淘汰。
+
+查找发生在任何模型加载之前；需要随机性（同一句话多抽几次）时用 bypass / --no-cache 跳过缓存。
+
+环境变量: ATRI_TTS_CACHE_DIR (缓存目录), ATRI_TTS_CACHE_MB (容量上限，默认 2048)
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+from atri_ref_cache import checkpoint_fingerprint, file_digest
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ATRI_TTS_CACHE_DIR", "/mnt/t2-6tb/Linpeikai/Voice/ATRI/tts_outputs/.result_cache")
+DEFAULT_MAX_MB = int(os.environ.get("ATRI_TTS_CACHE_MB", 2048))
+KEY_VERSION = 2  # 2: 改用 atri_text_frontend 断句，旧结果不再复用
+
+
+def _normalize_params(params):
+    """数值统一精度、去掉 None，保证 0.5 与 0.50000001 等价"""
+    normalized = {}
+    for name, value in sorted((params or {}).items()):
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            normalized[name] = value
+        elif isinstance(value, float):
+            normalized[name] = round(value, 4)
+        else:
+            normalized[name] = int(value)
+    return normalized
+
+
+def request_key(text, ref, params, gpt_path, sovits_path, namespace="", stream=False):
+    """规范化的合成请求 -> 缓存键 (sha256)
+
+    Args:
+        text: 待合成文本（去掉首尾空白、合并连续空白）
+        ref: 参考音频 {"path", "text", "lang"}，路径按内容哈希计入
+        params: 实际传给合成函数的参数
+        gpt_path / sovits_path: checkpoint 路径，按 大小 + mtime 计入
+        namespace: 调用方标识；各脚本补全默认参数的方式不同，不同调用方的结果不混用
+        stream: 流式合成按段切分，与整段合成的输出不同
+    """
+    ref_path = ref["path"]
+    request = {
+        "version": KEY_VERSION,
+        "namespace": namespace,
+        "text": " ".join(text.split()),
+        "ref": {
+            "path": os.path.abspath(ref_path),
+            "sha1": file_digest(ref_path) if os.path.exists(ref_path) else None,
+            "text": ref["text"].strip(),
+            "lang": ref.get("lang", "日文"),
+        },
+        "params": _normalize_params(params),
+        "gpt": checkpoint_fingerprint(gpt_path),
+        "sovits": checkpoint_fingerprint(sovits_path),
+        "stream": bool(stream),
+    }
+    blob = json.dumps(request, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class AudioResultCache:
+    """内容寻址的 wav 缓存，总大小超过上限时按最近使用时间淘汰"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # Gradio 在工作线程里调用合成函数，连接需跨线程使用，由锁串行化
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30,
+                                    check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                meta TEXT
+            )"""
+        )
+        self.conn.commit()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.wav")
+
+    def lookup(self, key):
+        """命中返回缓存 wav 路径（并刷新最近使用时间），否则返回 None"""
+        path = self._path(key)
+        with self._lock:
+            row = self.conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.exists(path):
+                if row is not None:
+                    # 文件被手动删除
+                    self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE results SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                              (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+        return path
+
+    def fetch(self, key, output_path):
+        """命中时把缓存结果复制到 output_path 并返回 True"""
+        path = self.lookup(key)
+        if path is None:
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        shutil.copyfile(path, output_path)
+        return True
+
+    def load(self, key):
+        """命中时返回 (采样率, float32 音频)，否则返回 None"""
+        import soundfile as sf
+
+        path = self.lookup(key)
+        if path is None:
+            return None
+        audio, sr = sf.read(path, dtype="float32")
+        return sr, audio
+
+    def store(self, key, wav_path, meta=None):
+        """把已生成的 wav 收进缓存，然后按容量上限淘汰"""
+        if not os.path.exists(wav_path):
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(wav_path, tmp_path)
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, size, created, last_used, hits, meta) VALUES (?, ?, ?, ?, 0, ?)",
+                (key, os.path.getsize(path), now, now, json.dumps(meta or {}, ensure_ascii=False)),
+            )
+            self.conn.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute(
+                "SELECT key, size FROM results ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self.conn.commit()
+
+    def stats_line(self):
+        """例如: 结果缓存: 命中 3 / 未命中 7 | 42 条, 18.3/2048 MB"""
+        with self._lock:
+            count, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return (f"结果缓存: 命中 {self.hits} / 未命中 {self.misses} | "
+                f"{count} 条, {total / 2**20:.1f}/{self.max_bytes / 2**20:.0f} MB")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_result_cache(enabled=True, cache_dir=DEFAULT_CACHE_DIR):
+    """打开结果缓存；enabled=False（--no-cache）或目录不可用时返回 None"""
+    if not enabled:
+        return None
+    try:
+        return AudioResultCache(cache_dir)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ 结果缓存不可用，已跳过: {e}")
+        return None
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 语音合成服务客户端
+供 hq_tts_synthesis / atri_full_pipeline / evaluate_checkpoints 调用常驻服务 (atri_tts_server.py)，
+服务不可用时抛出 TTSServerUnavailable，由调用方回退到进程内合成。
+
+服务地址: http://host:port 或 unix:///path/to.sock，默认取环境变量 ATRI_TTS_SERVER
+"""
+
+import os
+import json
+import time
+import struct
+import socket
+import http.client
+from urllib.parse import urlparse
+
+DEFAULT_SERVER = os.environ.get("ATRI_TTS_SERVER", "http://127.0.0.1:7890")
+
+
+class TTSServerUnavailable(RuntimeError):
+    """服务未启动、连接失败或队列持续已满"""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, unix_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = unix_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.unix_path)
+        self.sock = sock
+
+
+def _connect(server, timeout):
+    if server.startswith("unix://"):
+        return _UnixHTTPConnection(server[len("unix://"):], timeout)
+    url = urlparse(server)
+    return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+
+def server_alive(server=DEFAULT_SERVER, timeout=0.5):
+    """快速探测服务是否在线"""
+    if not server:
+        return False
+    try:
+        conn = _connect(server, timeout)
+        conn.request("GET", "/health")
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        ok = response.status == 200
+        return ok
+    except (OSError, http.client.HTTPException):
+        return False
+
+
+def _post(server, payload, timeout):
+    conn = _connect(server, timeout)
+    try:
+        conn.request("POST", "/synthesize", json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                     {"Content-Type": "application/json"})
+    except OSError as e:
+        conn.close()
+        raise TTSServerUnavailable(f"无法连接 TTS 服务 {server}: {e}")
+    return conn, conn.getresponse()
+
+
+def _error_message(response):
+    try:
+        return json.loads(response.read()).get("error", response.reason)
+    except (ValueError, AttributeError):
+        return response.reason
+
+
+def _audio_seconds(data):
+    """服务返回的是 44 字节头的 16bit 单声道 PCM WAV"""
+    if len(data) <= 44:
+        return 0.0
+    sample_rate = struct.unpack_from('<I', data, 24)[0]
+    return (len(data) - 44) / 2 / sample_rate
+
+
+def _fix_wav_sizes(data):
+    """流式 WAV 头里的长度是占位值，收完后改为实际长度"""
+    data = bytearray(data)
+    if len(data) >= 44:
+        struct.pack_into('<I', data, 4, len(data) - 8)
+        struct.pack_into('<I', data, 40, len(data) - 44)
+    return bytes(data)
+
+
+def _read_stream(response, output_path, start, stats):
+    """边收边写分块传输的 WAV，记录首包时间"""
+    parts, received = [], 0
+    out = open(output_path, 'wb') if output_path else None
+    try:
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            received += len(chunk)
+            if received > 44 and "ttfa" not in stats:
+                stats["ttfa"] = time.perf_counter() - start
+            parts.append(chunk)
+            if out:
+                out.write(chunk)
+                out.flush()
+        data = _fix_wav_sizes(b''.join(parts))
+        if out:
+            out.seek(0)
+            out.write(data[:44])
+    finally:
+        if out:
+            out.close()
+    return data
+
+
+def synthesize_remote(text, preset=None, ref=None, params=None, gpt_path=None, sovits_path=None,
+                      output_path=None, server=DEFAULT_SERVER, timeout=600, busy_retries=3,
+                      stream=False, stats=None):
+    """请求常驻服务合成，返回 WAV 字节；给定 output_path 时同时写入文件
+
+    队列已满 (503) 时退避重试 busy_retries 次，仍失败则抛出 TTSServerUnavailable。
+    stream=True 时服务逐段发送，收到即写入 output_path。
+    给定 stats (dict) 时填入 ttfa / total / audio_seconds / rtf / summary。
+    """
+    if not server:
+        raise TTSServerUnavailable("未配置 TTS 服务地址")
+
+    payload = {"text": text, "params": params or {}}
+    if preset:
+        payload["preset"] = preset
+    if ref:
+        payload["ref"] = ref
+    if gpt_path:
+        payload["gpt_path"] = gpt_path
+    if sovits_path:
+        payload["sovits_path"] = sovits_path
+    if stream:
+        payload["stream"] = True
+    if output_path:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    stats = {} if stats is None else stats
+    start = time.perf_counter()
+    for attempt in range(busy_retries + 1):
+        conn, response = _post(server, payload, timeout)
+        try:
+            if response.status == 200:
+                if stream:
+                    data = _read_stream(response, output_path, start, stats)
+                else:
+                    data = response.read()
+                break
+            message = _error_message(response)
+        finally:
+            conn.close()
+        if response.status != 503:
+            raise RuntimeError(f"TTS 服务合成失败 ({response.status}): {message}")
+        time.sleep(0.5 * 2 ** attempt)
+    else:
+        raise TTSServerUnavailable(f"TTS 服务队列已满: {server}")
+
+    if output_path and not stream:
+        with open(output_path, 'wb') as f:
+            f.write(data)
+
+    total = time.perf_counter() - start
+    audio_seconds = _audio_seconds(data)
+    stats.setdefault("ttfa", total)
+    stats.update(total=total, audio_seconds=audio_seconds,
+                 rtf=total / audio_seconds if audio_seconds else None)
+    stats["summary"] = (f"首包 {stats['ttfa']:.2f}s | 总耗时 {total:.2f}s | 音频 {audio_seconds:.2f}s"
+                        + (f" | RTF {stats['rtf']:.2f}x" if stats['rtf'] else ""))
+    return data
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 常驻语音合成服务
+模型只加载一次并常驻显存，通过本地 HTTP / Unix socket 接收合成请求。
+所有请求进入有界队列，由单个工作线程串行合成（GPU 推理不可重入）。
+
+启动: python atri_tts_server.py [--port 7890 | --unix /tmp/atri_tts.sock] [--backend hq|stub]
+接口:
+  POST /synthesize  {"text", "preset" | "ref", "params", "gpt_path", "sovits_path", "stream"}
+                    -> audio/wav (stream=true 时为分块传输的 WAV)
+  GET  /health      -> 后端、加载耗时、队列长度、已处理请求数、参考特征缓存命中率
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import struct
+import argparse
+import threading
+import socketserver
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7890
+DEFAULT_QUEUE_SIZE = 16
+
+_DONE = object()
+
+
+# === 合成后端 ===
+# 后端只需实现 load() 和 stream(request)，stream 逐段产出 (采样率, 音频数组)
+
+class HQSynthesizerBackend:
+    """真实后端：包装 hq_tts_synthesis.HQSynthesizer，模型常驻"""
+
+    name = "hq"
+
+    def __init__(self):
+        from hq_tts_synthesis import HQSynthesizer
+        self.synth = HQSynthesizer()
+
+    def load(self):
+        self.synth.init_models()
+
+    def cache_stats(self):
+        import hq_tts_synthesis
+        return hq_tts_synthesis.ref_cache.summary() if hq_tts_synthesis.ref_cache else None
+
+    def stream(self, request):
+        # 评测脚本会指定 checkpoint；只有变化的权重才会重新加载
+        self.synth.load_weights(request.get("gpt_path"), request.get("sovits_path"))
+        # 流式请求逐段产出，首段解码完即可发送；整段请求保留原有的峰值归一化
+        synthesize = self.synth.stream_audio if request.get("stream") else self._whole
+        yield from synthesize(
+            request["text"],
+            request.get("preset") or "default",
+            ref=request.get("ref"),
+            **request.get("params", {}),
+        )
+
+    def _whole(self, *args, **kwargs):
+        yield self.synth.synthesize_audio(*args, **kwargs)
+
+
+class StubBackend:
+    """占位后端：不加载模型，按句生成正弦波，用于在 CPU 机器上测试服务和客户端"""
+
+    name = "stub"
+
+    def __init__(self, sample_rate=32000, seconds_per_char=0.08, delay=0.0):
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.delay = delay
+
+    def load(self):
+        pass
+
+    def stream(self, request):
+        segments = [s for s in re.split(r'(?<=[。！？!?])', request["text"]) if s.strip()]
+        for i, segment in enumerate(segments or [request["text"]]):
+            if self.delay:
+                time.sleep(self.delay)
+            n = max(1, int(len(segment) * self.seconds_per_char * self.sample_rate))
+            t = np.arange(n, dtype=np.float32) / self.sample_rate
+            yield self.sample_rate, 0.3 * np.sin(2 * np.pi * (220 + 20 * i) * t).astype(np.float32)
+
+
+BACKENDS = {
+    "hq": HQSynthesizerBackend,
+    "stub": StubBackend,
+}
+
+
+# === WAV 编码 ===
+
+def to_pcm16(audio):
+    """float [-1, 1] 或 int16 数组 -> 小端 int16 字节"""
+    audio = np.asarray(audio)
+    if audio.dtype != np.int16:
+        audio = (np.clip(audio.astype(np.float32), -1.0, 1.0) * 32767.0).astype(np.int16)
+    return audio.astype('<i2').tobytes()
+
+
+def wav_header(sample_rate, data_bytes=None, channels=1):
+    """16bit PCM WAV 头；data_bytes 为 None 时写入流式用的最大长度"""
+    data_size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    riff_size = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    return b''.join([
+        b'RIFF', struct.pack('<I', riff_size), b'WAVE',
+        b'fmt ', struct.pack('<IHHIIHH', 16, 1, channels, sample_rate,
+                             sample_rate * channels * 2, channels * 2, 16),
+        b'data', struct.pack('<I', data_size),
+    ])
+
+
+# === 服务 ===
+
+class _Job:
+    def __init__(self, request):
+        self.request = request
+        self.chunks = queue.Queue()
+        self.enqueued = time.perf_counter()
+        self.started = None
+
+
+class SynthesisService:
+    """持有后端、有界请求队列与工作线程"""
+
+    def __init__(self, backend, queue_size=DEFAULT_QUEUE_SIZE):
+        self.backend = backend
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.served = 0
+        self.failed = 0
+        self.load_seconds = None
+        self._worker = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        start = time.perf_counter()
+        self.backend.load()
+        self.load_seconds = time.perf_counter() - start
+        print(f"✓ 后端 [{self.backend.name}] 已加载 ({self.load_seconds:.1f}s)")
+        self._worker.start()
+
+    def submit(self, request):
+        """入队；队列已满时抛出 queue.Full"""
+        job = _Job(request)
+        self.jobs.put_nowait(job)
+        return job
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            job.started = time.perf_counter()
+            try:
+                for sr, chunk in self.backend.stream(job.request):
+                    job.chunks.put((sr, chunk))
+                job.chunks.put(_DONE)
+                self.served += 1
+            except Exception as e:
+                self.failed += 1
+                job.chunks.put(e)
+
+    def health(self):
+        health = {
+            "status": "ok",
+            "backend": self.backend.name,
+            "load_seconds": self.load_seconds,
+            "queue_size": self.jobs.qsize(),
+            "queue_capacity": self.jobs.maxsize,
+            "served": self.served,
+            "failed": self.failed,
+        }
+        if hasattr(self.backend, "cache_stats"):
+            health["ref_cache"] = self.backend.cache_stats()
+        return health
+
+
+class SynthesisHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix socket 没有客户端地址
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/synthesize":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+        if not str(request.get("text", "")).strip():
+            self._send_json(400, {"error": "text is required"})
+            return
+
+        try:
+            job = self.service.submit(request)
+        except queue.Full:
+            self._send_json(503, {"error": "queue full", "queue_size": self.service.jobs.qsize()})
+            return
+
+        if request.get("stream"):
+            self._respond_stream(job)
+        else:
+            self._respond_whole(job)
+
+    def _respond_whole(self, job):
+        sample_rate, chunks = None, []
+        while True:
+            item = job.chunks.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                self._send_json(500, {"error": str(item)})
+                return
+            sample_rate, chunk = item
+            chunks.append(to_pcm16(chunk))
+
+        if sample_rate is None:
+            self._send_json(500, {"error": "no audio generated"})
+            return
+
+        pcm = b''.join(chunks)
+        body = wav_header(sample_rate, len(pcm)) + pcm
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Queue-Wait-Seconds", f"{job.started - job.enqueued:.3f}")
+        self.send_header("X-Synthesis-Seconds", f"{time.perf_counter() - job.started:.3f}")
+        self.send_header("X-Audio-Seconds", f"{len(pcm) / 2 / sample_rate:.3f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond_stream(self, job):
+        first = job.chunks.get()
+        if isinstance(first, Exception):
+            self._send_json(500, {"error": str(first)})
+            return
+        if first is _DONE:
+            self._send_json(500, {"error": "no audio generated"})
+            return
+
+        sample_rate, chunk = first
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Sample-Rate", str(sample_rate))
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        write_chunk(wav_header(sample_rate) + to_pcm16(chunk))
+        while True:
+            item = job.chunks.get()
+            if item is _DONE or isinstance(item, Exception):
+                # 流已经开始，出错时只能提前结束
+                break
+            write_chunk(to_pcm16(item[1]))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    """创建 HTTP 服务（TCP 或 Unix socket），返回未启动的 server 对象"""
+    if unix_path:
+        server = _UnixServer(unix_path, SynthesisHandler)
+    else:
+        server = _TCPServer((host, port), SynthesisHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ATRI 常驻语音合成服务")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="改为监听 Unix socket 路径")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="hq",
+                        help="hq: GPT-SoVITS v4 常驻模型; stub: 无模型占位 (测试用)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="请求队列上限，满时返回 503")
+    args = parser.parse_args()
+
+    service = SynthesisService(BACKENDS[args.backend](), args.queue_size)
+    service.start()
+
+    server = make_server(service, args.host, args.port, args.unix)
+    where = f"unix://{args.unix}" if args.unix else f"http://{args.host}:{args.port}"
+    print(f"🚀 ATRI TTS 服务已启动: {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+if __name__ == "__main__":
+    main()
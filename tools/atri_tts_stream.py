@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ATRI 流式合成工具
+get_tts_wav 在 "凑四句一切" 下要把整段文本全部合成完才一次性返回，
+调用方再 list() + np.concatenate，用户在最后一段完成前什么都听不到。
+切段与逐段合成见 atri_text_frontend.iter_pipelined_segments；这里负责把逐段产出的音频
+边合成边播放 / 写盘 / 发送，并把首包延迟 (time-to-first-audio) 与整体 RTF 分开统计。
+"""
+
+import time
+import numpy as np
+
+
+def to_float32(audio):
+    """int16 PCM 转为 [-1, 1] 的 float32，其余类型原样转换"""
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) / 32768.0
+    return audio.astype(np.float32)
+
+
+class StreamTimer:
+    """统计首包延迟、总耗时与 RTF"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_audio = None
+        self.end = None
+        self.samples = 0
+        self.sample_rate = None
+
+    def mark(self, sample_rate, audio):
+        now = time.perf_counter()
+        if self.first_audio is None:
+            self.first_audio = now
+        self.end = now
+        self.samples += len(audio)
+        self.sample_rate = sample_rate
+
+    @property
+    def ttfa(self):
+        return None if self.first_audio is None else self.first_audio - self.start
+
+    @property
+    def total(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def audio_seconds(self):
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def rtf(self):
+        return self.total / self.audio_seconds if self.audio_seconds else None
+
+    def summary(self):
+        if self.ttfa is None:
+            return "未产生音频"
+        return (f"首包 {self.ttfa:.2f}s | 总耗时 {self.total:.2f}s | "
+                f"音频 {self.audio_seconds:.2f}s | RTF {self.rtf:.2f}x")
+
+
+def iter_timed(chunks, timer):
+    """透传 (采样率, 音频) 并记录时间"""
+    for sr, audio in chunks:
+        timer.mark(sr, audio)
+        yield sr, audio
+
+
+def stream_to_wav(chunks, output_path, timer=None):
+    """边合成边写 WAV（收到第一段时按其采样率打开文件），返回 StreamTimer"""
+    import soundfile as sf
+
+    timer = timer or StreamTimer()
+    writer = None
+    try:
+        for sr, audio in iter_timed(chunks, timer):
+            if writer is None:
+                writer = sf.SoundFile(output_path, 'w', samplerate=sr, channels=1, subtype='PCM_16')
+            writer.write(to_float32(audio))
+            writer.flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return timer
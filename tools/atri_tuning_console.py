@@ -11,11 +11,15 @@ Gradio WebUI - 旋钮式参数调节
 import os
 import sys
 import json
-import numpy as np
 import torch
 import soundfile as sf
 from datetime import datetime
 
+from atri_tts_stream import StreamTimer, iter_timed, to_float32
+from atri_text_frontend import iter_pipelined_segments
+from atri_ref_cache import install_ref_cache
+from atri_tts_cache import open_result_cache, request_key
+
 # === 路径配置 ===
 PROJECT_ROOT = "/mnt/t2-6tb/Linpeikai/Voice/ATRI"
 GPT_SOVITS_PATH = f"{PROJECT_ROOT}/frameworks/GPT-SoVITS"
@@ -33,7 +37,9 @@ os.chdir(GPT_SOVITS_PATH)
 
 # === 全局模型加载 (显存驻留) ===
 print("🔧 加载 GPT-SoVITS v4 模型...")
-from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
+import GPT_SoVITS.inference_webui as webui
+REF_CACHE = install_ref_cache(webui)  # 每个情感固定用 refs[0]，参考特征只需计算一次
+from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights
 from tools.i18n.i18n import I18nAuto
 i18n = I18nAuto()
 
@@ -42,6 +48,9 @@ for _ in change_sovits_weights(SOVITS_MODEL, prompt_language="日文", text_lang
     pass
 print("✓ 模型已加载到 GPU 并常驻显存")
 
+# 结果缓存：同一组 (文本, 情感, 旋钮) 再次点击时直接播放之前的音频
+RESULT_CACHE = open_result_cache()
+
 # === 加载参考音频库 ===
 with open(REFERENCE_LIBRARY, 'r', encoding='utf-8') as f:
     ref_data = json.load(f)
@@ -60,51 +69,75 @@ def synthesize(
     top_p: float,
     top_k: int,
     speed: float,
-    sample_steps: int
+    sample_steps: int,
+    bypass_cache: bool = False
 ):
-    """核心合成函数"""
+    """核心合成函数（生成器）：逐段产出音频，第一段解码完即可开始播放
+
+    命中结果缓存时直接返回之前的音频；bypass_cache=True 时重新采样。
+    """
     if not text.strip():
-        return None
+        return
     
     ref = get_ref_audio(emotion)
     if not ref:
-        return None
+        return
+    
+    key = None
+    if RESULT_CACHE and not bypass_cache:
+        key = request_key(
+            text, ref,
+            {"top_k": top_k, "top_p": top_p, "temperature": temperature,
+             "speed": speed, "sample_steps": sample_steps},
+            GPT_MODEL, SOVITS_MODEL, namespace="console", stream=True,
+        )
+        cached = RESULT_CACHE.load(key)
+        if cached:
+            print(f"♻️ 命中结果缓存 ({RESULT_CACHE.stats_line()})")
+            yield cached
+            return
     
     print(f"🎤 合成: temp={temperature}, top_p={top_p}, top_k={top_k}, speed={speed}")
     
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = f"{OUTPUT_DIR}/tune_{emotion}_{timestamp}.wav"
+    timer = StreamTimer()
+    writer = None
     try:
-        synthesis_result = get_tts_wav(
+        chunks = iter_pipelined_segments(
+            webui, i18n, text,
             ref_wav_path=ref["path"],
             prompt_text=ref["text"],
             prompt_language=i18n("日文"),
-            text=text,
             text_language=i18n("日文"),
-            how_to_cut=i18n("凑四句一切"),
             top_k=top_k,
             top_p=top_p,
             temperature=temperature,
             speed=speed,
             sample_steps=sample_steps,
         )
-        
-        result_list = list(synthesis_result)
-        if result_list:
-            sr = result_list[0][0]
-            audio = np.concatenate([item[1] for item in result_list])
-            
-            # 保存文件
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_path = f"{OUTPUT_DIR}/tune_{emotion}_{timestamp}.wav"
-            sf.write(output_path, audio, sr)
-            
-            # 显存释放 (关键)
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            
-            return (sr, audio)
+        for sr, audio in iter_timed(chunks, timer):
+            # 边合成边保存文件
+            if writer is None:
+                writer = sf.SoundFile(output_path, 'w', samplerate=sr, channels=1, subtype='PCM_16')
+            writer.write(to_float32(audio))
+            yield (sr, audio)
+        print(f"⏱️ {timer.summary()}")
+        print(REF_CACHE.stats_line())
+        if writer is not None:
+            writer.close()
+            writer = None
+            # 只缓存完整合成的结果（中途被新请求打断时不写入）
+            if key:
+                RESULT_CACHE.store(key, output_path, meta={"text": text, "emotion": emotion})
     except Exception as e:
         print(f"❌ 合成失败: {e}")
-        return None
+    finally:
+        if writer is not None:
+            writer.close()
+        # 显存释放 (关键)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
 
 # === 情感-参数推荐值 ===
 EMOTION_PRESETS = {
@@ -193,13 +226,20 @@ with gr.Blocks(
                     info="↑ 质量更高但更慢"
                 )
             
+            bypass_cache_box = gr.Checkbox(
+                value=False,
+                label="🎲 跳过缓存 (相同参数也重新采样)"
+            )
+            
             synth_btn = gr.Button("🎤 即时合成", variant="primary", size="lg")
         
         # 右侧: 输出区
         with gr.Column(scale=1):
             audio_output = gr.Audio(
                 label="🔊 亚托莉的回复",
-                type="numpy"
+                type="numpy",
+                streaming=True,
+                autoplay=True
             )
             
             gr.Markdown("""
@@ -225,7 +265,7 @@ with gr.Blocks(
         inputs=[
             input_text, emotion_select,
             temp_slider, top_p_slider, top_k_slider,
-            speed_slider, steps_slider
+            speed_slider, steps_slider, bypass_cache_box
         ],
         outputs=audio_output
     )
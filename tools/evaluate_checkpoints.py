@@ -2,15 +2,23 @@
 # -*- coding: utf-8 -*-
 """
 ATRI 模型自动评测脚本
-对比不同 Checkpoint 的合成质量
+对比不同 Checkpoint 的合成质量（SoVITS × GPT 全组合，由 atri_eval_scheduler 分配到各 GPU）
+
+用法: python evaluate_checkpoints.py [--sovits-last 3] [--gpt-last 1] [--synthesizer stub --workers 4]
+      python evaluate_checkpoints.py --synthesizer stub --sovits-dir ckpts/ --gpt-dir ckpts/ \
+          --reference-library reference_library.json --output-dir eval_out/   # 不依赖 /mnt 下的默认路径
 """
 
 import os
 import sys
 import glob
 import time
-import numpy as np
-import soundfile as sf
+
+from atri_tts_client import DEFAULT_SERVER, server_alive, synthesize_remote
+from atri_tts_stream import stream_to_wav
+from atri_text_frontend import iter_pipelined_segments
+from atri_ref_cache import install_ref_cache
+from atri_tts_cache import open_result_cache, request_key
 
 # === Configuration ===
 GPT_SOVITS_PATH = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/frameworks/GPT-SoVITS"
@@ -58,21 +66,20 @@ TEST_CASES = [
     }
 ]
 
-sys.path.insert(0, GPT_SOVITS_PATH)
-sys.path.insert(0, os.path.join(GPT_SOVITS_PATH, "GPT_SoVITS"))
-os.chdir(GPT_SOVITS_PATH)
+# 评测统一使用的合成参数
+EVAL_PARAMS = {"top_k": 5, "top_p": 0.8, "temperature": 0.5, "speed": 0.95}
 
-def load_reference_library():
+def load_reference_library(path=REFERENCE_LIBRARY):
     """加载参考音频库"""
     import json
-    with open(REFERENCE_LIBRARY, 'r', encoding='utf-8') as f:
+    with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     return data.get("recommended", {})
 
-def find_checkpoints():
+def find_checkpoints(sovits_dir=CHECKPOINTS_DIR, gpt_dir=GPT_CHECKPOINTS_DIR):
     """查找所有可用的 checkpoint"""
-    sovits_ckpts = glob.glob(os.path.join(CHECKPOINTS_DIR, "ATRI*.pth"))
-    gpt_ckpts = glob.glob(os.path.join(GPT_CHECKPOINTS_DIR, "ATRI*.ckpt"))
+    sovits_ckpts = glob.glob(os.path.join(sovits_dir, "ATRI*.pth"))
+    gpt_ckpts = glob.glob(os.path.join(gpt_dir, "ATRI*.ckpt"))
     
     # 按 epoch 排序
     sovits_ckpts.sort(key=lambda x: int(x.split('_e')[1].split('_')[0]) if '_e' in x else 0)
@@ -80,23 +87,172 @@ def find_checkpoints():
     
     return sovits_ckpts, gpt_ckpts
 
-def evaluate_checkpoint(sovits_path, gpt_path, ref_lib, output_subdir):
-    """评测单个 checkpoint 组合"""
-    from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
-    from tools.i18n.i18n import I18nAuto
-    i18n = I18nAuto()
-    
+# === 合成器 ===
+# 评测调度器 (atri_eval_scheduler) 在每个工作进程里构造一个合成器，
+# load() 只重新加载真正变化的权重，synthesize() 返回计时信息（失败返回 None）
+
+class _Synthesizer:
+    name = None
+    cacheable = True  # 结果可写入 / 读取结果缓存
+    stream = False
+
+    def __init__(self):
+        self.gpt_path = self.sovits_path = None
+        self.loads = {"gpt": 0, "sovits": 0}
+
+    def load(self, gpt_path, sovits_path):
+        if gpt_path != self.gpt_path:
+            self._load_gpt(gpt_path)
+            self.gpt_path = gpt_path
+            self.loads["gpt"] += 1
+        if sovits_path != self.sovits_path:
+            self._load_sovits(sovits_path)
+            self.sovits_path = sovits_path
+            self.loads["sovits"] += 1
+
+    def _load_gpt(self, gpt_path):
+        pass
+
+    def _load_sovits(self, sovits_path):
+        pass
+
+    def stats_line(self):
+        return None
+
+
+class GPTSoVITSSynthesizer(_Synthesizer):
+    """进程内 GPT-SoVITS（模型在首次 load 时导入）"""
+
+    name = "local"
+
+    def __init__(self, gpt_sovits_path=GPT_SOVITS_PATH):
+        super().__init__()
+        self.gpt_sovits_path = gpt_sovits_path
+        self.webui = self.i18n = self.ref_cache = None
+
+    def _import(self):
+        """设置路径并导入 GPT-SoVITS（同 hq_tts_synthesis.import_gpt_sovits，只在真正需要模型时执行）"""
+        if self.webui is not None:
+            return
+        sys.path.insert(0, self.gpt_sovits_path)
+        sys.path.insert(0, os.path.join(self.gpt_sovits_path, "GPT_SoVITS"))
+        os.chdir(self.gpt_sovits_path)
+        import GPT_SoVITS.inference_webui as webui
+        from tools.i18n.i18n import I18nAuto
+        self.ref_cache = install_ref_cache(webui)
+        self.webui, self.i18n = webui, I18nAuto()
+
+    def _load_gpt(self, gpt_path):
+        self._import()
+        self.webui.change_gpt_weights(gpt_path)
+
+    def _load_sovits(self, sovits_path):
+        self._import()
+        for _ in self.webui.change_sovits_weights(sovits_path, prompt_language="日文", text_language="日文"):
+            pass
+
+    def synthesize(self, text, ref, output_path):
+        i18n = self.i18n
+        tts_kwargs = dict(
+            ref_wav_path=ref["path"],
+            prompt_text=ref["text"],
+            prompt_language=i18n("日文"),
+            text_language=i18n("日文"),
+            **EVAL_PARAMS,
+        )
+        chunks = iter_pipelined_segments(self.webui, i18n, text, **tts_kwargs)
+        timer = stream_to_wav(chunks, output_path)
+        if timer.ttfa is None:
+            return None
+        return {"ttfa": timer.ttfa, "total": timer.total,
+                "audio_seconds": timer.audio_seconds, "rtf": timer.rtf}
+
+    def stats_line(self):
+        return self.ref_cache.stats_line() if self.ref_cache else None
+
+
+class RemoteSynthesizer(_Synthesizer):
+    """常驻 TTS 服务（由服务端切换权重，这里只记录路径）"""
+
+    name = "server"
+
+    def __init__(self, server=DEFAULT_SERVER, stream=False):
+        super().__init__()
+        self.server = server
+        self.stream = stream
+
+    def synthesize(self, text, ref, output_path):
+        stats = {}
+        synthesize_remote(
+            text,
+            ref={"path": ref["path"], "text": ref["text"], "lang": "日文"},
+            params=EVAL_PARAMS,
+            gpt_path=self.gpt_path,
+            sovits_path=self.sovits_path,
+            output_path=output_path,
+            server=self.server,
+            stream=self.stream,
+            stats=stats,
+        )
+        return stats
+
+
+class StubSynthesizer(_Synthesizer):
+    """占位合成器：不加载模型，按字数生成正弦波，用于在无 GPU 的机器上测试调度"""
+
+    name = "stub"
+    cacheable = False
+
+    def __init__(self, sample_rate=32000, seconds_per_char=0.08, load_delay=0.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.load_delay = load_delay
+
+    def _load_gpt(self, gpt_path):
+        time.sleep(self.load_delay)
+
+    def _load_sovits(self, sovits_path):
+        time.sleep(self.load_delay)
+
+    def synthesize(self, text, ref, output_path):
+        import numpy as np
+
+        n = max(1, int(len(text) * self.seconds_per_char * self.sample_rate))
+        t = np.arange(n, dtype=np.float32) / self.sample_rate
+        audio = 0.3 * np.sin(2 * np.pi * 220 * t).astype(np.float32)
+        timer = stream_to_wav([(self.sample_rate, audio)], output_path)
+        return {"ttfa": timer.ttfa, "total": timer.total,
+                "audio_seconds": timer.audio_seconds, "rtf": timer.rtf}
+
+
+SYNTHESIZERS = {
+    "local": GPTSoVITSSynthesizer,
+    "server": RemoteSynthesizer,
+    "stub": StubSynthesizer,
+}
+
+
+def make_synthesizer(name, **options):
+    return SYNTHESIZERS[name](**options)
+
+
+def evaluate_checkpoint(synth, sovits_path, gpt_path, output_subdir, ref_lib=None, use_cache=True):
+    """评测单个 checkpoint 组合
+
+    synth 为上面的合成器之一；权重在第一次未命中结果缓存时才加载，
+    全部命中的组合不会加载任何模型。每条结果都记录首包延迟、总耗时与 RTF。
+    """
     print(f"\n{'='*60}")
     print(f"Evaluating:")
     print(f"  SoVITS: {os.path.basename(sovits_path)}")
     print(f"  GPT: {os.path.basename(gpt_path)}")
     print(f"{'='*60}")
     
-    # 加载模型
-    change_gpt_weights(gpt_path)
-    for _ in change_sovits_weights(sovits_path, prompt_language="日文", text_language="日文"):
-        pass
+    if ref_lib is None:
+        ref_lib = load_reference_library()
     
+    cache = open_result_cache(use_cache and synth.cacheable)
     os.makedirs(output_subdir, exist_ok=True)
     results = []
     
@@ -111,33 +267,49 @@ def evaluate_checkpoint(sovits_path, gpt_path, ref_lib, output_subdir):
         
         for i, text in enumerate(case["texts"]):
             output_path = os.path.join(output_subdir, f"{emotion}_{i+1}.wav")
+            key = request_key(text, ref, EVAL_PARAMS, gpt_path, sovits_path,
+                              namespace="eval", stream=synth.stream) if cache else None
             
             try:
-                synthesis_result = get_tts_wav(
-                    ref_wav_path=ref["path"],
-                    prompt_text=ref["text"],
-                    prompt_language=i18n("日文"),
-                    text=text,
-                    text_language=i18n("日文"),
-                    how_to_cut=i18n("凑四句一切"),
-                    top_k=5,
-                    top_p=0.8,
-                    temperature=0.5,
-                    speed=0.95,
-                )
+                if key and cache.fetch(key, output_path):
+                    results.append({
+                        "emotion": emotion,
+                        "text": text,
+                        "path": output_path,
+                        "ref_path": ref["path"],
+                        "status": "success",
+                        "cached": True,
+                    })
+                    print(f"  ✓ {emotion}_{i+1}: {text[:20]}... (缓存)")
+                    continue
                 
-                result_list = list(synthesis_result)
-                if result_list:
-                    sr = result_list[0][0]
-                    audio = np.concatenate([item[1] for item in result_list])
-                    sf.write(output_path, audio, sr)
+                synth.load(gpt_path, sovits_path)
+                timing = synth.synthesize(text, ref, output_path)
+                if timing:
+                    if key:
+                        cache.store(key, output_path, meta={"text": text, "emotion": emotion})
                     results.append({
                         "emotion": emotion,
                         "text": text,
                         "path": output_path,
-                        "status": "success"
+                        "ref_path": ref["path"],
+                        "status": "success",
+                        "ttfa_seconds": round(timing["ttfa"], 3),
+                        "synthesis_seconds": round(timing["total"], 3),
+                        "audio_seconds": round(timing["audio_seconds"], 3),
+                        "rtf": round(timing["rtf"], 3) if timing["rtf"] else None,
+                    })
+                    print(f"  ✓ {emotion}_{i+1}: {text[:20]}... "
+                          f"(首包 {timing['ttfa']:.2f}s, 总 {timing['total']:.2f}s)")
+                else:
+                    # 没有产出音频也要进账本，计入失败数
+                    results.append({
+                        "emotion": emotion,
+                        "text": text,
+                        "error": "no audio",
+                        "status": "failed"
                     })
-                    print(f"  ✓ {emotion}_{i+1}: {text[:20]}...")
+                    print(f"  ✗ {emotion}_{i+1}: no audio")
             except Exception as e:
                 results.append({
                     "emotion": emotion,
@@ -147,46 +319,110 @@ def evaluate_checkpoint(sovits_path, gpt_path, ref_lib, output_subdir):
                 })
                 print(f"  ✗ {emotion}_{i+1}: {e}")
     
+    if cache:
+        print(f"  {cache.stats_line()}")
+        cache.close()
+    if synth.stats_line():
+        print(f"  {synth.stats_line()}")
     return results
 
+def build_grid(sovits_ckpts, gpt_ckpts, output_dir=OUTPUT_DIR):
+    """SoVITS × GPT 全组合，每个组合一个输出子目录"""
+    combos = []
+    for gpt_path in gpt_ckpts:
+        gpt_name = os.path.basename(gpt_path).replace('.ckpt', '')
+        for sovits_path in sovits_ckpts:
+            sovits_name = os.path.basename(sovits_path).replace('.pth', '')
+            key = f"{sovits_name}__{gpt_name}"
+            combos.append({
+                "key": key,
+                "gpt_path": gpt_path,
+                "sovits_path": sovits_path,
+                "output_dir": os.path.join(output_dir, key),
+            })
+    return combos
+
 def main():
-    import json
+    import argparse
+    from atri_eval_scheduler import detect_devices, run_grid
+    from atri_audio_metrics import print_ranking, summarize_checkpoints, write_summary
+    
+    parser = argparse.ArgumentParser(description="ATRI 模型自动评测")
+    parser.add_argument("--server", type=str, default=DEFAULT_SERVER, help="常驻 TTS 服务地址")
+    parser.add_argument("--no-server", action="store_true", help="不使用常驻服务，进程内加载模型")
+    parser.add_argument("--stream", action="store_true", help="请求常驻服务逐段发送并边收边写盘")
+    parser.add_argument("--no-cache", action="store_true", help="跳过结果缓存，重新采样全部测试句")
+    parser.add_argument("--synthesizer", choices=sorted(SYNTHESIZERS), default=None,
+                        help="合成器 (默认: 服务可用时 server，否则 local；stub 用于无 GPU 测试)")
+    parser.add_argument("--workers", type=int, default=1, help="没有 GPU 时的 CPU 工作进程数")
+    parser.add_argument("--sovits-last", type=int, default=0, help="只评测最新的 N 个 SoVITS (0 = 全部)")
+    parser.add_argument("--gpt-last", type=int, default=0, help="只评测最新的 N 个 GPT (0 = 全部)")
+    parser.add_argument("--ledger", type=str, default=None,
+                        help="结果账本，重跑时跳过已完成的组合 (默认: <输出目录>/evaluation_ledger.jsonl)")
+    parser.add_argument("--metrics-workers", type=int, default=None, help="计算音频指标的进程数 (默认 CPU 核数)")
+    parser.add_argument("--gpt-sovits-path", type=str, default=GPT_SOVITS_PATH, help="GPT-SoVITS 目录 (local 合成器)")
+    parser.add_argument("--sovits-dir", type=str, default=CHECKPOINTS_DIR, help="SoVITS checkpoint 目录")
+    parser.add_argument("--gpt-dir", type=str, default=GPT_CHECKPOINTS_DIR, help="GPT checkpoint 目录")
+    parser.add_argument("--reference-library", type=str, default=REFERENCE_LIBRARY, help="参考音频库 JSON")
+    parser.add_argument("--output-dir", type=str, default=OUTPUT_DIR, help="评测输出目录")
+    args = parser.parse_args()
+    # local 合成器导入 GPT-SoVITS 时会切换工作目录，相对路径先转成绝对路径
+    output_dir = os.path.abspath(args.output_dir)
+    ledger_path = os.path.abspath(args.ledger or os.path.join(output_dir, "evaluation_ledger.jsonl"))
     
     print("🎯 ATRI 模型自动评测系统")
     print("=" * 60)
     
-    ref_lib = load_reference_library()
-    sovits_ckpts, gpt_ckpts = find_checkpoints()
+    synth_name, synth_options = args.synthesizer, {}
+    if synth_name is None:
+        synth_name = "server" if not args.no_server and server_alive(args.server) else "local"
+    if synth_name == "server":
+        synth_options = {"server": args.server, "stream": args.stream}
+        print(f"🛰️ 使用常驻 TTS 服务: {args.server}")
+    elif synth_name == "local":
+        synth_options = {"gpt_sovits_path": args.gpt_sovits_path}
+    
+    sovits_ckpts, gpt_ckpts = find_checkpoints(args.sovits_dir, args.gpt_dir)
     
     print(f"找到 SoVITS checkpoints: {len(sovits_ckpts)}")
     print(f"找到 GPT checkpoints: {len(gpt_ckpts)}")
     
     if not sovits_ckpts or not gpt_ckpts:
         print("⚠️ 未找到 checkpoint，请先完成训练！")
-        print(f"  SoVITS 目录: {CHECKPOINTS_DIR}")
-        print(f"  GPT 目录: {GPT_CHECKPOINTS_DIR}")
+        print(f"  SoVITS 目录: {args.sovits_dir}")
+        print(f"  GPT 目录: {args.gpt_dir}")
         return
     
-    # 评测最新的和中间的 checkpoint
-    all_results = {}
-    
-    # 使用最新的 GPT，测试不同的 SoVITS
-    latest_gpt = gpt_ckpts[-1] if gpt_ckpts else None
+    if args.sovits_last:
+        sovits_ckpts = sovits_ckpts[-args.sovits_last:]
+    if args.gpt_last:
+        gpt_ckpts = gpt_ckpts[-args.gpt_last:]
+    combos = build_grid(sovits_ckpts, gpt_ckpts, output_dir)
     
-    for sovits_path in sovits_ckpts[-3:]:  # 最近 3 个
-        ckpt_name = os.path.basename(sovits_path).replace('.pth', '')
-        output_subdir = os.path.join(OUTPUT_DIR, ckpt_name)
-        
-        results = evaluate_checkpoint(sovits_path, latest_gpt, ref_lib, output_subdir)
-        all_results[ckpt_name] = results
+    # 常驻服务串行合成，只需一个工作进程；进程内合成每块 GPU 一个
+    devices = ["server"] if synth_name == "server" else detect_devices(args.workers)
+    ledger = run_grid(
+        combos, evaluate_checkpoint, make_synthesizer, synth_name, synth_options,
+        devices=devices, ledger_path=ledger_path,
+        ref_lib=load_reference_library(args.reference_library), use_cache=not args.no_cache,
+    )
     
-    # 保存结果摘要
-    summary_path = os.path.join(OUTPUT_DIR, "evaluation_summary.json")
-    with open(summary_path, 'w', encoding='utf-8') as f:
-        json.dump(all_results, f, ensure_ascii=False, indent=2)
+    # 保存结果摘要（包含账本中以前完成的组合）
+    finished = ledger.results()
+    all_results = {c["key"]: finished[c["key"]] for c in combos if c["key"] in finished}
+    # 客观指标（时长 / RTF / 静音 / 削波 / 响度 / F0 / 与参考的频谱距离），按 checkpoint 汇总排名
+    summary = summarize_checkpoints(all_results, args.metrics_workers,
+                                    combos={c["key"]: c for c in combos})
+    summary_path = os.path.join(output_dir, "evaluation_summary.json")
+    csv_path = os.path.join(output_dir, "evaluation_summary.csv")
+    utterance_csv_path = os.path.join(output_dir, "evaluation_utterances.csv")
+    write_summary(summary, summary_path, csv_path, utterance_csv_path)
+    print_ranking(summary)
     
-    print(f"\n✓ 评测完成！结果保存至: {OUTPUT_DIR}")
+    print(f"\n✓ 评测完成！结果保存至: {output_dir}")
     print(f"  摘要文件: {summary_path}")
+    print(f"  指标表格: {csv_path}, {utterance_csv_path}")
+    print(f"  结果账本: {ledger_path}")
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,37 @@
 import re
+import sys
 import json
 import glob
 import os
 import time
+import tracemalloc
+from json.encoder import encode_basestring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scenario_cache import ScenarioCache
+from jsonl_io import JsonlWriter
+from dataset_registry import DatasetRegistry
 
 # ================= 配置 =================
 SOURCE_DIR = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/dataset/phase2_import"
 OUTPUT_DIR = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/dataset/llm_finetune"
 DATASET_INFO_PATH = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/frameworks/LLaMA-Factory/data/dataset_info.json"
+# 最新 key 指针（给 bash 使用；也可用 python dataset_registry.py latest 读取）
+LATEST_KEY_PATH = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/latest_dataset_key.tmp"
+CACHE_PATH = os.path.join(OUTPUT_DIR, ".extract_cache.sqlite")
+
+# 正则 / 提取结构变化时递增，旧缓存自动失效
+# (clean_text 和对话拼接在读缓存之后执行，修改它们不需要递增)
+# v2: 缓存记录由 [角色, CN] 改为 [角色, JA, EN, CN]
+EXTRACTOR_VERSION = 2
+
+# 语言槽位（剧本里 [[JA], [EN], [CN]] 的顺序）及各语言语料的 system prompt
+LANGUAGES = ("ja", "en", "cn")
+SYSTEM_PROMPTS = {
+    "cn": "你叫亚托莉（Atri），是一个高性能的机器人少女。你说话语气略带骄傲，但内心温柔。",
+    "ja": "あなたはアトリ（Atri）、高性能なロボットの少女です。少し得意げな口調で話しますが、心は優しいです。",
+    "en": "You are Atri, a high-performance robot girl. You speak with a hint of pride, but you are gentle at heart.",
+}
 
 # 角色映射表
 ROLE_MAP = {
@@ -38,128 +62,259 @@ def clean_text(text):
     text = re.sub(r'[」"””]$', '', text)
     return text.strip()
 
-def extract():
+# 核心 Regex:
+# 匹配 ["Char", ..., [[JA], [EN], [CN], ...]]
+# 我们捕捉 Group 1 (Char) 和 Group 2 (CN Text)
+# 如果 CN 不存在，我们暂时也不要 JA (因为我们需要训练中文模型)
+
+# 注意：JSON 里的结构是 [[null,"JA"], [null,"EN"], [null,"CN"]]
+# 而且之间可能有换行，因为 grep 显示在一行是 grep 的行为，实际文件即使被压缩成一行，Regex 也要能匹配。
+# 我们先读取整个文件，然后移除换行，再匹配。
+LINE_PATTERN = re.compile(
+    r'\[\s*"([^"]+)"\s*,\s*(?:null|"[^"]*")\s*,\s*\[\s*'       # ["Char", DisplayName, [
+    r'\[\s*(?:null|"[^"]*")\s*,\s*"(?:[^"\\]|\\.)*"\s*\]\s*,\s*' # JA
+    r'\[\s*(?:null|"[^"]*")\s*,\s*"(?:[^"\\]|\\.)*"\s*\]\s*,\s*' # EN
+    r'\[\s*(?:null|"[^"]*")\s*,\s*"((?:[^"\\]|\\.)*)"\s*\]'      # CN -> Group 2
+)
+
+def extract_file_lines(fpath):
+    """提取单个剧本文件中的 [角色, CN 原文] 列表（正则实现，保留作 --benchmark 对照）"""
+    with open(fpath, 'r', encoding='utf-8') as f:
+        # 暴力移除换行，确保 Regex 能在一行内匹配所有内容
+        # 这对于处理格式化/非格式化的 JSON 都最稳健
+        content = f.read().replace('\n', ' ')
+    return [list(m) for m in LINE_PATTERN.findall(content)]
+
+# === 单遍 JSON 解析 ===
+# extract_file_lines 先整份复制一遍去掉换行，再用回溯很重的正则在超长单行上匹配，而且只取 CN。
+# 这里直接 json.loads 一次，按文档顺序遍历数组，凡是结构为
+# [角色, 显示名|null, [[名|null, JA], [名|null, EN], [名|null, CN], ...], ...] 的数组
+# 一次取出三种语言。判定条件与 LINE_PATTERN 逐项对应，输出与正则路径一致。
+
+def _unquoted(value):
+    """LINE_PATTERN 中 (?:null|"[^"]*") 能匹配的值：null 或不含引号的字符串"""
+    return value is None or (isinstance(value, str) and '"' not in value)
+
+
+_NEEDS_ESCAPE = re.compile(r'[\x00-\x1f"\\]')
+
+
+def _raw(text):
+    """还原成文件中的转义形式（与正则捕获的原文一致，clean_text 照常处理）"""
+    if _NEEDS_ESCAPE.search(text) is None:
+        return text
+    return encode_basestring(text)[1:-1]
+
+
+def _dialogue_slots(node):
+    """node 为对话数组时返回 [角色, JA, EN, CN]，否则返回 None"""
+    if len(node) < 3 or not isinstance(node[0], str) or not node[0] or '"' in node[0]:
+        return None
+    if not _unquoted(node[1]) or not isinstance(node[2], list) or len(node[2]) < 3:
+        return None
+    texts = []
+    for entry in node[2][:3]:
+        if not (isinstance(entry, list) and len(entry) == 2 and _unquoted(entry[0])
+                and isinstance(entry[1], str)):
+            return None
+        texts.append(_raw(entry[1]))
+    return [_raw(node[0])] + texts
+
+
+def iter_dialogue_slots(data):
+    """按文档顺序（先序）遍历 JSON 树，逐条产出 [角色, JA, EN, CN]
+
+    只有数组 / 对象入栈；对话数组本身的角色名和三个语言槽位不会再含对话，跳过不再遍历。
+    """
+    containers = (list, dict)
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(v for v in reversed(list(node.values())) if isinstance(v, containers))
+            continue
+        slots = _dialogue_slots(node)
+        if slots:
+            yield slots
+            # 出栈顺序: node[2][3:] 在前，node[3:] 在后
+            stack.extend(v for v in reversed(node[3:]) if isinstance(v, containers))
+            stack.extend(v for v in reversed(node[2][3:]) if isinstance(v, containers))
+        else:
+            stack.extend(v for v in reversed(node) if isinstance(v, containers))
+
+
+def extract_file_slots(fpath):
+    """单遍提取单个剧本文件中的 [角色, JA, EN, CN] 列表"""
+    try:
+        with open(fpath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        # 不是合法 JSON（反编译不完整等）：退回正则，只有 CN
+        print(f"⚠️ JSON 解析失败，退回正则提取: {os.path.basename(fpath)} ({e})")
+        return [[char_id, None, None, text] for char_id, text in extract_file_lines(fpath)]
+    return list(iter_dialogue_slots(data))
+
+
+def build_conversation(rows, lang="cn"):
+    """把 [角色, JA, EN, CN] 行按指定语言拼成 ShareGPT 对话（同一人连续发话合并）"""
+    slot = 1 + LANGUAGES.index(lang)
+    current_conv = []
+    for row in rows:
+        char_id, text = row[0], clean_text(row[slot])
+        if not text: continue
+        
+        # 确定角色
+        role = ROLE_MAP.get(char_id)
+        if not role:
+            # 如果不在 Map 里，但也不是 "envupdate" 这种命令
+            # 我们假设它是配角 human
+            # 排除纯指令
+            if len(char_id) > 20 or "update" in char_id:
+                continue
+            role = "human"
+        
+        # 构建对话流
+        if current_conv and current_conv[-1]["from"] == role:
+            # 合并同一个人连续发话
+            current_conv[-1]["value"] += " " + text
+        else:
+            # 必须由 human/gpt 开头。如果第一句就是 gpt，允许 gpt 开头 (LLaMA Factory warning)
+            current_conv.append({"from": role, "value": text})
+    return current_conv
+
+
+def benchmark_extractors(source_dir=SOURCE_DIR, repeat=3):
+    """对比正则与单遍 JSON 解析的耗时、峰值内存，并校验 CN 对话输出一致"""
+    files = [f for f in sorted(glob.glob(os.path.join(source_dir, "*.json"))) if not f.endswith(".resx.json")]
+    total_mb = sum(os.path.getsize(f) for f in files) / 1e6
+    print(f"基准测试: {len(files)} 个文件 ({total_mb:.1f} MB), 重复 {repeat} 次")
+
+    extractors = [("regex", extract_file_lines), ("json", extract_file_slots)]
+    results = {}
+    for name, extractor in extractors:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = {f: extractor(f) for f in files}
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        # 峰值内存单独测（tracemalloc 会拖慢计时）：逐个文件提取，取单文件峰值的最大值
+        peak = 0
+        for f in files:
+            tracemalloc.start()
+            extractor(f)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results[name] = rows
+        print(f"  {name:<6} {best:.3f}s  峰值内存 {peak / 1e6:.1f} MB  ({sum(map(len, rows.values()))} 行)")
+
+    mismatched = [
+        os.path.basename(f) for f in files
+        if build_conversation([[c, None, None, t] for c, t in results["regex"][f]])
+        != build_conversation(results["json"][f], "cn")
+    ]
+    if mismatched:
+        print(f"  ⚠️ CN 对话不一致的文件: {', '.join(mismatched)}")
+    else:
+        print("  ✓ 两种方式的 CN 对话完全一致")
+    return mismatched
+
+
+def extract(use_cache=True):
+    """提取三种语言的 ShareGPT 对话，每处理完一个剧本文件就写出（JSONL，一行一组对话）
+
+    返回 ({语言: 输出路径}, 时间戳)。写出期间输出文件旁有 .writing 标记，
+    下游可用 jsonl_io.iter_jsonl(path, follow=True) 边提取边读取。
+    """
     print("🚀 开始提取多语言对话数据...")
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     files = glob.glob(os.path.join(SOURCE_DIR, "*.json"))
     print(f"📂 扫描 {len(files)} 个文件 in {SOURCE_DIR}")
     
-    all_conversations = []
-    
-    # 核心 Regex:
-    # 匹配 ["Char", ..., [[JA], [EN], [CN], ...]]
-    # 我们捕捉 Group 1 (Char) 和 Group 2 (CN Text)
-    # 如果 CN 不存在，我们暂时也不要 JA (因为我们需要训练中文模型)
-    
-    # 注意：JSON 里的结构是 [[null,"JA"], [null,"EN"], [null,"CN"]]
-    # 而且之间可能有换行，因为 grep 显示在一行是 grep 的行为，实际文件即使被压缩成一行，Regex 也要能匹配。
-    # 我们先读取整个文件，然后移除换行，再匹配。
-    
-    pattern = re.compile(
-        r'\[\s*"([^"]+)"\s*,\s*(?:null|"[^"]*")\s*,\s*\[\s*'       # ["Char", DisplayName, [
-        r'\[\s*(?:null|"[^"]*")\s*,\s*"(?:[^"\\]|\\.)*"\s*\]\s*,\s*' # JA
-        r'\[\s*(?:null|"[^"]*")\s*,\s*"(?:[^"\\]|\\.)*"\s*\]\s*,\s*' # EN
-        r'\[\s*(?:null|"[^"]*")\s*,\s*"((?:[^"\\]|\\.)*)"\s*\]'      # CN -> Group 2
-    )
+    # CN 沿用原来的文件名，JA / EN 加语言后缀
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    output_paths = {
+        lang: os.path.join(OUTPUT_DIR, f"atri_sharegpt{'' if lang == 'cn' else '_' + lang}_{timestamp}.jsonl")
+        for lang in LANGUAGES
+    }
+    writers = {lang: JsonlWriter(path) for lang, path in output_paths.items()}
     
     total_found = 0
     
-    for fpath in files:
-        if fpath.endswith(".resx.json"): continue
-        
-        try:
-            with open(fpath, 'r', encoding='utf-8') as f:
-                # 暴力移除换行，确保 Regex 能在一行内匹配所有内容
-                # 这对于处理格式化/非格式化的 JSON 都最稳健
-                content = f.read().replace('\n', ' ') 
-        except Exception as e:
-            print(f"Skipping {fpath}: {e}")
-            continue
-            
-        # 查找所有匹配
-        matches = pattern.findall(content)
-        if not matches:
-             # 有些文件可能只有日文，没有 EN/CN，这些正则会失败。
-             # 但我们要的是中文数据。
-             continue
-             
-        # print(f"File {os.path.basename(fpath)}: Found {len(matches)} lines")
-        total_found += len(matches)
-        
-        current_conv = []
-        
-        for char_id, raw_text in matches:
-            text = clean_text(raw_text)
-            if not text: continue
+    cache = ScenarioCache(CACHE_PATH, "extract_multilang_dialogue", EXTRACTOR_VERSION) if use_cache else None
+    
+    try:
+        for fpath in files:
+            if fpath.endswith(".resx.json"): continue
             
-            # 确定角色
-            role = ROLE_MAP.get(char_id)
-            if not role:
-                # 如果不在 Map 里，但也不是 "envupdate" 这种命令
-                # 我们假设它是配角 human
-                # 排除纯指令
-                if len(char_id) > 20 or "update" in char_id:
+            # 只有内容变化的文件才重新解析
+            matches = cache.get(fpath) if cache else None
+            if matches is None:
+                try:
+                    matches = extract_file_slots(fpath)
+                except Exception as e:
+                    print(f"Skipping {fpath}: {e}")
                     continue
-                role = "human"
+                if cache:
+                    cache.put(fpath, matches)
             
-            # 构建对话流
-            if not current_conv:
-                # 必须由 human/gpt 开头。如果第一句就是 gpt，我们怎么处理？
-                # ShareGPT 格式最好是 human 开头。
-                # 但如果是 gpt 开头，我们可以补一个空 human，或者允许 gpt 开头 (LLaMA Factory warning)
-                current_conv.append({"from": role, "value": text})
-            else:
-                last_msg = current_conv[-1]
-                if last_msg["from"] == role:
-                    # 合并同一个人连续发话
-                    last_msg["value"] += " " + text
-                else:
-                    current_conv.append({"from": role, "value": text})
-        
-        # 保存该文件的对话
-        if len(current_conv) >= 2:
-            # 只有包含 GPT 的对话才有意义
-            if any(msg["from"] == "gpt" for msg in current_conv):
-                all_conversations.append({
-                    "conversations": current_conv,
-                    "system": "你叫亚托莉（Atri），是一个高性能的机器人少女。你说话语气略带骄傲，但内心温柔。"
-                })
-
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    output_filename = f"atri_sharegpt_{timestamp}.json"
-    output_path = os.path.join(OUTPUT_DIR, output_filename)
+            if not matches:
+                 # 有些文件可能只有日文，没有 EN/CN，这些文件没有三语对照行。
+                 continue
+                 
+            total_found += len(matches)
+            
+            # 同一批行按三种语言各拼一份对话
+            for lang in LANGUAGES:
+                current_conv = build_conversation(matches, lang)
+                
+                # 保存该文件的对话
+                if len(current_conv) >= 2:
+                    # 只有包含 GPT 的对话才有意义
+                    if any(msg["from"] == "gpt" for msg in current_conv):
+                        writers[lang].write({
+                            "conversations": current_conv,
+                            "system": SYSTEM_PROMPTS[lang]
+                        })
+                # 每个剧本文件写完即可被下游读到
+                writers[lang].flush()
+    finally:
+        for writer in writers.values():
+            writer.close()
+        if cache:
+            cache.close()
+    
+    if cache:
+        print(f"   {cache.stats_line()}")
     
     print(f"✅ 处理完成！")
     print(f"   - 原始提取行数: {total_found}")
-    print(f"   - 生成对话组数: {len(all_conversations)}")
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(all_conversations, f, ensure_ascii=False, indent=2)
+    for lang in LANGUAGES:
+        print(f"   - 生成对话组数 [{lang.upper()}]: {writers[lang].records} -> {output_paths[lang]}")
         
-    return output_path, timestamp
+    return output_paths, timestamp
 
 if __name__ == "__main__":
-    path, ts = extract()
+    if "--benchmark" in sys.argv:
+        benchmark_extractors()
+        sys.exit(0)
+    
+    paths, ts = extract(use_cache="--no-cache" not in sys.argv)
     
-    # 注册
+    # 注册（CN 为训练默认使用的 key，JA / EN 带语言后缀一并注册）
+    # 加锁 + 原子替换，并发的提取任务 / 训练启动脚本不会丢失写入或读到半截文件
     try:
-        with open(DATASET_INFO_PATH, 'r', encoding='utf-8') as f:
-            info = json.load(f)
-        
         key = f"atri_corpus_{ts}"
-        info[key] = {
-            "file_name": path,
-            "formatting": "sharegpt",
-            "columns": {"messages": "conversations", "system": "system"}
-        }
-        
-        with open(DATASET_INFO_PATH, 'w', encoding='utf-8') as f:
-            json.dump(info, f, ensure_ascii=False, indent=2)
-            
-        # 写入 key 给 bash
-        with open("/mnt/t2-6tb/Linpeikai/Voice/ATRI/latest_dataset_key.tmp", "w") as f:
-            f.write(key)
+        registry = DatasetRegistry(DATASET_INFO_PATH, latest_path=LATEST_KEY_PATH)
+        registry.register_many({
+            key if lang == "cn" else f"atri_corpus_{lang}_{ts}": {
+                "file_name": path,
+                "formatting": "sharegpt",
+                "columns": {"messages": "conversations", "system": "system"}
+            }
+            for lang, path in paths.items()
+        }, latest=key)
             
         print(f"Key registered: {key}")
         
@@ -7,12 +7,22 @@ ATRI 超高质量语音合成脚本
 
 import os
 import sys
+import json
+import shutil
 import argparse
 import time
+import inspect
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import soundfile as sf
 import torch
 
+from atri_tts_client import DEFAULT_SERVER, TTSServerUnavailable, synthesize_remote
+from atri_tts_stream import StreamTimer, stream_to_wav
+from atri_ref_cache import install_ref_cache
+from atri_tts_cache import open_result_cache, request_key
+from atri_text_frontend import iter_pipelined_segments
+
 # === Configuration ===
 GPT_SOVITS_PATH = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/frameworks/GPT-SoVITS"
 DATASET_PATH = "/mnt/t2-6tb/Linpeikai/Voice/ATRI/dataset/gpt_sovits_train/wavs"
@@ -57,20 +67,222 @@ REF_PRESETS = {
     }
 }
 
-# === Setup paths ===
-sys.path.insert(0, GPT_SOVITS_PATH)
-sys.path.insert(0, os.path.join(GPT_SOVITS_PATH, "GPT_SoVITS"))
-os.chdir(GPT_SOVITS_PATH)
+# === GPT-SoVITS (imported on first use) ===
+# Deferred so that the presets, the TTS server and its clients can be
+# imported on machines without GPT-SoVITS / a GPU.
+i18n = None
+change_gpt_weights = change_sovits_weights = get_tts_wav = None
+webui = None  # GPT_SoVITS.inference_webui, driven by the text front end
+ref_cache = None  # RefFeatureCache, installed together with GPT-SoVITS
+
+# Batched inference (TTS_infer_pack) takes language codes instead of the webui's i18n names
+BATCH_LANGUAGES = {"日文": "all_ja", "中文": "all_zh", "英文": "en"}
+TTS_INFER_CONFIG = "GPT_SoVITS/configs/tts_infer.yaml"
+
+
+def setup_gpt_sovits_path():
+    """Make GPT-SoVITS importable; its modules use paths relative to the repo root (idempotent)"""
+    if GPT_SOVITS_PATH not in sys.path:
+        sys.path.insert(0, GPT_SOVITS_PATH)
+        sys.path.insert(0, os.path.join(GPT_SOVITS_PATH, "GPT_SoVITS"))
+    os.chdir(GPT_SOVITS_PATH)
+
+
+def import_gpt_sovits():
+    """Set up paths and import GPT-SoVITS inference functions (idempotent)"""
+    global i18n, change_gpt_weights, change_sovits_weights, get_tts_wav, webui, ref_cache
+    if get_tts_wav is not None:
+        return
+    
+    setup_gpt_sovits_path()
+    
+    try:
+        from tools.i18n.i18n import I18nAuto
+        import GPT_SoVITS.inference_webui as webui_module
+        # Reference audio features are cached across calls (must wrap before importing the names)
+        ref_cache = install_ref_cache(webui_module)
+        from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
+        webui = webui_module
+        i18n = I18nAuto()
+        print("✓ GPT-SoVITS modules loaded successfully")
+    except ImportError as e:
+        print(f"✗ Failed to import GPT-SoVITS: {e}")
+        raise
+
+
+def normalize_peak(audio):
+    """Float audio scaled to a 0.95 peak when it would otherwise clip (int16 input always is)"""
+    max_val = np.abs(audio).max()
+    if max_val > 0.99:
+        audio = audio / max_val * 0.95
+    return audio
+
+
+# TTS_infer_pack methods BatchedTTS hooks or calls, with the leading parameters it relies on
+# (TTS.run calls audio_postprocess positionally, so the order matters)
+BATCH_HOOK_SIGNATURES = {
+    "TTS.audio_postprocess": ("audio", "sr", "batch_index_list", "speed_factor", "split_bucket", "fragment_interval"),
+    "TTS.recovery_order": ("data", "batch_index_list"),
+    "TextPreprocessor.preprocess": ("text", "lang", "text_split_method"),
+    "TextPreprocessor.pre_seg_text": ("text", "lang", "text_split_method"),
+    "TextPreprocessor.segment_and_extract_feature_for_text": ("text", "language"),
+}
+
 
-# === Import GPT-SoVITS ===
-try:
-    from tools.i18n.i18n import I18nAuto
-    from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
-    i18n = I18nAuto()
-    print("✓ GPT-SoVITS modules loaded successfully")
-except ImportError as e:
-    print(f"✗ Failed to import GPT-SoVITS: {e}")
-    sys.exit(1)
+class BatchedTTSUnavailable(RuntimeError):
+    """TTS_infer_pack is missing or its internals differ from what BatchedTTS hooks"""
+
+
+class BatchedTTS:
+    """
+    Cross-utterance batched inference on GPT-SoVITS' TTS_infer_pack.TTS.
+    
+    TTS.run() batches the text fragments of one input (batch_size, split_bucket,
+    parallel_infer) but returns them as a single concatenated waveform. Here the
+    fragments of many utterances that share a reference are fed through one run():
+    each utterance is cut by TTS_infer_pack's own pre_seg_text, the preprocessor is
+    handed exactly that fragment list, and audio_postprocess is wrapped to collect
+    the decoded fragments in input order, so they can be regrouped per utterance.
+    Reference features are extracted once per run (TTS.prompt_cache).
+    
+    The hooked methods are checked against BATCH_HOOK_SIGNATURES on load; a
+    GPT-SoVITS whose internals differ raises BatchedTTSUnavailable instead of
+    silently misrouting arguments.
+    """
+    
+    def __init__(self, gpt_path: str, sovits_path: str, batch_size: int = 8, split_bucket: bool = True,
+                 text_split_method: str = "cut5"):
+        self.gpt_path = gpt_path
+        self.sovits_path = sovits_path
+        self.batch_size = batch_size
+        self.split_bucket = split_bucket
+        self.text_split_method = text_split_method
+        self.tts = None
+        self.postprocess_signature = None
+    
+    def load(self, gpt_path: str = None, sovits_path: str = None):
+        """Build the TTS pipeline on first use, afterwards reload only the weights that changed"""
+        gpt_path = gpt_path or self.gpt_path
+        sovits_path = sovits_path or self.sovits_path
+        if self.tts is None:
+            setup_gpt_sovits_path()
+            try:
+                from TTS_infer_pack.TTS import TTS, TTS_Config
+                from TTS_infer_pack.TextPreprocessor import TextPreprocessor
+            except ImportError as e:
+                raise BatchedTTSUnavailable(f"TTS_infer_pack not importable: {e}") from e
+            # Checked on the classes, before any weights are loaded
+            self._check_signatures({"TTS": TTS, "TextPreprocessor": TextPreprocessor})
+            config = TTS_Config(TTS_INFER_CONFIG)
+            config.t2s_weights_path, config.vits_weights_path = gpt_path, sovits_path
+            print(f"Loading batched TTS: {os.path.basename(gpt_path)} + {os.path.basename(sovits_path)}")
+            self.tts = TTS(config)
+            self.postprocess_signature = inspect.signature(self.tts.audio_postprocess)
+        else:
+            if gpt_path != self.gpt_path:
+                self.tts.init_t2s_weights(gpt_path)
+            if sovits_path != self.sovits_path:
+                self.tts.init_vits_weights(sovits_path)
+        self.gpt_path, self.sovits_path = gpt_path, sovits_path
+    
+    @staticmethod
+    def _check_signatures(classes):
+        for name, expected in BATCH_HOOK_SIGNATURES.items():
+            owner, method = name.split(".")
+            target = getattr(classes[owner], method, None)
+            if target is None:
+                raise BatchedTTSUnavailable(f"TTS_infer_pack has no {name}")
+            params = tuple(inspect.signature(target).parameters)[1:len(expected) + 1]  # skip self
+            if params != expected:
+                raise BatchedTTSUnavailable(f"{name}{params} does not match the expected {expected}")
+    
+    def synthesize(self, texts: list, ref: dict, text_lang: str, params: dict) -> list:
+        """
+        Synthesize texts that share one reference, language and parameter set.
+        
+        Returns:
+            [(sampling_rate, float audio normalized to a 0.95 peak) or None, ...] in input order;
+            None marks a text that produced no audio (empty or punctuation only)
+        """
+        self.load()
+        lang = BATCH_LANGUAGES[text_lang]
+        preprocessor = self.tts.text_preprocessor
+        segments, owners = [], []
+        for index, text in enumerate(texts):
+            for segment in preprocessor.pre_seg_text(text, lang, self.text_split_method):
+                segments.append(segment)
+                owners.append(index)
+        if not segments:
+            return [None] * len(texts)
+        
+        kept, fragments = [], []
+        
+        def preprocess(text, lang, text_split_method, version="v2"):
+            data = []
+            for index, segment in enumerate(segments):
+                phones, bert_features, norm_text = preprocessor.segment_and_extract_feature_for_text(
+                    segment, lang, version)
+                if phones is None or norm_text == "":
+                    continue
+                data.append({"phones": phones, "bert_features": bert_features, "norm_text": norm_text})
+                kept.append(index)
+            return data
+        
+        postprocess = self.tts.audio_postprocess
+        
+        def collect(*args, **kwargs):
+            call = self.postprocess_signature.bind(*args, **kwargs)
+            call.apply_defaults()
+            audio, batch_index_list = call.arguments["audio"], call.arguments["batch_index_list"]
+            if call.arguments["split_bucket"]:
+                ordered = self.tts.recovery_order(audio, batch_index_list)
+            else:
+                ordered = sum(audio, [])
+            for fragment in ordered:
+                call.arguments.update(audio=[[fragment]], batch_index_list=None, split_bucket=False)
+                fragments.append(postprocess(*call.args, **call.kwargs))
+            return fragments[0] if fragments else (call.arguments["sr"], np.zeros(0, dtype=np.int16))
+        
+        inputs = {
+            "text": "\n".join(texts),
+            "text_lang": lang,
+            "ref_audio_path": ref["path"],
+            "prompt_text": ref["text"],
+            "prompt_lang": BATCH_LANGUAGES[ref["lang"]],
+            "top_k": params["top_k"],
+            "top_p": params["top_p"],
+            "temperature": params["temperature"],
+            "sample_steps": params["sample_steps"],
+            "super_sampling": params["if_sr"],
+            "speed_factor": params["speed"],
+            "fragment_interval": 0,  # pauses are inserted per utterance below
+            "text_split_method": self.text_split_method,
+            "batch_size": self.batch_size,
+            "split_bucket": self.split_bucket,
+            "parallel_infer": True,
+            "return_fragment": False,
+        }
+        preprocessor.preprocess, self.tts.audio_postprocess = preprocess, collect
+        try:
+            for _ in self.tts.run(inputs):
+                pass
+        finally:
+            del preprocessor.preprocess, self.tts.audio_postprocess
+        
+        per_text = [[] for _ in texts]
+        sampling_rate = None
+        for index, (sampling_rate, audio) in zip(kept, fragments):
+            per_text[owners[index]].append(audio)
+        
+        results = []
+        for chunks in per_text:
+            if not chunks:
+                results.append(None)
+                continue
+            pause = np.zeros(int(sampling_rate * params["pause_second"]), dtype=chunks[0].dtype)
+            audio = np.concatenate([c for chunk in chunks for c in (pause, chunk)][1:]).astype(np.float32)
+            results.append((sampling_rate, normalize_peak(audio)))
+        return results
 
 
 class HQSynthesizer:
@@ -87,38 +299,98 @@ class HQSynthesizer:
         "pause_second": 0.2,  # Inter-sentence pause
     }
     
-    def __init__(self):
+    def __init__(self, gpt_path: str = GPT_MODEL_PATH, sovits_path: str = SOVITS_MODEL_PATH,
+                 use_result_cache: bool = True, batch_size: int = 8, split_bucket: bool = True):
+        self.gpt_path = gpt_path
+        self.sovits_path = sovits_path
+        self.loaded_gpt = None
+        self.loaded_sovits = None
         self.initialized = False
+        self.use_result_cache = use_result_cache
+        self._result_cache = None
+        self.batch_size = batch_size
+        self.split_bucket = split_bucket
+        self._batched = None
+        
+    @property
+    def result_cache(self):
+        """Synthesized-utterance cache (opened on first use, None when disabled)"""
+        if self.use_result_cache and self._result_cache is None:
+            self._result_cache = open_result_cache()
+            self.use_result_cache = self._result_cache is not None
+        return self._result_cache
+    
+    def cache_key(self, text: str, ref_preset: str = "default", ref: dict = None,
+                  stream: bool = False, batched: bool = False, **kwargs) -> str:
+        """Result cache key for a request; needs no model work
+        
+        batched: the result comes from BatchedTTS (TTS_infer_pack), a different
+        decoding pipeline, so it is kept apart from inference_webui results.
+        """
+        ref, _, params = self._resolve(ref_preset, ref, kwargs)
+        return request_key(text, ref, params, self.gpt_path, self.sovits_path,
+                           namespace="hq_batch" if batched else "hq", stream=stream)
         
+    def batched_tts(self):
+        """TTS_infer_pack pipeline for synthesize_batch (None when batch_size <= 1 or unavailable)"""
+        if self.batch_size <= 1:
+            return None
+        if self._batched is None:
+            batched = BatchedTTS(self.gpt_path, self.sovits_path, self.batch_size, self.split_bucket)
+            try:
+                batched.load()
+            except BatchedTTSUnavailable as e:
+                print(f"⚠️ Batched inference unavailable ({e}), synthesizing batch items one by one")
+                self.batch_size = 1
+                return None
+            self._batched = batched
+        self._batched.load(self.gpt_path, self.sovits_path)
+        return self._batched
+    
     def init_models(self):
         """Load TTS models"""
         if self.initialized:
             return
-            
-        print(f"Loading GPT model: {os.path.basename(GPT_MODEL_PATH)}")
-        change_gpt_weights(gpt_path=GPT_MODEL_PATH)
-        
-        print(f"Loading SoVITS model: {os.path.basename(SOVITS_MODEL_PATH)}")
-        # Pass prompt_language and text_language to get the generator working
-        try:
-            gen = change_sovits_weights(
-                sovits_path=SOVITS_MODEL_PATH,
-                prompt_language="日文",
-                text_language="日文"
-            )
-            for _ in gen:
-                pass
-        except Exception as e:
-            print(f"Warning during SoVITS init: {e}")
-            
+        self.load_weights(self.gpt_path, self.sovits_path)
         self.initialized = True
         print("✓ Models initialized")
+    
+    def load_weights(self, gpt_path: str = None, sovits_path: str = None):
+        """Switch checkpoints, reloading only the weights that actually changed"""
+        import_gpt_sovits()
+        gpt_path = gpt_path or self.gpt_path
+        sovits_path = sovits_path or self.sovits_path
+        
+        if gpt_path != self.loaded_gpt:
+            print(f"Loading GPT model: {os.path.basename(gpt_path)}")
+            change_gpt_weights(gpt_path=gpt_path)
+            self.loaded_gpt = gpt_path
+        
+        if sovits_path != self.loaded_sovits:
+            print(f"Loading SoVITS model: {os.path.basename(sovits_path)}")
+            # Pass prompt_language and text_language to get the generator working
+            try:
+                gen = change_sovits_weights(
+                    sovits_path=sovits_path,
+                    prompt_language="日文",
+                    text_language="日文"
+                )
+                for _ in gen:
+                    pass
+            except Exception as e:
+                print(f"Warning during SoVITS init: {e}")
+            self.loaded_sovits = sovits_path
+        
+        self.gpt_path, self.sovits_path = gpt_path, sovits_path
         
     def synthesize(
         self,
         text: str,
         ref_preset: str = "default",
         output_path: str = None,
+        ref: dict = None,
+        stream: bool = False,
+        use_cache: bool = True,
         **kwargs
     ) -> str:
         """
@@ -128,18 +400,66 @@ class HQSynthesizer:
             text: Text to synthesize (Chinese/Japanese/English)
             ref_preset: Reference audio preset name
             output_path: Optional output file path
+            ref: Explicit reference {"path", "text", "lang"}; overrides ref_preset
+            stream: Write each segment as soon as it is decoded (see stream_audio)
+            use_cache: Look up / fill the result cache; False resamples even identical requests
             **kwargs: Override default parameters
         
         Returns:
             Path to generated audio file
         """
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        if output_path is None:
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(OUTPUT_DIR, f"hq_{ref_preset}_{timestamp}.wav")
+        
+        # Cache lookup happens before any model is loaded
+        key = None
+        if use_cache and self.result_cache is not None:
+            key = self.cache_key(text, ref_preset, ref, stream, **kwargs)
+            if self.result_cache.fetch(key, output_path):
+                print(f"\n✓ Cached: {output_path}")
+                print(f"  {self.result_cache.stats_line()}")
+                return output_path
+        
         self.init_models()
+        output_path = self._synthesize_to_file(text, ref_preset, output_path, ref, stream, **kwargs)
+        if key:
+            self.result_cache.store(key, output_path, meta={"text": text, "preset": ref_preset})
+        return output_path
+    
+    def _synthesize_to_file(self, text, ref_preset, output_path, ref, stream, **kwargs) -> str:
+        if stream:
+            timer = stream_to_wav(self.stream_audio(text, ref_preset, ref=ref, **kwargs), output_path)
+            if timer.ttfa is None:
+                raise RuntimeError("No audio generated")
+            print(f"\n✓ Generated: {output_path}")
+            print(f"  {timer.summary()}")
+            return output_path
         
-        # Get reference audio
-        ref = REF_PRESETS.get(ref_preset, REF_PRESETS["default"])
+        timer = StreamTimer()
+        sampling_rate, audio_data = self.synthesize_audio(text, ref_preset, ref=ref, **kwargs)
+        timer.mark(sampling_rate, audio_data)
+        sf.write(output_path, audio_data, sampling_rate)
         
-        # Merge parameters
-        params = {**self.DEFAULT_PARAMS, **kwargs}
+        print(f"\n✓ Generated: {output_path}")
+        print(f"  {timer.summary()}")
+        
+        return output_path
+    
+    def _resolve(self, ref_preset: str, ref: dict, kwargs: dict):
+        """Resolve the reference audio and merge parameters -> (ref, ref_preset, params)"""
+        if ref is None:
+            ref = REF_PRESETS.get(ref_preset, REF_PRESETS["default"])
+        else:
+            ref = {"lang": "日文", **ref}
+            ref_preset = "custom"
+        return ref, ref_preset, {**self.DEFAULT_PARAMS, **kwargs}
+    
+    def _prepare(self, text: str, ref_preset: str, ref: dict, kwargs: dict) -> dict:
+        """Resolve reference + parameters into get_tts_wav keyword arguments (without text/how_to_cut)"""
+        self.init_models()
+        ref, ref_preset, params = self._resolve(ref_preset, ref, kwargs)
         
         print(f"\n{'='*50}")
         print(f"Text: {text}")
@@ -147,19 +467,11 @@ class HQSynthesizer:
         print(f"Parameters: top_k={params['top_k']}, temp={params['temperature']}, steps={params['sample_steps']}")
         print(f"{'='*50}")
         
-        # Detect language
-        text_lang = self._detect_language(text)
-        
-        # Synthesize
-        start_time = time.time()
-        
-        synthesis_result = get_tts_wav(
+        return dict(
             ref_wav_path=ref["path"],
             prompt_text=ref["text"],
             prompt_language=i18n(ref["lang"]),
-            text=text,
-            text_language=i18n(text_lang),
-            how_to_cut=i18n("凑四句一切"),
+            text_language=i18n(self._detect_language(text)),
             top_k=params["top_k"],
             top_p=params["top_p"],
             temperature=params["temperature"],
@@ -168,6 +480,24 @@ class HQSynthesizer:
             speed=params["speed"],
             pause_second=params["pause_second"],
         )
+    
+    def synthesize_audio(
+        self,
+        text: str,
+        ref_preset: str = "default",
+        ref: dict = None,
+        **kwargs
+    ):
+        """
+        Synthesize speech and return it in memory.
+        
+        Returns:
+            (sampling_rate, float audio normalized to a 0.95 peak)
+        """
+        tts_kwargs = self._prepare(text, ref_preset, ref, kwargs)
+        
+        # Synthesize (sentence-split, next segment's text features prefetched)
+        synthesis_result = iter_pipelined_segments(webui, i18n, text, **tts_kwargs)
         
         # Collect results
         result_list = list(synthesis_result)
@@ -182,22 +512,134 @@ class HQSynthesizer:
         if max_val > 0.99:
             audio_data = audio_data / max_val * 0.95
         
-        # Save output
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        if output_path is None:
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            output_path = os.path.join(OUTPUT_DIR, f"hq_{ref_preset}_{timestamp}.wav")
+        return sampling_rate, audio_data
+    
+    def stream_audio(
+        self,
+        text: str,
+        ref_preset: str = "default",
+        ref: dict = None,
+        **kwargs
+    ):
+        """
+        Synthesize speech segment by segment.
         
-        sf.write(output_path, audio_data, sampling_rate)
+        The text is split by the project text front end (atri_text_frontend) exactly
+        as in synthesize_audio and each segment is yielded as soon as it is decoded,
+        so playback / writing can start after the first segment instead of after the
+        whole utterance. The pause between segments is yielded as its own chunk.
+        Chunks are raw int16 PCM; the whole-utterance peak normalization of
+        synthesize_audio cannot be applied before the last segment exists.
         
-        elapsed = time.time() - start_time
-        duration = len(audio_data) / sampling_rate
-        rtf = elapsed / duration
+        Yields:
+            (sampling_rate, int16 audio chunk)
+        """
+        tts_kwargs = self._prepare(text, ref_preset, ref, kwargs)
+        yield from iter_pipelined_segments(webui, i18n, text, **tts_kwargs)
+    
+    def synthesize_batch(self, requests: list, output_dir: str = None, use_cache: bool = True) -> list:
+        """
+        Synthesize many utterances with batched inference.
         
-        print(f"\n✓ Generated: {output_path}")
-        print(f"  Duration: {duration:.2f}s | Time: {elapsed:.2f}s | RTF: {rtf:.2f}x")
+        Cached results are served before any model work. The rest are grouped by
+        reference, text language and parameters; each group is decoded by
+        BatchedTTS (TTS_infer_pack), batch_size fragments at a time across
+        utterances, in runs of up to 4 x batch_size utterances. Wav files are
+        written on a background thread while the GPU moves on to the next run.
+        With batch_size <= 1, or a GPT-SoVITS whose TTS_infer_pack is missing or
+        incompatible, the items of a group are synthesized one after another
+        through inference_webui. Batched results are cached under their own
+        namespace (see cache_key). An item that yields no audio, or whose run
+        raises, is reported with "error" set instead of aborting the batch.
         
-        return output_path
+        Args:
+            requests: [{"text", "preset"?, "ref"?, "params"?, "output"?}, ...]
+            output_dir: Write each result to request["output"] or output_dir/NNNN.wav
+            use_cache: Look up / fill the result cache (only when writing files)
+        
+        Returns:
+            [{"index", "text", "sample_rate", "audio", "path", "cached", "seconds", "error"}, ...]
+            in input order; failed items have audio None and error set
+        """
+        results = [None] * len(requests)
+        cache = self.result_cache if use_cache and output_dir else None
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        # Serve cache hits first, group the rest by (reference, parameters)
+        groups = {}
+        for index, request in enumerate(requests):
+            preset = request.get("preset") or "default"
+            params = request.get("params", {})
+            path = request.get("output") or (os.path.join(output_dir, f"{index:04d}.wav") if output_dir else None)
+            key = self.cache_key(request["text"], preset, request.get("ref"),
+                                 batched=self.batch_size > 1, **params) if cache else None
+            hit = cache.lookup(key) if key else None
+            if hit:
+                shutil.copyfile(hit, path)
+                audio, sampling_rate = sf.read(hit, dtype="float32")
+                results[index] = {"index": index, "text": request["text"], "sample_rate": sampling_rate,
+                                  "audio": audio, "path": path, "cached": True, "seconds": 0.0, "error": None}
+                continue
+            ref, _, merged = self._resolve(preset, request.get("ref"), params)
+            group = json.dumps([ref["path"], ref["text"], ref.get("lang"), self._detect_language(request["text"]),
+                                sorted(merged.items())], ensure_ascii=False)
+            groups.setdefault(group, []).append((index, request, preset, path))
+        
+        pending = sum(len(items) for items in groups.values())
+        print(f"Batch: {len(requests)} requests | {len(requests) - pending} cached | "
+              f"{pending} to synthesize in {len(groups)} reference group(s)")
+        if not pending:
+            return results
+        
+        batched = self.batched_tts()
+        if batched is None:
+            self.init_models()
+        run_size = 4 * self.batch_size if batched else 1
+        writes = []
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            for items in groups.values():
+                for lo in range(0, len(items), run_size):
+                    run = items[lo:lo + run_size]
+                    _, request, preset, _ = run[0]
+                    start = time.perf_counter()
+                    error = "no audio generated"
+                    try:
+                        if batched:
+                            ref, _, merged = self._resolve(preset, request.get("ref"), request.get("params", {}))
+                            audios = batched.synthesize([item[1]["text"] for item in run], ref,
+                                                        self._detect_language(request["text"]), merged)
+                        else:
+                            audios = [self.synthesize_audio(request["text"], preset, ref=request.get("ref"),
+                                                            **request.get("params", {}))]
+                    except Exception as e:
+                        audios, error = [None] * len(run), f"{type(e).__name__}: {e}"
+                    seconds = (time.perf_counter() - start) / len(run)
+                    for (index, request, preset, path), synthesized in zip(run, audios):
+                        if synthesized is None:
+                            print(f"✗ [{index}] {request['text'][:30]}: {error}")
+                            results[index] = {"index": index, "text": request["text"], "sample_rate": None,
+                                              "audio": None, "path": path, "cached": False,
+                                              "seconds": seconds, "error": error}
+                            continue
+                        sampling_rate, audio = synthesized
+                        results[index] = {"index": index, "text": request["text"], "sample_rate": sampling_rate,
+                                          "audio": audio, "path": path, "cached": False,
+                                          "seconds": seconds, "error": None}
+                        if path:
+                            key = self.cache_key(request["text"], preset, request.get("ref"),
+                                                 batched=batched is not None,
+                                                 **request.get("params", {})) if cache else None
+                            writes.append(writer.submit(self._write_result, path, sampling_rate, audio, key,
+                                                        {"text": request["text"], "preset": preset}))
+            for future in writes:
+                future.result()
+        return results
+    
+    def _write_result(self, path, sampling_rate, audio, key=None, meta=None):
+        sf.write(path, audio, sampling_rate)
+        if key:
+            self.result_cache.store(key, path, meta=meta)
     
     def _detect_language(self, text: str) -> str:
         """Simple language detection"""
@@ -213,9 +655,83 @@ class HQSynthesizer:
             return "英文"
 
 
+def load_batch_requests(jsonl_path: str, preset: str = "default", params: dict = None) -> list:
+    """Read one request per line: {"text", "preset"?, "ref"?, "params"?, "output"?} or a bare JSON string"""
+    requests = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if isinstance(request, str):
+                request = {"text": request}
+            request.setdefault("preset", preset)
+            request["params"] = {**(params or {}), **request.get("params", {})}
+            requests.append(request)
+    return requests
+
+
+def throughput_line(label: str, count: int, audio_seconds: float, elapsed: float) -> str:
+    """Utterances/s and audio-seconds/s for a finished run"""
+    elapsed = max(elapsed, 1e-9)
+    return (f"{label}: {count} utterances, {audio_seconds:.1f}s audio in {elapsed:.1f}s | "
+            f"{count / elapsed:.2f} utt/s | {audio_seconds / elapsed:.2f} audio-s/s")
+
+
+def run_batch(synth: HQSynthesizer, requests: list, output_dir: str,
+              use_cache: bool = True, compare_serial: bool = False):
+    """Batch CLI mode: synthesize every request, write a manifest and report throughput"""
+    if compare_serial:
+        # Baseline: today's loop, one synthesize() call per line in input order
+        synth.init_models()
+        serial_dir = os.path.join(output_dir, "serial")
+        os.makedirs(serial_dir, exist_ok=True)
+        start = time.perf_counter()
+        audio_seconds = 0.0
+        for index, request in enumerate(requests):
+            path = synth.synthesize(request["text"], request["preset"],
+                                    output_path=os.path.join(serial_dir, f"{index:04d}.wav"),
+                                    ref=request.get("ref"), use_cache=False, **request["params"])
+            audio_seconds += sf.info(path).duration
+        serial_line = throughput_line("Serial", len(requests), audio_seconds, time.perf_counter() - start)
+        use_cache = False
+    
+    start = time.perf_counter()
+    results = synth.synthesize_batch(requests, output_dir=output_dir, use_cache=use_cache)
+    succeeded = [r for r in results if r["error"] is None]
+    audio_seconds = sum(len(r["audio"]) / r["sample_rate"] for r in succeeded)
+    batch_line = throughput_line("Batch ", len(succeeded), audio_seconds, time.perf_counter() - start)
+    
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        for r in results:
+            duration = round(len(r["audio"]) / r["sample_rate"], 3) if r["error"] is None else None
+            f.write(json.dumps({
+                "index": r["index"], "text": r["text"], "path": r["path"], "cached": r["cached"],
+                "duration": duration, "seconds": round(r["seconds"], 3), "error": r["error"],
+            }, ensure_ascii=False) + "\n")
+    
+    print(f"\n{'='*50}")
+    if compare_serial:
+        print(serial_line)
+    print(batch_line)
+    if len(succeeded) < len(results):
+        print(f"Failed: {len(results) - len(succeeded)} (see manifest)")
+    print(f"Manifest: {manifest_path}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="ATRI High-Quality TTS Synthesizer")
-    parser.add_argument("--text", type=str, required=True, help="Text to synthesize")
+    parser.add_argument("--text", type=str, default=None, help="Text to synthesize")
+    parser.add_argument("--batch", type=str, default=None,
+                        help="JSONL of requests ({\"text\", \"preset\"?, \"ref\"?, \"params\"?, \"output\"?} per line)")
+    parser.add_argument("--output-dir", type=str, default=None, help="Output directory for --batch")
+    parser.add_argument("--compare-serial", action="store_true",
+                        help="With --batch: also run the one-call-per-line loop and compare throughput")
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="With --batch: text fragments decoded together (1 = one utterance at a time)")
+    parser.add_argument("--no-split-bucket", action="store_true",
+                        help="With --batch: do not bucket fragments of similar length into the same batch")
     parser.add_argument("--preset", type=str, default="default", 
                         choices=list(REF_PRESETS.keys()), help="Reference audio preset")
     parser.add_argument("--output", type=str, default=None, help="Output file path")
@@ -225,14 +741,19 @@ def main():
     parser.add_argument("--sample_steps", type=int, default=32, help="CFM sample steps (v3/v4)")
     parser.add_argument("--speed", type=float, default=0.95, help="Speech speed")
     parser.add_argument("--sr", action="store_true", help="Enable super-resolution (v3)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write audio segment by segment and report time-to-first-audio")
+    parser.add_argument("--server", type=str, default=DEFAULT_SERVER,
+                        help="Resident TTS server (http://host:port or unix:///path)")
+    parser.add_argument("--no-server", action="store_true", help="Always synthesize in-process")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the result cache (resample identical requests)")
     
     args = parser.parse_args()
+    if not args.text and not args.batch:
+        parser.error("--text or --batch is required")
     
-    synth = HQSynthesizer()
-    synth.synthesize(
-        text=args.text,
-        ref_preset=args.preset,
-        output_path=args.output,
+    params = dict(
         top_k=args.top_k,
         top_p=args.top_p,
         temperature=args.temperature,
@@ -240,6 +761,49 @@ def main():
         speed=args.speed,
         if_sr=args.sr,
     )
+    
+    synth = HQSynthesizer(use_result_cache=not args.no_cache, batch_size=args.batch_size,
+                          split_bucket=not args.no_split_bucket)
+    
+    if args.batch:
+        # Batch mode always runs in-process (the server handles one request at a time)
+        requests = load_batch_requests(args.batch, args.preset, params)
+        output_dir = args.output_dir or os.path.join(OUTPUT_DIR, f"batch_{time.strftime('%Y%m%d_%H%M%S')}")
+        run_batch(synth, requests, output_dir, use_cache=not args.no_cache,
+                  compare_serial=args.compare_serial)
+        return
+    
+    output_path = args.output or os.path.join(
+        OUTPUT_DIR, f"hq_{args.preset}_{time.strftime('%Y%m%d_%H%M%S')}.wav")
+    
+    # Prefer the resident server (models already loaded); fall back to in-process
+    if not args.no_server:
+        cache = synth.result_cache
+        key = synth.cache_key(args.text, args.preset, stream=args.stream, **params) if cache else None
+        if key and cache.fetch(key, output_path):
+            print(f"\n✓ Cached: {output_path}")
+            print(f"  {cache.stats_line()}")
+            return
+        try:
+            stats = {}
+            synthesize_remote(args.text, preset=args.preset, params=params,
+                              output_path=output_path, server=args.server,
+                              stream=args.stream, stats=stats)
+            if key:
+                cache.store(key, output_path, meta={"text": args.text, "preset": args.preset})
+            print(f"\n✓ Generated via server: {output_path}")
+            print(f"  {stats['summary']}")
+            return
+        except TTSServerUnavailable as e:
+            print(f"TTS server unavailable ({e}), synthesizing in-process")
+    
+    synth.synthesize(
+        text=args.text,
+        ref_preset=args.preset,
+        output_path=output_path,
+        stream=args.stream,
+        **params,
+    )
 
 
 if __name__ == "__main__":